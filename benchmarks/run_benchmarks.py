@@ -0,0 +1,458 @@
+"""
+Pipeline benchmarks on synthetic data.
+
+For every (groups, years) case the generator in syntheticData builds frames
+in the training workbook schema plus a compact model store with one random
+model per group, then each pipeline stage and the end-to-end forecast run
+(PipelineData -> forecasts -> submission CSVs) is timed. Results go to a
+JSON file; --compare prints the ratio against an earlier result file.
+Interpreter start-up (main --help and the forecast-only imports, each in a
+fresh process) is timed as well.
+
+The default grid is 112, 1000 and 10000 groups over 1 and 5 years. Cases
+whose hourly matrix has more than --max-values values are skipped (and
+listed under "skipped" in the results): at the default of 1e8, 10000
+groups x 5 years (4.4e8 values, 3.5 GB per float64 copy) does not fit a
+machine with a few GB of memory.
+
+--global-models compares the pooled global ridge models (globalModel) with
+batched SARIMAX per horizon: fit time, forecast time and holdout accuracy
+(the last 48 hours and the last 12 months, against the weekly and yearly
+seasonal naive forecasts). SARIMAX is fitted on the first
+--global-sarimax-groups groups only, as fitting it on thousands of groups
+takes hours; its per-group fit time is reported for scaling.
+
+    python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py --groups 112 1000 --years 1
+    python benchmarks/run_benchmarks.py --save-baseline
+    python benchmarks/run_benchmarks.py --compare benchmarks/results/baseline.json
+    python benchmarks/run_benchmarks.py --groups 112 5000 --global-models
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import numpy as np
+import pandas as pd
+
+from syntheticData import (
+    SRC_DIR,
+    generate_model_store,
+    generate_monthly_consumption,
+    generate_pipeline_data,
+    generate_templates,
+)
+from backtest import forecast_errors
+from consumptionStore import ConsumptionStore
+from converter import build_submission_48h, build_submission_12m, save_submission_csv
+from dataProcessing import (
+    build_future_exog_48h,
+    prepare_hourly_training,
+    prepare_monthly_training,
+)
+from forecast12Months import forecast_12m
+from forecast48Hours import forecast_48h
+from globalModel import forecast_global_12m, forecast_global_48h, train_global_48h, train_global_12m
+from pipelineData import PipelineData
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+BASELINE_PATH = RESULTS_DIR / "baseline.json"
+STARTUP_COMMANDS = {
+    "main_help": [str(SRC_DIR / "main.py"), "--help"],
+    # before: the modules main.py used to import at module level
+    "main_help_eager_imports": ["-c", (
+        "import forecast48Hours, forecast12Months, batchedSARIMAX, forecastEngine, modelStore, "
+        "converter, dataProcessing, globalModel, loadData, pipelineData, profiling, stageCache"
+    )],
+    "forecast_imports": ["-c", "import main, forecast48Hours, forecast12Months, converter"],
+    # what a fit still pays on first use, for reference
+    "statsmodels_sarimax": ["-c", "from statsmodels.tsa.statespace.sarimax import SARIMAX"],
+}
+DEFAULT_GROUPS = (112, 1000, 10000)
+DEFAULT_YEARS = (1.0, 5.0)
+# groups x hours of the largest case run; one float64 copy is 8 bytes a value
+MAX_VALUES = 100_000_000
+GLOBAL_TRAIN_DAYS = 30
+GLOBAL_TRAIN_MONTHS = 24
+# hourly history is generated for the 48h case; the 12m case needs lags of
+# a year on top of the training months and the holdout year
+GLOBAL_MONTHLY_YEARS = 4.0
+
+
+def _hours(years: float) -> int:
+    """Hours of history generate_pipeline_data builds for years."""
+    return int(round(years * 365 * 24))
+
+
+def _time(func: Callable, repeat: int) -> Dict[str, float]:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return {"median_s": statistics.median(timings), "min_s": min(timings), "repeat": repeat}
+
+
+def _fresh(data: PipelineData) -> PipelineData:
+    """Same frames, no cached derived state, as at the start of a run."""
+    return PipelineData(
+        groups=data.groups,
+        consumption=data.consumption,
+        prices=data.prices.copy(),
+        example_hourly=data.example_hourly,
+        example_monthly=data.example_monthly,
+    )
+
+
+def run_case(
+    n_groups: int,
+    years: float,
+    repeat: int,
+    train_groups: int,
+    verbose: bool = True,
+) -> dict:
+    if verbose:
+        print(f"--- {n_groups} groups, {years} years of hourly data ---")
+    start = time.perf_counter()
+    data = generate_pipeline_data(n_groups, years)
+    generate_seconds = time.perf_counter() - start
+    stages: Dict[str, dict] = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        models_48h, models_12m = tmp / "sarimax_48h", tmp / "sarimax_12m"
+        generate_model_store(models_48h.with_suffix(".npz"), data, "48h")
+        generate_model_store(models_12m.with_suffix(".npz"), data, "12m")
+        fc_48 = forecast_48h(models_dir=models_48h, data=data, verbose=False)
+        fc_12 = forecast_12m(models_dir=models_12m, data=data, verbose=False)
+
+        def end_to_end() -> None:
+            run_data = _fresh(data)
+            fc_48h = forecast_48h(models_dir=models_48h, data=run_data, verbose=False)
+            save_submission_csv(
+                build_submission_48h(fc_48h, template=run_data.example_hourly),
+                tmp / "e2e_48h.csv", verbose=False,
+            )
+            fc_12m = forecast_12m(models_dir=models_12m, data=run_data, verbose=False)
+            save_submission_csv(
+                build_submission_12m(fc_12m, template=run_data.example_monthly),
+                tmp / "e2e_12m.csv", verbose=False,
+            )
+
+        store = ConsumptionStore.from_frame(data.consumption)
+        cases = {
+            "prepare_hourly_training": lambda: prepare_hourly_training(data.consumption, data.prices),
+            "prepare_monthly_training": lambda: prepare_monthly_training(data.consumption),
+            "build_consumption_store": lambda: ConsumptionStore.from_frame(data.consumption),
+            "build_consumption_store_float32": lambda: ConsumptionStore.from_frame(
+                data.consumption, dtype=np.float32
+            ),
+            "prepare_hourly_training_store": lambda: prepare_hourly_training(store, data.prices),
+            # fresh store each time, so the monthly totals are not cached
+            "prepare_monthly_training_store": lambda: prepare_monthly_training(
+                ConsumptionStore.from_frame(data.consumption)
+            ),
+            "build_future_exog_48h": lambda: build_future_exog_48h(
+                prices_df=data.prices, consumption_df=data.consumption
+            ),
+            "forecast_48h": lambda: forecast_48h(models_dir=models_48h, data=data, verbose=False),
+            "forecast_12m": lambda: forecast_12m(models_dir=models_12m, data=data, verbose=False),
+            "forecast_48h_batched": lambda: forecast_48h(
+                models_dir=models_48h, data=data, verbose=False, backend="batched"
+            ),
+            "forecast_12m_batched": lambda: forecast_12m(
+                models_dir=models_12m, data=data, verbose=False, backend="batched"
+            ),
+            "submission_48h": lambda: save_submission_csv(
+                build_submission_48h(fc_48, template=data.example_hourly),
+                tmp / "sub_48h.csv", verbose=False,
+            ),
+            "submission_12m": lambda: save_submission_csv(
+                build_submission_12m(fc_12, template=data.example_monthly),
+                tmp / "sub_12m.csv", verbose=False,
+            ),
+            "end_to_end": end_to_end,
+        }
+        if train_groups:
+            from train48Hours import train_sarimax_48h
+
+            cases[f"train_48h_{train_groups}_groups"] = lambda: train_sarimax_48h(
+                train_days=30, max_groups=train_groups, models_dir=tmp / "train_48h",
+                data=data, verbose=False,
+            )
+            cases[f"train_48h_{train_groups}_groups_batched"] = lambda: train_sarimax_48h(
+                train_days=30, max_groups=train_groups, models_dir=tmp / "train_48h_batched",
+                data=data, verbose=False, backend="batched",
+            )
+        for name, func in cases.items():
+            stages[name] = _time(func, 1 if name.startswith("train") else repeat)
+            if verbose:
+                print(f"{name:<32}{stages[name]['median_s']:>10.4f} s")
+    return {
+        "groups": n_groups,
+        "years": years,
+        "hours": len(data.consumption),
+        "generate_s": generate_seconds,
+        "stages": stages,
+    }
+
+
+def _accuracy(actual: pd.DataFrame, forecast: pd.DataFrame) -> Dict[str, float]:
+    """Mean over groups of the holdout MAE and MAPE."""
+    scores = np.array([
+        forecast_errors(actual[gid].to_numpy(dtype=float), forecast[gid].to_numpy(dtype=float))
+        for gid in forecast.columns
+    ])
+    return {"mae": float(np.nanmean(scores[:, 0])), "mape": float(np.nanmean(scores[:, 1]))}
+
+
+def _holdout(data: PipelineData, monthly: pd.DataFrame | None = None) -> PipelineData:
+    """data without its last 48 hours, or with monthly minus its last 12 months."""
+    if monthly is None:
+        consumption = data.consumption.iloc[:-48]
+        train_end = consumption.index[-1]
+    else:
+        consumption = data.consumption
+        train_end = monthly.index[-12] - pd.Timedelta(hours=1)
+    hourly_df, monthly_df = generate_templates(data.group_ids, train_end=train_end)
+    return PipelineData(
+        groups=data.groups,
+        consumption=consumption,
+        prices=data.prices,
+        example_hourly=hourly_df,
+        example_monthly=monthly_df,
+        monthly_consumption=None if monthly is None else monthly.iloc[:-12],
+        consumption_end=None if monthly is None else train_end,
+    )
+
+
+def _timed(func: Callable):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def run_global_case(n_groups: int, years: float, sarimax_groups: int, verbose: bool = True) -> dict:
+    """
+    Fit time, forecast time and holdout accuracy of the global models and
+    of batched SARIMAX (on the first sarimax_groups groups), per horizon.
+    """
+    from train12Months import train_sarimax_12m
+    from train48Hours import train_sarimax_48h
+
+    if verbose:
+        print(f"--- global models vs SARIMAX, {n_groups} groups ---")
+    data = generate_pipeline_data(n_groups, years)
+    monthly = generate_monthly_consumption(data.group_ids, GLOBAL_MONTHLY_YEARS)
+    sarimax_groups = min(sarimax_groups, n_groups)
+    result = {"groups": n_groups, "years": years, "sarimax_groups": sarimax_groups}
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        for horizon in ("48h", "12m"):
+            if horizon == "48h":
+                train = _holdout(data)
+                actual = data.consumption.iloc[-48:]
+                naive = data.consumption.iloc[-48 - 168:-168].set_axis(actual.index)
+                fit_global = lambda: train_global_48h(
+                    GLOBAL_TRAIN_DAYS, data=train, model_path=tmp / "global_48h.npz", verbose=False
+                )
+                forecast_global = lambda: forecast_global_48h(
+                    data=train, model_path=tmp / "global_48h.npz", verbose=False
+                )
+                fit_sarimax = lambda: train_sarimax_48h(
+                    GLOBAL_TRAIN_DAYS, max_groups=sarimax_groups, models_dir=tmp / "sarimax_48h",
+                    data=train, verbose=False, backend="batched",
+                )
+                forecast_sarimax = lambda: forecast_48h(
+                    models_dir=tmp / "sarimax_48h", max_groups=sarimax_groups, data=train,
+                    verbose=False, backend="batched",
+                )
+            else:
+                train = _holdout(data, monthly)
+                actual = monthly.iloc[-12:]
+                naive = monthly.iloc[-24:-12].set_axis(actual.index)
+                fit_global = lambda: train_global_12m(
+                    GLOBAL_TRAIN_MONTHS, data=train, model_path=tmp / "global_12m.npz", verbose=False
+                )
+                forecast_global = lambda: forecast_global_12m(
+                    data=train, model_path=tmp / "global_12m.npz", verbose=False
+                )
+                fit_sarimax = lambda: train_sarimax_12m(
+                    GLOBAL_TRAIN_MONTHS, max_groups=sarimax_groups, models_dir=tmp / "sarimax_12m",
+                    data=train, verbose=False, backend="batched",
+                )
+                forecast_sarimax = lambda: forecast_12m(
+                    models_dir=tmp / "sarimax_12m", max_groups=sarimax_groups, data=train,
+                    verbose=False, backend="batched",
+                )
+            _, fit_s = _timed(fit_global)
+            forecast, forecast_s = _timed(forecast_global)
+            scores = {
+                "global": {"fit_s": fit_s, "forecast_s": forecast_s, **_accuracy(actual, forecast)},
+                "naive": _accuracy(actual, naive),
+            }
+            if 0 < sarimax_groups < n_groups:
+                # SARIMAX is scored on its subset, so score the others on it too
+                subset = forecast.columns[:sarimax_groups]
+                scores["global_on_sarimax_groups"] = _accuracy(actual, forecast[subset])
+                scores["naive_on_sarimax_groups"] = _accuracy(actual, naive[subset])
+            if sarimax_groups:
+                _, fit_s = _timed(fit_sarimax)
+                forecast, forecast_s = _timed(forecast_sarimax)
+                scores["sarimax"] = {
+                    "fit_s": fit_s,
+                    "fit_s_per_group": fit_s / sarimax_groups,
+                    "forecast_s": forecast_s,
+                    **_accuracy(actual, forecast),
+                }
+            result[horizon] = scores
+            if verbose:
+                for name, score in scores.items():
+                    timing = "".join(
+                        f"{key} {score[key]:.4f} s  " for key in ("fit_s", "forecast_s") if key in score
+                    )
+                    print(f"{horizon} {name:<26}{timing}MAE {score['mae']:.4f}  MAPE {score['mape']:.2f}%")
+    return result
+
+
+def run_startup(repeat: int, verbose: bool = True) -> dict:
+    """Wall time of fresh interpreters running STARTUP_COMMANDS."""
+    env = {**os.environ, "PYTHONPATH": str(SRC_DIR)}
+
+    def _run(args: List[str]) -> str:
+        return subprocess.run(
+            [sys.executable, *args], env=env, check=True, capture_output=True, text=True
+        ).stdout
+
+    if verbose:
+        print("--- interpreter start-up ---")
+    stages: Dict[str, dict] = {}
+    for name, args in STARTUP_COMMANDS.items():
+        stages[name] = _time(lambda: _run(args), repeat)
+        if verbose:
+            print(f"{name:<32}{stages[name]['median_s']:>10.4f} s")
+    loaded = _run(["-c", (
+        "import json, sys, main, forecast48Hours, forecast12Months, converter; "
+        "print(json.dumps(sorted({'statsmodels', 'scipy'} & set(sys.modules))))"
+    )])
+    return {"stages": stages, "forecast_path_loads": json.loads(loaded)}
+
+
+def _environment() -> dict:
+    return {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+    }
+
+
+def compare(current: dict, reference: dict) -> str:
+    ref_cases = {(c["groups"], c["years"]): c for c in reference["cases"]}
+    if "startup" in reference:
+        ref_cases["startup"] = reference["startup"]
+    lines = [f"{'case':<20}{'stage':<32}{'reference s':>12}{'current s':>12}{'ratio':>8}"]
+    for case in current["cases"] + ([current["startup"]] if "startup" in current else []):
+        is_startup = "groups" not in case
+        ref = ref_cases.get("startup" if is_startup else (case["groups"], case["years"]))
+        if ref is None:
+            continue
+        label = "start-up" if is_startup else f"{case['groups']}g x {case['years']}y"
+        for stage, timing in case["stages"].items():
+            if stage not in ref["stages"]:
+                continue
+            before = ref["stages"][stage]["median_s"]
+            after = timing["median_s"]
+            lines.append(
+                f"{label:<20}{stage:<32}{before:>12.4f}{after:>12.4f}"
+                f"{(after / before if before else float('nan')):>8.2f}"
+            )
+    return "\n".join(lines)
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark pipeline stages on synthetic data.")
+    parser.add_argument(
+        "--groups", type=int, nargs="+", default=list(DEFAULT_GROUPS),
+        help="Group counts to benchmark (default: 112 1000 10000).",
+    )
+    parser.add_argument(
+        "--years", type=float, nargs="+", default=list(DEFAULT_YEARS),
+        help="Years of hourly history per case (default: 1 5).",
+    )
+    parser.add_argument(
+        "--max-values", type=float, default=MAX_VALUES,
+        help="Skip cases with more than this many hourly values (groups x hours; "
+             "default: 1e8).",
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="Timed repetitions per stage.")
+    parser.add_argument(
+        "--train-groups", type=int, default=0,
+        help="Also time training SARIMAX on this many groups (slow; default: off).",
+    )
+    parser.add_argument(
+        "--global-models", action="store_true",
+        help="Also compare the pooled global models with batched SARIMAX "
+             "(fit and forecast time, holdout accuracy) for every group count.",
+    )
+    parser.add_argument(
+        "--global-sarimax-groups", type=int, default=112,
+        help="Groups SARIMAX is fitted on in the --global-models comparison "
+             "(default: 112; 0 skips SARIMAX).",
+    )
+    parser.add_argument("--output", type=Path, default=None, help="Result JSON path.")
+    parser.add_argument(
+        "--save-baseline", action="store_true",
+        help=f"Write the results to {BASELINE_PATH.relative_to(RESULTS_DIR.parents[1])}.",
+    )
+    parser.add_argument("--compare", type=Path, default=None, help="Result JSON to compare against.")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = _parse_args()
+    grid = [(n_groups, years) for n_groups in args.groups for years in args.years]
+    skipped = [
+        {"groups": n_groups, "years": years}
+        for n_groups, years in grid if n_groups * _hours(years) > args.max_values
+    ]
+    for case in skipped:
+        print(f"Skipping {case['groups']} groups x {case['years']} years "
+              f"(more than {args.max_values:.0e} values; see --max-values)")
+    cases: List[dict] = [
+        run_case(n_groups, years, args.repeat, args.train_groups)
+        for n_groups, years in grid
+        if {"groups": n_groups, "years": years} not in skipped
+    ]
+    result = {
+        "environment": _environment(),
+        "grid": {"groups": args.groups, "years": args.years, "max_values": args.max_values,
+                 "skipped": skipped},
+        "cases": cases,
+        "startup": run_startup(args.repeat),
+    }
+    if args.global_models:
+        result["global_models"] = [
+            run_global_case(n_groups, args.years[0], args.global_sarimax_groups)
+            for n_groups in args.groups
+        ]
+    output = args.output
+    if output is None:
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        output = BASELINE_PATH if args.save_baseline else RESULTS_DIR / f"bench_{stamp}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(result, indent=2))
+    print(f"\nResults written to: {output}")
+    if args.compare:
+        print()
+        print(compare(result, json.loads(Path(args.compare).read_text())))
@@ -0,0 +1,216 @@
+"""
+Synthetic data in the exact schema of the training workbook and templates,
+at any scale, for benchmarking without the real data.
+
+Frames match what loadData returns (UTC DatetimeIndex named measured_at,
+integer group columns, eur_per_mwh prices, group_id/group_label groups and
+string-column templates). write_training_workbook/write_templates produce
+the files themselves for small scales.
+"""
+from __future__ import annotations
+import sys
+from pathlib import Path
+from typing import Iterable, Tuple
+import numpy as np
+import pandas as pd
+
+SRC_DIR = Path(__file__).resolve().parents[1] / "src"
+if str(SRC_DIR) not in sys.path:
+    sys.path.insert(0, str(SRC_DIR))
+
+from modelStore import CompactSARIMAX, save_model_store  # noqa: E402
+from pipelineData import PipelineData  # noqa: E402
+
+MACRO_REGIONS = ["Southern Finland", "Western Finland", "Eastern Finland", "Northern Finland"]
+SEGMENTS = ["Private", "Enterprise"]
+PRODUCT_TYPES = ["Spot Price", "Fixed Price", "Hybrid"]
+BUCKETS = ["Low", "Medium", "High"]
+TRAIN_END = pd.Timestamp("2024-09-30 23:00", tz="UTC")
+
+
+def generate_groups(n_groups: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    group_ids = np.arange(1, n_groups + 1) * 7 + 21  # sparse ids like the real data
+    labels = [
+        " | ".join([
+            MACRO_REGIONS[rng.integers(len(MACRO_REGIONS))],
+            f"County {rng.integers(20)}",
+            f"Municipality {rng.integers(200)}",
+            SEGMENTS[rng.integers(len(SEGMENTS))],
+            PRODUCT_TYPES[rng.integers(len(PRODUCT_TYPES))],
+            BUCKETS[rng.integers(len(BUCKETS))],
+        ])
+        for _ in range(n_groups)
+    ]
+    return pd.DataFrame({"group_id": group_ids.astype(int), "group_label": labels})
+
+
+def generate_training_frames(
+    n_groups: int = 112,
+    years: float = 1.0,
+    seed: int = 0,
+    train_end: pd.Timestamp = TRAIN_END,
+) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """(groups_df, consumption_df, prices_df) as load_all_training_data returns them."""
+    rng = np.random.default_rng(seed)
+    groups_df = generate_groups(n_groups, seed)
+    n_hours = int(round(years * 365 * 24))
+    index = pd.date_range(end=train_end, periods=n_hours, freq="h", name="measured_at")
+    hour = index.hour.to_numpy()
+    weekend = index.dayofweek.to_numpy() >= 5
+    day_of_year = index.dayofyear.to_numpy()
+    profile = (
+        (1.0 + 0.3 * np.sin(2 * np.pi * (hour - 6) / 24))
+        * np.where(weekend, 0.9, 1.0)
+        * (1.0 + 0.3 * np.cos(2 * np.pi * day_of_year / 365))
+    )
+    scale = rng.uniform(0.1, 5.0, size=n_groups)
+    values = np.outer(profile, scale)
+    values *= 1.0 + 0.05 * rng.standard_normal(values.shape)
+    consumption_df = pd.DataFrame(values, index=index, columns=groups_df["group_id"].tolist())
+    price = 50 + 20 * np.sin(2 * np.pi * hour / 24) + 5 * rng.standard_normal(n_hours)
+    prices_df = pd.DataFrame({"eur_per_mwh": price}, index=index)
+    return groups_df, consumption_df, prices_df
+
+
+def generate_monthly_consumption(
+    group_ids: Iterable,
+    years: float = 4.0,
+    seed: int = 0,
+    chunk_groups: int = 500,
+    train_end: pd.Timestamp = TRAIN_END,
+) -> pd.DataFrame:
+    """
+    Monthly totals of years of synthetic hourly consumption, generated a
+    chunk of groups at a time so long histories of many groups fit in memory.
+    """
+    group_ids = list(group_ids)
+    chunks = []
+    for i, start in enumerate(range(0, len(group_ids), chunk_groups)):
+        ids = group_ids[start:start + chunk_groups]
+        _, consumption_df, _ = generate_training_frames(len(ids), years, seed + i, train_end)
+        consumption_df.columns = ids
+        chunks.append(consumption_df.resample("MS").sum())
+    return pd.concat(chunks, axis=1)
+
+
+def generate_templates(
+    group_ids: Iterable,
+    train_end: pd.Timestamp = TRAIN_END,
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Hourly (48h) and monthly (12m) templates following train_end."""
+    columns = [str(gid) for gid in group_ids]
+    hourly_index = pd.date_range(train_end + pd.Timedelta(hours=1), periods=48, freq="h", name="measured_at")
+    month_start = (train_end + pd.Timedelta(hours=1)).normalize().replace(day=1)
+    if month_start <= train_end:
+        month_start = month_start + pd.offsets.MonthBegin(1)
+    monthly_index = pd.date_range(month_start, periods=12, freq="MS", name="measured_at")
+    hourly_df = pd.DataFrame(0.0, index=hourly_index, columns=columns)
+    monthly_df = pd.DataFrame(0.0, index=monthly_index, columns=columns)
+    return hourly_df, monthly_df
+
+
+def generate_pipeline_data(n_groups: int = 112, years: float = 1.0, seed: int = 0) -> PipelineData:
+    groups_df, consumption_df, prices_df = generate_training_frames(n_groups, years, seed)
+    hourly_df, monthly_df = generate_templates(consumption_df.columns)
+    return PipelineData(
+        groups=groups_df,
+        consumption=consumption_df,
+        prices=prices_df,
+        example_hourly=hourly_df,
+        example_monthly=monthly_df,
+    )
+
+
+def _arma_state_space(ar: np.ndarray, ma: np.ndarray):
+    """
+    Harvey representation of an ARMA process given its lag polynomials
+    (ar = [1, -phi_1, ...], ma = [1, theta_1, ...]), the form SARIMAX uses.
+    """
+    k = max(len(ar) - 1, len(ma))
+    phi = np.zeros(k)
+    phi[: len(ar) - 1] = -ar[1:]
+    theta = np.zeros(k)
+    theta[0] = 1.0
+    theta[1: len(ma)] = ma[1:]
+    transition = np.zeros((k, k))
+    transition[:, 0] = phi
+    transition[:-1, 1:] = np.eye(k - 1)
+    design = np.zeros(k)
+    design[0] = 1.0
+    return design, transition, theta.reshape(k, 1)
+
+
+def synthetic_compact_model(
+    rng: np.random.Generator,
+    exog_names: list,
+    seasonal_period: int,
+    level: float,
+) -> CompactSARIMAX:
+    """A stable SARIMAX(1,0,1)(1,0,1,s) with random parameters."""
+    phi, theta = rng.uniform(0.2, 0.8), rng.uniform(-0.3, 0.3)
+    seasonal_phi, seasonal_theta = rng.uniform(0.3, 0.9), rng.uniform(-0.3, 0.3)
+    ar = np.convolve([1.0, -phi], np.r_[1.0, np.zeros(seasonal_period - 1), -seasonal_phi])
+    ma = np.convolve([1.0, theta], np.r_[1.0, np.zeros(seasonal_period - 1), seasonal_theta])
+    design, transition, selection = _arma_state_space(ar, ma)
+    k = len(design)
+    sigma2 = (0.05 * level) ** 2
+    beta = rng.normal(0.0, 0.01 * level, size=len(exog_names))
+    param_names = list(exog_names) + ["ar.L1", "ma.L1", f"ar.S.L{seasonal_period}", f"ma.S.L{seasonal_period}", "sigma2"]
+    return CompactSARIMAX(
+        order=(1, 0, 1),
+        seasonal_order=(1, 0, 1, seasonal_period),
+        param_names=param_names,
+        exog_names=list(exog_names),
+        params=np.r_[beta, phi, theta, seasonal_phi, seasonal_theta, sigma2],
+        design=design,
+        obs_cov=0.0,
+        transition=transition,
+        state_intercept=np.zeros(k),
+        selection=selection,
+        state_cov=np.array([[sigma2]]),
+        predicted_state=rng.normal(0.0, 0.1 * level, size=k),
+        predicted_state_cov=np.eye(k) * sigma2,
+        residual_bias=0.0,
+        nobs=0,
+    )
+
+
+def generate_model_store(
+    path: Path | str,
+    data: PipelineData,
+    horizon: str = "48h",
+    seed: int = 0,
+) -> Path:
+    """Write a compact store with one random, stable model per group."""
+    rng = np.random.default_rng(seed)
+    if horizon == "48h":
+        exog_names, period = list(data.exog_future_48h.columns), 24
+        levels = data.consumption.mean().to_numpy()
+    else:
+        exog_names, period = list(data.exog_future_12m.columns), 12
+        levels = data.monthly_training[0].mean().to_numpy()
+    models = {
+        gid: synthetic_compact_model(rng, exog_names, period, float(level))
+        for gid, level in zip(data.group_ids, levels)
+    }
+    return save_model_store(models, path, merge=False)
+
+
+def write_training_workbook(path: Path | str, data: PipelineData) -> Path:
+    """The training workbook with its three sheets (needs openpyxl; small scales only)."""
+    path = Path(path)
+    with pd.ExcelWriter(path) as writer:
+        data.groups.to_excel(writer, sheet_name="groups", index=False)
+        for sheet, frame in (("training_consumption", data.consumption), ("training_prices", data.prices)):
+            raw = frame.reset_index()
+            raw["measured_at"] = raw["measured_at"].dt.tz_localize(None)
+            raw.to_excel(writer, sheet_name=sheet, index=False)
+    return path
+
+
+def write_templates(hourly_path: Path | str, monthly_path: Path | str, data: PipelineData) -> None:
+    for template, path in ((data.example_hourly, hourly_path), (data.example_monthly, monthly_path)):
+        out = template.copy()
+        out.insert(0, "measured_at", template.index.strftime("%Y-%m-%dT%H:%M:%S.000Z"))
+        out.to_csv(path, sep=";", decimal=",", index=False)
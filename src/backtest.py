@@ -0,0 +1,289 @@
+"""
+Rolling-origin backtest for the 48h and 12m models.
+
+The stored compact models are not refitted per origin. Each group is
+filtered once over its history with the fitted parameters, and the
+predicted state is recorded at every origin (stateSpace.filter_states_at).
+The horizon is then forecast from each recorded state and scored against
+the actuals and a seasonal naive baseline:
+- 48h: the same hour one week earlier (build_weekly_baseline_48h)
+- 12m: the same month one year earlier
+
+Groups are spread over a process pool. Per-origin rows are appended to a
+CSV as each group finishes, so the run does not keep forecasts in memory.
+Exog over the history uses the realised prices.
+
+    python src/backtest.py --horizon 48h --origins 200 --step 24 --workers 4
+"""
+from __future__ import annotations
+import argparse
+import csv
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, Optional
+import numpy as np
+import pandas as pd
+from dataProcessing import VARIANTS_48H
+from modelStore import CompactSARIMAX, load_model_store, model_store_path
+from parallel import attach_array, share_array
+from pipelineData import PipelineData
+from stateSpace import filter_states_at, forecast_moments
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+DATA_DIR = PROJECT_ROOT / "Data"
+MODELS_DIR = DATA_DIR / "models"
+BACKTEST_DIR = DATA_DIR / "backtests"
+
+HORIZONS = {
+    # horizon -> (steps, seasonal lag of the naive baseline, models dir name)
+    "48h": (48, 168, "sarimax_48h"),
+    "12m": (12, 12, "sarimax_12m"),
+}
+DIFFUSE_VARIANCE = 1e6
+RESULT_COLUMNS = ["origin", "group_id", "mae", "mape", "baseline_mae", "baseline_mape"]
+
+_WORKER_STATE: dict = {}
+
+
+def _init_worker(y_spec: tuple, exog_spec: tuple, exog_columns) -> None:
+    y_shm, y_values = attach_array(y_spec)
+    exog_shm, exog_values = attach_array(exog_spec)
+    _WORKER_STATE.update(
+        blocks=[y_shm, exog_shm],
+        y=y_values,
+        exog=exog_values,
+        exog_columns=list(exog_columns),
+    )
+
+
+def forecast_errors(actual: np.ndarray, predicted: np.ndarray) -> tuple:
+    """(MAE, MAPE in %) of predicted; the MAPE skips zero actuals."""
+    err = np.abs(actual - predicted)
+    nonzero = actual != 0
+    mape = 100.0 * np.mean(err[nonzero] / np.abs(actual[nonzero])) if nonzero.any() else np.nan
+    return float(np.mean(err)), float(mape)
+
+
+def _backtest_group(
+    col: int,
+    model: CompactSARIMAX,
+    origins: np.ndarray,
+    steps: int,
+    season_lag: int,
+    warmup: int,
+    residual: bool = False,
+) -> np.ndarray:
+    """
+    (n_origins, 4) array of mae, mape, baseline_mae, baseline_mape. With
+    residual=True the model forecasts the residual over the seasonal naive
+    baseline and is scored as baseline + residual forecast.
+    """
+    y = _WORKER_STATE["y"][:, col]
+    target = y
+    if residual:
+        target = np.full_like(y, np.nan)
+        target[season_lag:] = y[season_lag:] - y[:-season_lag]
+    exog_cols = [_WORKER_STATE["exog_columns"].index(name) for name in model.exog_names]
+    obs_intercept = (
+        _WORKER_STATE["exog"][:, exog_cols] @ model.beta
+        if exog_cols else np.zeros(len(y))
+    )
+    # start from a diffuse state far enough before the first origin to settle
+    start = max(int(origins[0]) - warmup, 0)
+    k = len(model.predicted_state)
+    states, covs = filter_states_at(
+        model.design,
+        model.obs_cov,
+        model.transition,
+        model.state_intercept,
+        model.selection,
+        model.state_cov,
+        np.zeros(k),
+        np.eye(k) * DIFFUSE_VARIANCE,
+        target[start:],
+        obs_intercept[start:],
+        origins - start,
+    )
+    scores = np.empty((len(origins), 4))
+    for i, origin in enumerate(origins):
+        mean, _ = forecast_moments(
+            model.design,
+            model.obs_cov,
+            model.transition,
+            model.state_intercept,
+            model.selection,
+            model.state_cov,
+            states[i],
+            covs[i],
+            obs_intercept[origin:origin + steps],
+        )
+        actual = y[origin:origin + steps]
+        baseline = y[origin - season_lag:origin - season_lag + steps]
+        predicted = mean + model.residual_bias
+        if residual:
+            predicted = predicted + baseline
+        scores[i, :2] = forecast_errors(actual, predicted)
+        scores[i, 2:] = forecast_errors(actual, baseline)
+    return scores
+
+
+def _backtest_task(gid, col, model, origins, steps, season_lag, warmup, residual):
+    return gid, _backtest_group(col, model, origins, steps, season_lag, warmup, residual)
+
+
+def rolling_origins(
+    n_obs: int,
+    steps: int,
+    season_lag: int,
+    n_origins: int,
+    step: int,
+    warmup: int,
+) -> np.ndarray:
+    """
+    Up to n_origins row positions, step rows apart and in time order. The
+    last one still has a full horizon of actuals after it; the first one
+    has warmup rows and the baseline's seasonal lag before it.
+    """
+    last = n_obs - steps
+    first = max(warmup, season_lag)
+    origins = np.arange(last, first - 1, -step)[:n_origins][::-1]
+    if not len(origins):
+        raise ValueError("Not enough history for a single backtest origin")
+    return origins
+
+
+def run_backtest(
+    horizon: str = "48h",
+    n_origins: int = 100,
+    step: Optional[int] = None,
+    warmup: Optional[int] = None,
+    max_groups: Optional[int] = None,
+    workers: int = 1,
+    models_dir: Path | None = None,
+    output_path: Path | None = None,
+    data: PipelineData | None = None,
+    verbose: bool = True,
+    variant: str = "sarimax",
+) -> pd.DataFrame:
+    """
+    Backtest one horizon and stream per-origin scores to output_path.
+    Returns the per-group means of the scores (small, one row per group).
+    variant="residual" backtests the 48h baseline-plus-residual models.
+    """
+    steps, season_lag, dir_name = HORIZONS[horizon]
+    residual = variant == "residual"
+    if residual:
+        if horizon != "48h":
+            raise ValueError("The residual variant only exists for the 48h horizon")
+        dir_name = f"{dir_name}_residual"
+    if step is None:
+        step = 24 if horizon == "48h" else 1
+    if warmup is None:
+        warmup = 14 * 24 if horizon == "48h" else 12
+    if models_dir is None:
+        models_dir = MODELS_DIR / dir_name
+    if output_path is None:
+        suffix = "_residual" if residual else ""
+        output_path = BACKTEST_DIR / f"backtest_{horizon}{suffix}.csv"
+    output_path = Path(output_path)
+    if data is None:
+        data = PipelineData.load()
+    cons, exog = data.hourly_training if horizon == "48h" else data.monthly_training
+
+    group_ids = list(cons.columns)
+    if max_groups is not None:
+        group_ids = group_ids[:max_groups]
+    models = load_model_store(model_store_path(models_dir), group_ids)
+    origins = rolling_origins(len(cons), steps, season_lag, n_origins, step, warmup)
+    origin_times = cons.index[origins]
+    columns = {gid: i for i, gid in enumerate(cons.columns)}
+    if verbose:
+        print(f"Backtesting {len(models)} groups over {len(origins)} origins "
+              f"({origin_times[0]} -> {origin_times[-1]}), horizon {steps} steps")
+
+    y_values = cons.to_numpy(dtype=float)
+    exog_values = exog.to_numpy(dtype=float)
+    summary: Dict[object, np.ndarray] = {}
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(RESULT_COLUMNS)
+
+        def _write(gid, scores: np.ndarray) -> None:
+            for origin_time, row in zip(origin_times, scores):
+                writer.writerow([origin_time.isoformat(), gid, *row])
+            f.flush()
+            summary[gid] = np.nanmean(scores, axis=0)
+
+        if workers <= 1:
+            _WORKER_STATE.update(y=y_values, exog=exog_values, exog_columns=list(exog.columns))
+            for idx, (gid, model) in enumerate(models.items(), start=1):
+                _write(gid, _backtest_group(columns[gid], model, origins, steps, season_lag, warmup, residual))
+                if verbose:
+                    print(f"[{idx}/{len(models)}] Backtested group {gid}")
+        else:
+            y_shm, y_spec = share_array(y_values)
+            exog_shm, exog_spec = share_array(exog_values)
+            try:
+                with ProcessPoolExecutor(
+                    max_workers=workers,
+                    initializer=_init_worker,
+                    initargs=(y_spec, exog_spec, list(exog.columns)),
+                ) as pool:
+                    futures = [
+                        pool.submit(
+                            _backtest_task, gid, columns[gid], model, origins,
+                            steps, season_lag, warmup, residual,
+                        )
+                        for gid, model in models.items()
+                    ]
+                    for idx, future in enumerate(as_completed(futures), start=1):
+                        gid, scores = future.result()
+                        _write(gid, scores)
+                        if verbose:
+                            print(f"[{idx}/{len(models)}] Backtested group {gid}")
+            finally:
+                for shm in (y_shm, exog_shm):
+                    shm.close()
+                    shm.unlink()
+
+    result = pd.DataFrame.from_dict(summary, orient="index", columns=RESULT_COLUMNS[2:])
+    result = result.reindex([gid for gid in group_ids if gid in summary])
+    result.index.name = "group_id"
+    if verbose:
+        print(f"Per-origin results written to: {output_path}")
+        print(f"Mean MAE  {result['mae'].mean():.4f} (baseline {result['baseline_mae'].mean():.4f})")
+        print(f"Mean MAPE {result['mape'].mean():.2f}% (baseline {result['baseline_mape'].mean():.2f}%)")
+    return result
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Rolling-origin backtest of the stored compact models."
+    )
+    parser.add_argument("--horizon", choices=sorted(HORIZONS), default="48h")
+    parser.add_argument("--variant", choices=VARIANTS_48H, default="sarimax")
+    parser.add_argument(
+        "--origins", type=int, default=100,
+        help="Number of forecast origins, counted back from the end of the data.",
+    )
+    parser.add_argument(
+        "--step", type=int, default=None,
+        help="Rows between origins (default: 24 hours for 48h, 1 month for 12m).",
+    )
+    parser.add_argument("--max-groups", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--output", type=Path, default=None)
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = _parse_args()
+    run_backtest(
+        horizon=args.horizon,
+        n_origins=args.origins,
+        step=args.step,
+        max_groups=args.max_groups,
+        workers=args.workers,
+        output_path=args.output,
+        variant=args.variant,
+    )
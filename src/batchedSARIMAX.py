@@ -0,0 +1,620 @@
+"""
+Vectorized multi-group SARIMAX backend (--backend batched).
+
+Instead of one statsmodels SARIMAX object per group, all groups of a horizon
+are fitted and forecast together: the state space system of every group is
+stacked along a leading group axis and the Kalman filter / forecast
+recursions run once over the (groups x states) arrays (see the *_batch
+functions in stateSpace), with per-group parameters.
+
+Fitting maximises the exact Gaussian loglikelihood, as statsmodels does,
+but with the scale and the regression coefficients profiled out: for given
+ARMA parameters the innovations are linear in the data, so filtering
+consumption and the exog columns through the same recursion gives the GLS
+coefficients in closed form, and only the ARMA parameters are searched.
+Each group runs its own BFGS iteration, but the losses and
+finite-difference gradients of all groups that are still iterating are
+evaluated as one stacked batch. Start values come from a cheap conditional
+sum of squares fit. AR and MA polynomials are kept
+stationary/invertible with the transformation statsmodels uses.
+
+The result is a regular CompactSARIMAX per group, so the model store,
+updates, backtests and the per-group forecast path work unchanged.
+"""
+from __future__ import annotations
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+from modelStore import CompactSARIMAX, model_store_path, save_model_store
+from pipelineOptions import BACKENDS
+from stateSpace import (
+    chandrasekhar_batch,
+    filter_loglike_batch,
+    forecast_moments_batch,
+    stationary_state_cov_batch,
+)
+
+# css-mle: conditional sum of squares for start values, then the exact
+# likelihood. css alone is much cheaper but tends to drift towards seasonal
+# unit roots on short hourly windows.
+FIT_METHODS = ("css-mle", "mle", "css")
+CSS_MAXITER = 50
+FINITE_DIFF_STEP = 1e-6
+MIN_SCALE = 1e-12
+# rows (group x finite-difference perturbation) filtered per chunk
+BATCH_ROWS = 1024
+
+
+def sarimax_param_names(
+    exog_names: List[str],
+    order: tuple,
+    seasonal_order: tuple,
+) -> List[str]:
+    p, _, q = order
+    P, _, Q, s = seasonal_order
+    return (
+        list(exog_names)
+        + [f"ar.L{i}" for i in range(1, p + 1)]
+        + [f"ma.L{i}" for i in range(1, q + 1)]
+        + [f"ar.S.L{i * s}" for i in range(1, P + 1)]
+        + [f"ma.S.L{i * s}" for i in range(1, Q + 1)]
+        + ["sigma2"]
+    )
+
+
+def _constrain(unconstrained: np.ndarray) -> np.ndarray:
+    """
+    Map (G, n) unconstrained values to the coefficients of stationary lag
+    polynomials 1 - c_1 L - ... - c_n L^n (Monahan/Jones, via partial
+    autocorrelations; statsmodels' constrain_stationary_univariate).
+    """
+    n_groups, n = unconstrained.shape
+    r = unconstrained / np.sqrt(1.0 + unconstrained ** 2)
+    y = np.zeros((n_groups, n, n))
+    for k in range(n):
+        for i in range(k):
+            y[:, k, i] = y[:, k - 1, i] + r[:, k] * y[:, k - 1, k - i - 1]
+        y[:, k, k] = r[:, k]
+    return -y[:, n - 1, :] if n else unconstrained.copy()
+
+
+def _unconstrain(constrained: np.ndarray) -> np.ndarray:
+    """Inverse of _constrain; NaN where the polynomial is not stationary."""
+    n_groups, n = constrained.shape
+    if not n:
+        return constrained.copy()
+    y = np.zeros((n_groups, n, n))
+    y[:, n - 1, :] = -constrained
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for k in range(n - 1, 0, -1):
+            for i in range(k):
+                y[:, k - 1, i] = (
+                    (y[:, k, i] - y[:, k, k] * y[:, k, k - i - 1]) / (1.0 - y[:, k, k] ** 2)
+                )
+        r = np.diagonal(y, axis1=1, axis2=2)
+        out = r / np.sqrt(1.0 - r ** 2)
+    return np.where(np.isfinite(out), out, np.nan)
+
+
+def _lag_polynomial(coefs: np.ndarray, period: int, sign: float) -> np.ndarray:
+    """(G, n) coefficients -> (G, n*period + 1) lag polynomial 1 + sign*c_i L^(i*period)."""
+    n_groups, n = coefs.shape
+    poly = np.zeros((n_groups, n * period + 1))
+    poly[:, 0] = 1.0
+    for i in range(n):
+        poly[:, (i + 1) * period] = sign * coefs[:, i]
+    return poly
+
+
+def _multiply(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Row-wise product of two batches of polynomials."""
+    out = np.zeros((a.shape[0], a.shape[1] + b.shape[1] - 1))
+    for j in np.flatnonzero(np.any(b != 0, axis=0)):
+        out[:, j:j + a.shape[1]] += a * b[:, j:j + 1]
+    return out
+
+
+def sarimax_system(
+    ar_poly: np.ndarray,
+    ma_poly: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Stacked design (G, k), transition (G, k, k) and selection (G, k, 1) of
+    ARMA processes with the given (reduced) lag polynomials, in the Harvey
+    representation statsmodels' SARIMAX uses.
+    """
+    n_groups = ar_poly.shape[0]
+    k = max(ar_poly.shape[1] - 1, ma_poly.shape[1], 1)
+    design = np.zeros((n_groups, k))
+    design[:, 0] = 1.0
+    transition = np.zeros((n_groups, k, k))
+    transition[:, : ar_poly.shape[1] - 1, 0] = -ar_poly[:, 1:]
+    transition[:, np.arange(k - 1), np.arange(1, k)] = 1.0
+    selection = np.zeros((n_groups, k, 1))
+    selection[:, : ma_poly.shape[1], 0] = ma_poly
+    return design, transition, selection
+
+
+class _Spec:
+    """Layout of the searched (unconstrained ARMA) parameters of one batched fit."""
+
+    def __init__(self, order: tuple, seasonal_order: tuple) -> None:
+        p, d, q = order
+        P, D, Q, s = seasonal_order
+        if d or D:
+            raise ValueError("The batched backend supports stationary models only (d = D = 0)")
+        self.sizes = {"ar": p, "ma": q, "seasonal_ar": P, "seasonal_ma": Q}
+        self.slices = {}
+        start = 0
+        for name, size in self.sizes.items():
+            self.slices[name] = slice(start, start + size)
+            start += size
+        self.n_params = start
+        self.period = s
+
+    def split(self, x: np.ndarray) -> Dict[str, np.ndarray]:
+        """Unconstrained (G, n_params) -> constrained coefficients per polynomial."""
+        return {
+            "ar": _constrain(x[:, self.slices["ar"]]),
+            "ma": -_constrain(x[:, self.slices["ma"]]),
+            "seasonal_ar": _constrain(x[:, self.slices["seasonal_ar"]]),
+            "seasonal_ma": -_constrain(x[:, self.slices["seasonal_ma"]]),
+        }
+
+    def join(self, coefs: Dict[str, np.ndarray]) -> np.ndarray:
+        n_groups = len(next(iter(coefs.values())))
+        x = np.empty((n_groups, self.n_params))
+        x[:, self.slices["ar"]] = _unconstrain(coefs["ar"])
+        x[:, self.slices["ma"]] = _unconstrain(-coefs["ma"])
+        x[:, self.slices["seasonal_ar"]] = _unconstrain(coefs["seasonal_ar"])
+        x[:, self.slices["seasonal_ma"]] = _unconstrain(-coefs["seasonal_ma"])
+        return x
+
+    def polynomials(self, coefs: Dict[str, np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+        """Reduced AR and MA lag polynomials (seasonal times non-seasonal)."""
+        ar_poly = _multiply(
+            _lag_polynomial(coefs["ar"], 1, -1.0),
+            _lag_polynomial(coefs["seasonal_ar"], self.period, -1.0),
+        )
+        ma_poly = _multiply(
+            _lag_polynomial(coefs["ma"], 1, 1.0),
+            _lag_polynomial(coefs["seasonal_ma"], self.period, 1.0),
+        )
+        return ar_poly, ma_poly
+
+
+def _profile(cross: np.ndarray, nobs: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Regression coefficients (G, m) and innovation variance (G,) that
+    minimise the weighted sum of squares, from the cross products of the
+    filtered [endog, exog] series (endog first).
+    """
+    s_xx = cross[:, 1:, 1:]
+    s_xy = cross[:, 1:, 0]
+    if not s_xy.shape[1]:
+        return s_xy, np.maximum(cross[:, 0, 0] / nobs, MIN_SCALE)
+    # parameters far out in the tails can overflow the filter
+    finite = np.all(np.isfinite(cross), axis=(1, 2))
+    beta = np.full(s_xy.shape, np.nan)
+    beta[finite] = (np.linalg.pinv(s_xx[finite]) @ s_xy[finite, :, None])[:, :, 0]
+    ssr = cross[:, 0, 0] - np.einsum("gm,gm->g", s_xy, beta)
+    return beta, np.maximum(ssr / nobs, MIN_SCALE)
+
+
+def _neg_loglike(spec: _Spec, x: np.ndarray, y: np.ndarray, exog: np.ndarray) -> np.ndarray:
+    """Per-group negative profile loglikelihood, divided by nobs."""
+    n_obs = y.shape[1]
+    ar_poly, ma_poly = spec.polynomials(spec.split(x))
+    design, transition, selection = sarimax_system(ar_poly, ma_poly)
+    state_cov_0 = stationary_state_cov_batch(transition, selection @ selection.transpose(0, 2, 1))
+    _, _, cross, log_var = chandrasekhar_batch(
+        design, np.zeros(len(x)), transition, state_cov_0, y, exog,
+    )
+    _, scale = _profile(cross, n_obs)
+    return 0.5 * (np.log(2 * np.pi) + np.log(scale) + 1.0) + 0.5 * log_var / n_obs
+
+
+def _css_loss(spec: _Spec, x: np.ndarray, y: np.ndarray, exog: np.ndarray) -> np.ndarray:
+    """
+    Per-group conditional sum of squares loss, 0.5 * log(mean e_t**2), with
+    the innovations e_t computed from the ARMA recursion conditional on the
+    first (AR order) observations and zero pre-sample innovations, and the
+    regression profiled out like in _neg_loglike. One step of the recursion
+    is a few (groups, 1 + m) array operations.
+    """
+    n_groups, n_obs = y.shape
+    ar_poly, ma_poly = spec.polynomials(spec.split(x))
+    ar_lags = [lag for lag in range(1, ar_poly.shape[1]) if np.any(ar_poly[:, lag])]
+    ma_lags = [lag for lag in range(1, ma_poly.shape[1]) if np.any(ma_poly[:, lag])]
+    start = ar_poly.shape[1] - 1
+    history = max(ma_lags, default=0) + 1
+    n_series = 1 + exog.shape[1]
+    # ring buffer of the last innovations of endog and every exog column
+    e = np.zeros((n_groups, history, n_series))
+    cross = np.zeros((n_groups, n_series, n_series))
+
+    def _series(t: int) -> np.ndarray:
+        return np.concatenate([y[:, t, None], np.broadcast_to(exog[t], (n_groups, n_series - 1))], axis=1)
+
+    for t in range(start, n_obs):
+        u = _series(t)
+        for lag in ar_lags:
+            u = u + ar_poly[:, lag, None] * _series(t - lag)
+        step = t - start
+        for lag in ma_lags:
+            if lag > step:
+                break
+            u = u - ma_poly[:, lag, None] * e[:, (step - lag) % history]
+        e[:, step % history] = u
+        cross += u[:, :, None] * u[:, None, :]
+    _, scale = _profile(cross, max(n_obs - start, 1))
+    return 0.5 * np.log(scale)
+
+
+def _start_params(spec: _Spec, y: np.ndarray, exog: np.ndarray) -> np.ndarray:
+    """
+    Lag-1 and seasonal-lag autocorrelations of the OLS residuals for the
+    first AR terms, zero for the rest.
+    """
+    n_groups = y.shape[0]
+    if exog.shape[1]:
+        beta = np.linalg.lstsq(exog, y.T, rcond=None)[0].T
+        resid = y - beta @ exog.T
+    else:
+        resid = y - y.mean(axis=1, keepdims=True)
+    denom = np.sum(resid * resid, axis=1)
+
+    def _autocorr(lag: int) -> np.ndarray:
+        if lag <= 0 or lag >= resid.shape[1]:
+            return np.zeros(n_groups)
+        num = np.sum(resid[:, lag:] * resid[:, :-lag], axis=1)
+        return np.clip(num / np.where(denom > 0, denom, 1.0), -0.9, 0.9)
+
+    coefs = {name: np.zeros((n_groups, size)) for name, size in spec.sizes.items()}
+    if spec.sizes["ar"]:
+        coefs["ar"][:, 0] = 0.5 * _autocorr(1)
+    if spec.sizes["seasonal_ar"]:
+        coefs["seasonal_ar"][:, 0] = 0.5 * _autocorr(spec.period)
+    return spec.join(coefs)
+
+
+def _evaluate(
+    loss: Callable,
+    spec: _Spec,
+    x: np.ndarray,
+    groups: np.ndarray,
+    y: np.ndarray,
+    exog: np.ndarray,
+) -> np.ndarray:
+    """loss for parameter rows x, row i belonging to group groups[i], in bounded chunks."""
+    values = np.empty(len(x))
+    for start in range(0, len(x), BATCH_ROWS):
+        chunk = slice(start, start + BATCH_ROWS)
+        values[chunk] = loss(spec, x[chunk], y[groups[chunk]], exog)
+    return values
+
+
+def _value_and_grad(
+    loss: Callable,
+    spec: _Spec,
+    x: np.ndarray,
+    groups: np.ndarray,
+    y: np.ndarray,
+    exog: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Losses and forward-difference gradients of the given groups. The base
+    points and all perturbations are evaluated as one stacked batch.
+    """
+    n_rows, n_params = x.shape
+    steps = FINITE_DIFF_STEP * np.maximum(np.abs(x), 1.0)
+    shifted = np.repeat(x[None], n_params + 1, axis=0)
+    for j in range(n_params):
+        shifted[j + 1, :, j] += steps[:, j]
+    values = _evaluate(
+        loss, spec, shifted.reshape(-1, n_params), np.tile(groups, n_params + 1), y, exog,
+    ).reshape(n_params + 1, n_rows)
+    return values[0], ((values[1:] - values[0]) / steps.T).T
+
+
+def _minimize(
+    loss: Callable,
+    spec: _Spec,
+    x0: np.ndarray,
+    y: np.ndarray,
+    exog: np.ndarray,
+    maxiter: int,
+    gtol: float = 1e-5,
+    ftol: float = 1e-9,
+) -> np.ndarray:
+    """
+    Minimise every group's loss with its own BFGS iteration (inverse Hessian,
+    backtracking line search and convergence test per group), evaluating
+    all groups that are still iterating as one batch. Groups drop out of the
+    batch as they converge.
+    """
+    n_groups, n_params = x0.shape
+    x = x0.copy()
+    if not n_params:
+        return x
+    eye = np.eye(n_params)
+    H = np.repeat(eye[None], n_groups, axis=0)
+    everyone = np.arange(n_groups)
+    f, g = _value_and_grad(loss, spec, x, everyone, y, exog)
+    active = np.isfinite(f) & (np.max(np.abs(g), axis=1) > gtol)
+    for _ in range(maxiter):
+        idx = np.flatnonzero(active)
+        if not len(idx):
+            break
+        direction = -(H[idx] @ g[idx, :, None])[:, :, 0]
+        # keep trial steps within a unit box of the unconstrained parameters
+        direction /= np.maximum(np.max(np.abs(direction), axis=1), 1.0)[:, None]
+        slope = np.einsum("gp,gp->g", g[idx], direction)
+        # not a descent direction: restart from steepest descent
+        reset = ~(slope < 0)
+        if reset.any():
+            H[idx[reset]] = eye
+            direction[reset] = -g[idx[reset]]
+            slope[reset] = -np.einsum("gp,gp->g", g[idx[reset]], g[idx[reset]])
+        alpha = np.ones(len(idx))
+        accepted = np.zeros(len(idx), dtype=bool)
+        for _ in range(30):
+            todo = np.flatnonzero(~accepted)
+            if not len(todo):
+                break
+            trial = _evaluate(
+                loss, spec, x[idx[todo]] + alpha[todo, None] * direction[todo], idx[todo], y, exog,
+            )
+            ok = np.isfinite(trial) & (trial <= f[idx[todo]] + 1e-4 * alpha[todo] * slope[todo])
+            accepted[todo[ok]] = True
+            alpha[todo[~ok]] *= 0.5
+        # no acceptable step: the group is as converged as it gets
+        active[idx[~accepted]] = False
+        moved = idx[accepted]
+        if not len(moved):
+            break
+        x_new = x[moved] + alpha[accepted, None] * direction[accepted]
+        f_new, g_new = _value_and_grad(loss, spec, x_new, moved, y, exog)
+        s_step = x_new - x[moved]
+        y_step = g_new - g[moved]
+        sy = np.einsum("gp,gp->g", s_step, y_step)
+        curved = sy > 1e-12
+        if curved.any():
+            rho = 1.0 / sy[curved]
+            left = eye - rho[:, None, None] * s_step[curved, :, None] * y_step[curved, None, :]
+            H[moved[curved]] = (
+                left @ H[moved[curved]] @ left.transpose(0, 2, 1)
+                + rho[:, None, None] * s_step[curved, :, None] * s_step[curved, None, :]
+            )
+        done = (
+            (np.max(np.abs(g_new), axis=1) <= gtol)
+            | (f[moved] - f_new <= ftol * np.maximum(np.abs(f_new), 1.0))
+        )
+        x[moved], f[moved], g[moved] = x_new, f_new, g_new
+        active[moved[done]] = False
+    return x
+
+
+def fit_sarimax_batch(
+    y: np.ndarray,
+    exog: np.ndarray | None,
+    exog_names: List[str],
+    order: tuple,
+    seasonal_order: tuple,
+    start_params: np.ndarray | None = None,
+    maxiter: int = 50,
+    last_timestamp: Optional[int] = None,
+    method: str = "css-mle",
+) -> Tuple[List[Optional[CompactSARIMAX]], List[Optional[str]]]:
+    """
+    Fit SARIMAX(order)(seasonal_order) with regression on exog (n, m) to every
+    column of y (n, G) at once. start_params (G, n_params) in statsmodels'
+    param_names order warm-starts the groups whose ARMA part is finite and
+    stationary (the regression is profiled out and needs no start value).
+    method picks the objective (FIT_METHODS); the final state, covariance
+    and innovation variance come from one exact Kalman filter pass at the
+    estimates. Returns per-group compact models and error messages; groups
+    with missing values or a non-finite likelihood get None and a message.
+    """
+    if method not in FIT_METHODS:
+        raise ValueError(f"Unknown fit method {method!r}, expected one of {FIT_METHODS}")
+    y = np.asarray(y, dtype=float).T  # (G, n)
+    n_groups, n_obs = y.shape
+    exog = np.zeros((n_obs, 0)) if exog is None else np.asarray(exog, dtype=float)
+    spec = _Spec(order, seasonal_order)
+    param_names = sarimax_param_names(exog_names, order, seasonal_order)
+    errors: List[Optional[str]] = [None] * n_groups
+    complete = ~np.isnan(y).any(axis=1)
+    for g in np.flatnonzero(~complete):
+        errors[g] = "ValueError: the batched fit does not support missing values"
+    y = np.where(complete[:, None], y, 0.0)
+
+    # fit on rescaled data so all groups' parameters and losses are of similar size
+    y_scale = np.sqrt(np.mean(y * y, axis=1))
+    y_scale = np.where(y_scale > 0, y_scale, 1.0)
+    x_scale = np.sqrt(np.mean(exog * exog, axis=0))
+    x_scale = np.where(x_scale > 0, x_scale, 1.0)
+    y_s = y / y_scale[:, None]
+    exog_s = exog / x_scale
+
+    x = _start_params(spec, y_s, exog_s)
+    if start_params is not None:
+        arma = np.asarray(start_params, dtype=float)[:, len(exog_names):]
+        warm = spec.join({name: arma[:, sl] for name, sl in spec.slices.items()})
+        usable = np.all(np.isfinite(warm), axis=1)
+        x[usable] = warm[usable]
+    if method in ("css", "css-mle"):
+        x = _minimize(_css_loss, spec, x, y_s, exog_s, maxiter if method == "css" else CSS_MAXITER)
+    if method in ("mle", "css-mle"):
+        x = _minimize(_neg_loglike, spec, x, y_s, exog_s, maxiter)
+
+    coefs = spec.split(x)
+    design, transition, selection = sarimax_system(*spec.polynomials(coefs))
+    k = design.shape[1]
+    state_cov_0 = stationary_state_cov_batch(transition, selection @ selection.transpose(0, 2, 1))
+    _, _, cross, _ = chandrasekhar_batch(design, np.zeros(n_groups), transition, state_cov_0, y_s, exog_s)
+    beta_s, _ = _profile(cross, n_obs)
+    # one full filter pass in data units for the final state and covariance;
+    # with unit innovation variance the gains are the same and sigma2 follows
+    # from the scaled residuals
+    beta = beta_s * y_scale[:, None] / x_scale
+    state, state_cov_t, nobs, resid_sum, scaled_sq, _ = filter_loglike_batch(
+        design,
+        np.zeros(n_groups),
+        transition,
+        np.zeros((n_groups, k)),
+        selection,
+        np.ones((n_groups, 1, 1)),
+        np.zeros((n_groups, k)),
+        state_cov_0,
+        y,
+        beta @ exog.T,
+    )
+    sigma2 = scaled_sq / np.maximum(nobs, 1)
+
+    models: List[Optional[CompactSARIMAX]] = []
+    for g in range(n_groups):
+        if errors[g]:
+            models.append(None)
+            continue
+        params = np.concatenate([
+            beta[g], coefs["ar"][g], coefs["ma"][g],
+            coefs["seasonal_ar"][g], coefs["seasonal_ma"][g], [sigma2[g]],
+        ])
+        if not (np.all(np.isfinite(params)) and np.all(np.isfinite(state[g])) and sigma2[g] > 0):
+            models.append(None)
+            errors[g] = "ValueError: loglikelihood is not finite"
+            continue
+        models.append(CompactSARIMAX(
+            order=tuple(order),
+            seasonal_order=tuple(seasonal_order),
+            param_names=param_names,
+            exog_names=list(exog_names),
+            params=params,
+            design=design[g],
+            obs_cov=0.0,
+            transition=transition[g],
+            state_intercept=np.zeros(k),
+            selection=selection[g],
+            state_cov=np.array([[sigma2[g]]]),
+            predicted_state=state[g],
+            predicted_state_cov=state_cov_t[g] * sigma2[g],
+            residual_bias=float(resid_sum[g] / nobs[g]),
+            nobs=int(nobs[g]),
+            last_timestamp=last_timestamp,
+        ))
+    return models, errors
+
+
+def fit_groups_batched(
+    cons: pd.DataFrame,
+    exog: pd.DataFrame | None,
+    group_ids: List,
+    models_dir: Path,
+    order: tuple,
+    seasonal_order: tuple,
+    verbose: bool = True,
+    model_format: str = "compact",
+    start_params: Dict[object, np.ndarray] | None = None,
+    maxiter: int = 50,
+    group_orders: Dict[object, Tuple[tuple, tuple]] | None = None,
+) -> Dict[object, Optional[str]]:
+    """
+    Batched counterpart of parallel.fit_groups: fits all groups in one go and
+    writes them to the compact store next to models_dir. group_orders gives
+    groups their own (order, seasonal_order); there is one batch per
+    distinct spec. Returns {gid: None or error message}, in group_ids order.
+    """
+    if model_format != "compact":
+        raise ValueError("The batched backend stores compact models only")
+    if group_orders:
+        buckets: Dict[Tuple[tuple, tuple], List] = {}
+        for gid in group_ids:
+            spec = group_orders.get(gid, (order, seasonal_order))
+            buckets.setdefault((tuple(spec[0]), tuple(spec[1])), []).append(gid)
+        errors: Dict[object, Optional[str]] = {}
+        for (bucket_order, bucket_seasonal), bucket in buckets.items():
+            if verbose:
+                print(f"SARIMAX{bucket_order}x{bucket_seasonal}: {len(bucket)} groups")
+            errors.update(fit_groups_batched(
+                cons, exog, bucket, models_dir, bucket_order, bucket_seasonal,
+                verbose=verbose, model_format=model_format,
+                start_params=start_params, maxiter=maxiter,
+            ))
+        return {gid: errors.get(gid) for gid in group_ids}
+    models_dir = Path(models_dir)
+    exog_names = [] if exog is None else list(exog.columns)
+    warm = None
+    if start_params:
+        n_params = len(sarimax_param_names(exog_names, order, seasonal_order))
+        warm = np.full((len(group_ids), n_params), np.nan)
+        for row, gid in enumerate(group_ids):
+            params = start_params.get(gid)
+            if params is not None and len(params) == n_params:
+                warm[row] = params
+    if verbose:
+        print(f"Fitting {len(group_ids)} groups as one batch...")
+    start = time.perf_counter()
+    models, errors = fit_sarimax_batch(
+        cons[group_ids].to_numpy(dtype=float),
+        None if exog is None else exog.to_numpy(dtype=float),
+        exog_names,
+        order,
+        seasonal_order,
+        start_params=warm,
+        maxiter=maxiter,
+        last_timestamp=int(cons.index.asi8[-1]),
+    )
+    if verbose:
+        print(f"Batched fit finished in {time.perf_counter() - start:.1f} s")
+        for gid, err in zip(group_ids, errors):
+            if err:
+                print(f"Group {gid} failed: {err}")
+    fitted = {gid: model for gid, model in zip(group_ids, models) if model is not None}
+    if fitted:
+        path = save_model_store(fitted, model_store_path(models_dir))
+        if verbose:
+            print(f"Saved {len(fitted)} compact models to: {path}")
+    return dict(zip(group_ids, errors))
+
+
+def forecast_batch(
+    models: Dict[object, CompactSARIMAX],
+    exog_future: pd.DataFrame | None,
+    steps: int,
+) -> Dict[object, Tuple[np.ndarray, np.ndarray]]:
+    """
+    Forecast mean (bias corrected) and variance of every model, stacking
+    the models with the same state dimension and exog columns into one
+    batched recursion. Returns {gid: (mean, variance)}.
+    """
+    buckets: Dict[tuple, List] = {}
+    for gid, model in models.items():
+        key = (len(model.predicted_state), model.selection.shape[1], tuple(model.exog_names))
+        buckets.setdefault(key, []).append(gid)
+    out: Dict[object, Tuple[np.ndarray, np.ndarray]] = {}
+    for (_, _, exog_names), gids in buckets.items():
+        batch = [models[gid] for gid in gids]
+        if exog_names:
+            exog = exog_future[list(exog_names)] if hasattr(exog_future, "columns") else exog_future
+            exog = np.asarray(exog, dtype=float)[:steps]
+            obs_intercept = np.stack([m.beta for m in batch]) @ exog.T
+        else:
+            obs_intercept = np.zeros((len(batch), steps))
+        mean, var = forecast_moments_batch(
+            np.stack([m.design for m in batch]),
+            np.array([m.obs_cov for m in batch]),
+            np.stack([m.transition for m in batch]),
+            np.stack([m.state_intercept for m in batch]),
+            np.stack([m.selection for m in batch]),
+            np.stack([m.state_cov for m in batch]),
+            np.stack([m.predicted_state for m in batch]),
+            np.stack([m.predicted_state_cov for m in batch]),
+            obs_intercept,
+        )
+        mean += np.array([m.residual_bias for m in batch])[:, None]
+        for row, gid in enumerate(gids):
+            out[gid] = (mean[row], var[row])
+    return out
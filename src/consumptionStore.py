@@ -0,0 +1,109 @@
+"""
+Array-backed consumption store. The hourly consumption is kept as one
+contiguous (hours x groups) matrix on a gap-free hourly grid that
+starts at start_hour (hours since the epoch, UTC), with a group_id -> column
+map. Hours map to rows by subtraction, so time slices are O(1) views, and the
+monthly totals are computed once. Hours missing from the source frame are
+NaN rows flagged in observed. The matrix is float64 by default, so the
+model inputs are those of the DataFrame path; dtype=np.float32 halves its
+memory at the cost of float32 rounding of every value.
+"""
+from __future__ import annotations
+from functools import cached_property
+from typing import Optional, Sequence, Tuple
+import numpy as np
+import pandas as pd
+
+HOUR_NS = 3_600_000_000_000
+
+
+class ConsumptionStore:
+    def __init__(
+        self,
+        values: np.ndarray,
+        start_hour: int,
+        group_ids: Sequence,
+        observed: Optional[np.ndarray] = None,
+        tz="UTC",
+        dtype=np.float64,
+    ):
+        self.values = np.ascontiguousarray(values, dtype=dtype)
+        self.start_hour = int(start_hour)
+        self.group_ids = list(group_ids)
+        self.columns = {gid: col for col, gid in enumerate(self.group_ids)}
+        self.observed = np.ones(len(self.values), dtype=bool) if observed is None else observed
+        self.tz = tz
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, dtype=np.float64) -> "ConsumptionStore":
+        stamps = df.index.as_unit("ns").asi8
+        if (stamps % HOUR_NS).any():
+            raise ValueError("ConsumptionStore needs timestamps on whole hours")
+        hours = stamps // HOUR_NS
+        start = int(hours.min()) if len(hours) else 0
+        n_hours = int(hours.max()) - start + 1 if len(hours) else 0
+        rows = hours - start
+        values = np.full((n_hours, df.shape[1]), np.nan, dtype=dtype)
+        values[rows] = df.to_numpy(dtype=dtype)
+        observed = np.zeros(n_hours, dtype=bool)
+        observed[rows] = True
+        return cls(values, start, df.columns, observed, df.index.tz, dtype)
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    @cached_property
+    def index(self) -> pd.DatetimeIndex:
+        """Timestamps of the grid rows (observed or not)."""
+        stamps = (self.start_hour + np.arange(len(self), dtype=np.int64)) * HOUR_NS
+        index = pd.DatetimeIndex(stamps.view("datetime64[ns]"), name="measured_at")
+        return index.tz_localize("UTC").tz_convert(self.tz) if self.tz else index
+
+    def rows(self, index: pd.DatetimeIndex) -> np.ndarray:
+        """Grid row of every timestamp (may be out of range)."""
+        return index.as_unit("ns").asi8 // HOUR_NS - self.start_hour
+
+    def window(self, start: pd.Timestamp | None = None, end: pd.Timestamp | None = None) -> slice:
+        """Row slice of [start, end] (both inclusive, like .loc)."""
+        first = 0 if start is None else max(int(self.rows(pd.DatetimeIndex([start]))[0]), 0)
+        last = len(self) if end is None else int(self.rows(pd.DatetimeIndex([end]))[0]) + 1
+        return slice(first, max(min(last, len(self)), first))
+
+    def frame(self, rows: slice = slice(None), group_ids: Optional[Sequence] = None) -> pd.DataFrame:
+        """
+        Wide frame over a row slice. Without group_ids (or for a contiguous
+        run of columns) the frame is a view on the store, not a copy.
+        """
+        if group_ids is None:
+            values, columns = self.values[rows], self.group_ids
+        else:
+            columns = list(group_ids)
+            cols = np.array([self.columns[gid] for gid in columns], dtype=np.intp)
+            if len(cols) and (np.diff(cols) == 1).all():
+                values = self.values[rows, cols[0]:cols[-1] + 1]
+            else:
+                values = self.values[rows][:, cols]
+        return pd.DataFrame(values, index=self.index[rows], columns=columns, copy=False)
+
+    @cached_property
+    def monthly(self) -> Tuple[pd.DatetimeIndex, np.ndarray]:
+        """
+        (month starts, float64 monthly totals per group), as
+        resample("MS").sum() gives them: missing values count as zero.
+        """
+        months = self.index.tz_localize(None) if self.tz else self.index
+        month_ids = months.to_numpy().astype("datetime64[M]")
+        starts = np.flatnonzero(np.r_[True, month_ids[1:] != month_ids[:-1]])
+        ends = np.r_[starts[1:], len(self)]
+        totals = np.empty((len(starts), len(self.group_ids)))
+        for m, (first, last) in enumerate(zip(starts, ends)):
+            totals[m] = np.nansum(self.values[first:last], axis=0, dtype=np.float64)
+        index = pd.date_range(
+            month_ids[0].astype("datetime64[ns]") if len(starts) else "1970-01-01",
+            periods=len(starts), freq="MS", tz=self.tz, name="measured_at",
+        )
+        return index, totals
+
+    def monthly_frame(self) -> pd.DataFrame:
+        index, totals = self.monthly
+        return pd.DataFrame(totals, index=index, columns=self.group_ids, copy=False)
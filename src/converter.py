@@ -1,6 +1,8 @@
 from __future__ import annotations
+import os
 from pathlib import Path
-from typing import Optional
+from typing import Callable, Dict, Optional, Tuple
+import numpy as np
 import pandas as pd
 
 from loadData import (
@@ -10,56 +12,138 @@ from loadData import (
     EXAMPLE_MONTHLY_CSV,
 )
 
+# rows formatted and written at a time by save_submission_csv
+SUBMISSION_CHUNK_ROWS = 256
+_TEMPLATES: Dict[Tuple[str, int], pd.DataFrame] = {}
+
+def _load_template(path: Path | str, loader: Callable[[Path], pd.DataFrame]) -> pd.DataFrame:
+    """Parsed template CSV, read again only when the file changes."""
+    path = Path(path)
+    key = (str(path.resolve()), path.stat().st_mtime_ns)
+    if key not in _TEMPLATES:
+        _TEMPLATES[key] = loader(path)
+    return _TEMPLATES[key]
+
+def _format_measured_at(index: pd.DatetimeIndex) -> np.ndarray:
+    """UTC ISO timestamps like 2024-10-01T00:00:00.000Z, in one vectorized pass."""
+    utc = index.tz_convert("UTC").tz_localize(None) if index.tz is not None else index
+    return np.char.add(np.datetime_as_string(utc.to_numpy(), unit="ms"), "Z")
+
 def _align_forecast_to_template(
-    forecast_df: pd.DataFrame, template_df: pd.DataFrame
+    forecast_df: pd.DataFrame, template_df: pd.DataFrame, warn: bool = True
 ) -> pd.DataFrame:
-    fc = forecast_df.copy()
-    fc.columns = [str(c) for c in fc.columns]
+    """
+    forecast_df on the template's timestamps and group columns (matched by
+    str(group id)), gathered straight from its values in one pass; groups
+    without any forecast are filled with 0.0.
+    """
     template_cols = [str(c) for c in template_df.columns]
-    aligned = fc.reindex(index=template_df.index, columns=template_cols)
-    missing_groups = [col for col in aligned.columns if aligned[col].isna().all()]
-    if missing_groups:
+    rows = forecast_df.index.get_indexer(template_df.index)
+    cols = pd.Index([str(c) for c in forecast_df.columns]).get_indexer(template_cols)
+    aligned = np.full((len(rows), len(cols)), np.nan)
+    known_rows, known_cols = rows >= 0, cols >= 0
+    aligned[np.ix_(known_rows, known_cols)] = forecast_df.to_numpy(dtype=float)[
+        np.ix_(rows[known_rows], cols[known_cols])
+    ]
+    missing = np.isnan(aligned)
+    missing_groups = [col for col, empty in zip(template_cols, missing.all(axis=0)) if empty]
+    if missing_groups and warn:
         print(
             "WARNING: no forecasts for these groups; filling with 0.0:\n"
             f"  {', '.join(missing_groups)}"
         )
-    aligned = aligned.fillna(0.0)
+    aligned[missing] = 0.0
+    return pd.DataFrame(aligned, index=template_df.index, columns=template_cols, copy=False)
+
+def _with_measured_at(aligned: pd.DataFrame, template: pd.DataFrame) -> pd.DataFrame:
+    aligned.insert(0, "measured_at", _format_measured_at(template.index))
     return aligned
 
 def build_submission_48h(
     forecast_hourly: pd.DataFrame,
     template_path: Path | str = EXAMPLE_HOURLY_CSV,
+    template: Optional[pd.DataFrame] = None,
 ) -> pd.DataFrame:
-    template = load_example_hourly(template_path)
-    aligned = _align_forecast_to_template(forecast_hourly, template)
-    submission = aligned.copy()
-    measured_at_str = template.index.strftime("%Y-%m-%dT%H:%M:%S.000Z")
-    submission.insert(0, "measured_at", measured_at_str)
-    return submission
+    if template is None:
+        template = _load_template(template_path, load_example_hourly)
+    return _with_measured_at(_align_forecast_to_template(forecast_hourly, template), template)
 
 def build_submission_12m(
     forecast_monthly: pd.DataFrame,
     template_path: Path | str = EXAMPLE_MONTHLY_CSV,
+    template: Optional[pd.DataFrame] = None,
 ) -> pd.DataFrame:
-    template = load_example_monthly(template_path)
-    aligned = _align_forecast_to_template(forecast_monthly, template)
-    submission = aligned.copy()
-    measured_at_str = template.index.strftime("%Y-%m-%dT%H:%M:%S.000Z")
-    submission.insert(0, "measured_at", measured_at_str)
-    return submission
+    if template is None:
+        template = _load_template(template_path, load_example_monthly)
+    return _with_measured_at(_align_forecast_to_template(forecast_monthly, template), template)
+
+def quantile_column(gid, q: float) -> str:
+    return f"{gid}_p{round(q * 100):02d}"
+
+def build_quantile_submission(
+    quantile_frames: Dict[float, pd.DataFrame],
+    template: pd.DataFrame,
+) -> pd.DataFrame:
+    """
+    Extended submission with the quantile forecasts of every group side by
+    side ("<group>_p10", "<group>_p50", "<group>_p90"), on the template's
+    timestamps and groups.
+    """
+    quantiles = sorted(quantile_frames)
+    aligned = [
+        _align_forecast_to_template(quantile_frames[q], template, warn=(i == 0))
+        for i, q in enumerate(quantiles)
+    ]
+    values = np.stack([a.to_numpy() for a in aligned], axis=2).reshape(len(template), -1)
+    columns = [quantile_column(gid, q) for gid in aligned[0].columns for q in quantiles]
+    return _with_measured_at(pd.DataFrame(values, index=template.index, columns=columns), template)
+
+def _format_row(stamp: str, row: list, has_nan: bool) -> str:
+    if has_nan:
+        return f"{stamp};{';'.join('' if v != v else repr(v) for v in row).replace('.', ',')}\n"
+    return f"{stamp};{';'.join(map(repr, row)).replace('.', ',')}\n"
+
+def _write_csv(submission_df: pd.DataFrame, output_path: Path, chunk_rows: int) -> None:
+    """
+    The CSV pandas' to_csv(sep=";", decimal=",") writes, byte for byte:
+    floats take the shortest round-trip repr, as in pandas, but through
+    float.__repr__ on plain lists, and a row's decimal points are swapped
+    in one replace over the joined line.
+    """
+    stamps = submission_df.iloc[:, 0].astype(str).tolist()
+    values = submission_df.iloc[:, 1:].to_numpy()
+    with open(output_path, "w") as f:
+        f.write(";".join(str(c) for c in submission_df.columns) + "\n")
+        for start in range(0, len(values), chunk_rows):
+            chunk = values[start:start + chunk_rows]
+            has_nan = np.isnan(chunk).any(axis=1).tolist()
+            f.write("".join(map(_format_row, stamps[start:start + chunk_rows], chunk.tolist(), has_nan)))
 
 def save_submission_csv(
     submission_df: pd.DataFrame,
     output_path: Path | str,
     verbose: bool = True,
+    chunk_rows: int = SUBMISSION_CHUNK_ROWS,
+    parquet: bool = False,
 ) -> None:
+    """
+    Write the submission as a semicolon CSV with decimal commas, streamed
+    chunk_rows rows at a time; with parquet, also next to it as .parquet.
+    Frames with other than float64 group columns go through pandas' to_csv.
+    """
     output_path = Path(output_path)
     output_path.parent.mkdir(parents=True, exist_ok=True)
     if verbose:
         print(f"Writing submission file to: {output_path}")
-    submission_df.to_csv(
-        output_path,
-        sep=";",
-        index=False,
-        decimal=",",
-    )
+    tmp_path = output_path.with_name(output_path.name + ".tmp")
+    numeric = all(dtype == np.float64 for dtype in submission_df.dtypes.iloc[1:])
+    if numeric and submission_df.shape[1] > 1:
+        _write_csv(submission_df, tmp_path, chunk_rows)
+    else:
+        submission_df.to_csv(tmp_path, sep=";", index=False, decimal=",")
+    os.replace(tmp_path, output_path)
+    if parquet:
+        parquet_path = output_path.with_suffix(".parquet")
+        if verbose:
+            print(f"Writing submission file to: {parquet_path}")
+        submission_df.to_parquet(parquet_path, index=False)
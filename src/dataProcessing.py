@@ -1,6 +1,10 @@
 from __future__ import annotations
+import weakref
 from typing import Tuple
+import numpy as np
 import pandas as pd
+from consumptionStore import ConsumptionStore
+from pipelineOptions import VARIANTS_48H
 from loadData import (
     load_training_consumption,
     load_training_prices,
@@ -8,19 +12,28 @@ from loadData import (
     load_example_monthly,
 )
 
-def get_48h_forecast_index(consumption_df: pd.DataFrame | None = None) -> pd.DatetimeIndex:
+# id(prices_df) -> (weakref to prices_df, interpolated price series)
+_PRICE_CACHE: dict = {}
+
+def get_forecast_index(
+    consumption_df: pd.DataFrame | None = None,
+    horizon: int = 48,
+) -> pd.DatetimeIndex:
     if consumption_df is None:
         consumption_df = load_training_consumption()
 
     train_end = consumption_df.index.max()
     forecast_index = pd.date_range(
         start=train_end + pd.Timedelta(hours=1),
-        periods=48,
-        freq="H",
+        periods=horizon,
+        freq="h",
         tz=consumption_df.index.tz, 
     )
     return forecast_index
 
+def get_48h_forecast_index(consumption_df: pd.DataFrame | None = None) -> pd.DatetimeIndex:
+    return get_forecast_index(consumption_df, horizon=48)
+
 def _build_hourly_calendar_features(index: pd.DatetimeIndex) -> pd.DataFrame:
     df = pd.DataFrame(index=index)
     df["hour"] = index.hour
@@ -36,16 +49,33 @@ def _build_monthly_calendar_features(index: pd.DatetimeIndex) -> pd.DataFrame:
     df["t"] = range(1, len(index) + 1)
     return df
 
+def _align_store(store: ConsumptionStore, index: pd.DatetimeIndex) -> pd.DataFrame:
+    """
+    store rows at the hours of index (sorted, observed hours only). When they
+    form one contiguous run of rows the frame is a view on the store.
+    """
+    rows = store.rows(index)
+    inside = (rows >= 0) & (rows < len(store))
+    rows = rows[inside]
+    rows = rows[store.observed[rows]]
+    if len(rows) and rows[-1] - rows[0] + 1 == len(rows):
+        return store.frame(slice(rows[0], rows[-1] + 1))
+    return pd.DataFrame(store.values[rows], index=store.index[rows], columns=store.group_ids)
+
 def prepare_hourly_training(
-    consumption_df: pd.DataFrame | None = None,
+    consumption_df: pd.DataFrame | ConsumptionStore | None = None,
     prices_df: pd.DataFrame | None = None,
 ) -> Tuple[pd.DataFrame, pd.DataFrame]:
     if consumption_df is None:
         consumption_df = load_training_consumption()
     if prices_df is None:
         prices_df = load_training_prices()
-    common_index = consumption_df.index.intersection(prices_df.index)
-    cons_aligned = consumption_df.loc[common_index].sort_index()
+    if isinstance(consumption_df, ConsumptionStore):
+        cons_aligned = _align_store(consumption_df, prices_df.index.sort_values())
+        common_index = cons_aligned.index
+    else:
+        common_index = consumption_df.index.intersection(prices_df.index)
+        cons_aligned = consumption_df.loc[common_index].sort_index()
     price = prices_df.loc[common_index, "eur_per_mwh"].sort_index()
     price = price.interpolate(method="time").ffill().bfill()
     exog = _build_hourly_calendar_features(common_index)
@@ -54,41 +84,73 @@ def prepare_hourly_training(
 
 
 def prepare_monthly_training(
-    consumption_df: pd.DataFrame | None = None,
+    consumption_df: pd.DataFrame | ConsumptionStore | None = None,
 ) -> Tuple[pd.DataFrame, pd.DataFrame]:
     if consumption_df is None:
         consumption_df = load_training_consumption()
-    cons_monthly = consumption_df.resample("MS").sum().sort_index()
+    if isinstance(consumption_df, ConsumptionStore):
+        cons_monthly = consumption_df.monthly_frame()
+    else:
+        cons_monthly = consumption_df.resample("MS").sum().sort_index()
     exog_monthly = _build_monthly_calendar_features(cons_monthly.index)
 
     return cons_monthly, exog_monthly
 
+def last_complete_month(last_hour: pd.Timestamp) -> pd.Timestamp:
+    """
+    Start of the last month that hourly data ending at last_hour covers in
+    full (the month of last_hour itself if last_hour is its final hour).
+    """
+    naive = last_hour.tz_localize(None) if last_hour.tz is not None else last_hour
+    month = naive.to_period("M")
+    if (naive + pd.Timedelta(hours=1)).to_period("M") == month:
+        month -= 1
+    start = month.to_timestamp()
+    return start.tz_localize(last_hour.tz) if last_hour.tz is not None else start
+
+def _interpolated_prices(prices_df: pd.DataFrame) -> pd.Series:
+    """
+    Time-interpolated, gap-free price series for prices_df. The result is
+    cached per prices_df object, so repeated exog builds (horizon sweeps,
+    backtests) interpolate the history only once. Mutating prices_df in
+    place after the first call is not detected.
+    """
+    key = id(prices_df)
+    cached = _PRICE_CACHE.get(key)
+    if cached is not None and cached[0]() is prices_df:
+        return cached[1]
+    price_series = prices_df["eur_per_mwh"].sort_index()
+    price_series = price_series.interpolate(method="time").ffill().bfill()
+    _PRICE_CACHE[key] = (weakref.ref(prices_df, lambda _: _PRICE_CACHE.pop(key, None)), price_series)
+    return price_series
+
 def build_future_exog_48h(
     forecast_index: pd.DatetimeIndex | None = None,
     prices_df: pd.DataFrame | None = None,
     consumption_df: pd.DataFrame | None = None,
+    horizon: int = 48,
+    pattern_days: int = 27,
 ) -> pd.DataFrame:
+    """
+    Future exog for the hourly models. Known prices are used where the price
+    history covers the forecast index; the remaining hours get the mean price
+    for that hour of day over the last pattern_days of training. Works for
+    any forecast_index (by default the next horizon hours after training).
+    """
     if consumption_df is None:
         consumption_df = load_training_consumption()
     if prices_df is None:
         prices_df = load_training_prices()
     if forecast_index is None:
-        forecast_index = get_48h_forecast_index(consumption_df)
-    price_series = prices_df["eur_per_mwh"].copy()
-    price_series.index = prices_df.index
-    price_series = price_series.sort_index()
-    price_series = price_series.interpolate(method="time").ffill().bfill()
+        forecast_index = get_forecast_index(consumption_df, horizon=horizon)
+    price_series = _interpolated_prices(prices_df)
     train_end = consumption_df.index.max()
-    last_price_time = price_series.index.max()
-    window_start = train_end - pd.Timedelta(days=27)
+    window_start = train_end - pd.Timedelta(days=pattern_days)
     window = price_series.loc[window_start:train_end]
     hourly_pattern = window.groupby(window.index.hour).mean()
-    price_future = pd.Series(index=forecast_index, dtype=float)
-    for t in forecast_index:
-        if t <= last_price_time and t in price_series.index:
-            price_future[t] = price_series.loc[t]
-        else:
-            price_future[t] = hourly_pattern.loc[t.hour]
+    price_future = price_series.reindex(forecast_index).to_numpy(copy=True)
+    unknown = np.isnan(price_future)
+    price_future[unknown] = hourly_pattern.reindex(forecast_index.hour[unknown]).to_numpy()
     exog_future = _build_hourly_calendar_features(forecast_index)
     exog_future["price"] = price_future
     return exog_future
@@ -103,7 +165,7 @@ def build_future_exog_12m(
     return exog_future
 
 def build_weekly_baseline_48h(
-    consumption_df: pd.DataFrame,
+    consumption_df: pd.DataFrame | ConsumptionStore,
     forecast_index: pd.DatetimeIndex,
 ) -> pd.DataFrame:
     """
@@ -111,32 +173,46 @@ def build_weekly_baseline_48h(
     Returns a wide DataFrame with the same columns as consumption_df.
     """
     baseline_index = forecast_index - pd.Timedelta(days=7)
+    if isinstance(consumption_df, ConsumptionStore):
+        rows = consumption_df.rows(baseline_index)
+        known = (rows >= 0) & (rows < len(consumption_df))
+        values = np.full((len(forecast_index), len(consumption_df.group_ids)), np.nan, dtype=consumption_df.values.dtype)
+        values[known] = consumption_df.values[rows[known]]
+        return pd.DataFrame(values, index=forecast_index, columns=consumption_df.group_ids)
     baseline = consumption_df.reindex(baseline_index)
     baseline.index = forecast_index
     return baseline
 
-"""
-import pandas as pd
+def build_weekly_residuals_48h(consumption_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Consumption minus the weekly baseline (same hour one week earlier), the
+    training target of the "residual" 48h variant. The first week is NaN.
+    """
+    return consumption_df - build_weekly_baseline_48h(consumption_df, consumption_df.index)
+
+# group_label fields, from the broadest level down
+GROUP_LABEL_LEVELS = (
+    "macro_region",
+    "county",
+    "municipality",
+    "segment",
+    "product_type",
+    "consumption_bucket",
+)
 
 def prepare_groups_with_metadata(groups: pd.DataFrame) -> pd.DataFrame:
     g = groups.copy()
     g["group_id"] = g["group_id"].astype(int)
     parts = g["group_label"].str.split(" | ", expand=True, regex=False)
-    col_names = [
-        "macro_region",
-        "county",
-        "municipality",
-        "segment",
-        "product_type",
-        "consumption_bucket",
-    ]
-    for i, col in enumerate(col_names):
+    for i, col in enumerate(GROUP_LABEL_LEVELS):
         if i < parts.shape[1]:
             g[col] = parts[i].str.strip()
         else:
             g[col] = None
     return g
 
+"""
+
 def add_calendar_features(
     df: pd.DataFrame,
     ts_col: str = "measured_at",
@@ -1,64 +1,110 @@
 from __future__ import annotations
-import pickle
 from pathlib import Path
-from typing import Optional
+from typing import Dict, Optional, Tuple
 import pandas as pd
-from dataProcessing import prepare_monthly_training, build_future_exog_12m
+from forecastEngine import (
+    QUANTILES,
+    assemble_forecast_frame,
+    assemble_moment_frames,
+    forecast_groups,
+    forecast_quantiles,
+)
+from hierarchy import (
+    SHARE_MONTHS_12M,
+    forecast_groups_from_nodes,
+    group_nodes,
+    hierarchical_models_dir,
+    month_of_year,
+    node_ids,
+)
+from pipelineData import PipelineData
 
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
 MODEL_DIR_12M = PROJECT_ROOT / "Data" / "models" / "sarimax_12m"
 
+def default_models_dir_12m(hierarchical: bool = False) -> Path:
+    return hierarchical_models_dir(MODEL_DIR_12M) if hierarchical else MODEL_DIR_12M
+
 def forecast_12m(
     models_dir: Path | None = None,
     verbose: bool = True,
     max_groups: Optional[int] = None,
+    data: PipelineData | None = None,
+    mode: str = "serial",
+    workers: Optional[int] = None,
+    model_format: str = "compact",
+    backend: str = "statsmodels",
+    hierarchical: bool = False,
+    return_variance: bool = False,
 ) -> pd.DataFrame:
     if models_dir is None:
-        models_dir = MODEL_DIR_12M
+        models_dir = default_models_dir_12m(hierarchical)
     models_dir = Path(models_dir)
+    if data is None:
+        data = PipelineData.load()
     if verbose:
         print(f"Using monthly models from: {models_dir}")
-    cons_monthly, _ = prepare_monthly_training()
+    cons_monthly, _ = data.monthly_training
     group_ids = list(cons_monthly.columns)
     if max_groups is not None:
         original_n = len(group_ids)
         group_ids = group_ids[:max_groups]
         if verbose:
             print(f"Restricting to first {len(group_ids)} of {original_n} groups")
-    exog_future = build_future_exog_12m()
+    exog_future = data.exog_future_12m
     forecast_index = exog_future.index
     if verbose:
         print(f"Forecast horizon length: {len(forecast_index)} months")
         print(f"First forecast timestamp: {forecast_index[0]}")
         print(f"Last  forecast timestamp: {forecast_index[-1]}")
         print(f"Number of groups to forecast: {len(group_ids)}")
-    forecast_df = pd.DataFrame(index=forecast_index, columns=group_ids, dtype=float)
-    total_groups = len(group_ids)
-    for idx, gid in enumerate(group_ids, start=1):
-        model_path = models_dir / f"group_{gid}.pkl"
-        if not model_path.exists():
-            if verbose:
-                print(
-                    f"[{idx}/{total_groups}] No model file for group {gid}, "
-                    "leaving forecast as NaN"
-                )
-            continue
+    model_ids = group_ids
+    if hierarchical:
+        nodes = group_nodes(data.group_metadata, group_ids)
+        model_ids = node_ids(nodes)
         if verbose:
-            print(
-                f"[{idx}/{total_groups}] Forecasting group {gid} "
-                f"using {model_path.name}..."
+            print(f"Forecasting {len(model_ids)} hierarchy nodes")
+    forecasts = forecast_groups(
+        models_dir,
+        model_ids,
+        exog_future,
+        steps=len(forecast_index),
+        mode=mode,
+        workers=workers,
+        verbose=verbose,
+        model_format=model_format,
+        backend=backend,
+        with_variance=return_variance,
+    )
+    var_df = None
+    if return_variance:
+        forecast_df, var_df = assemble_moment_frames(forecasts, forecast_index, model_ids)
+    else:
+        forecast_df = assemble_forecast_frame(forecasts, forecast_index, model_ids)
+    if hierarchical:
+        history = cons_monthly[group_ids].iloc[-SHARE_MONTHS_12M:]
+        if return_variance:
+            forecast_df, var_df = forecast_groups_from_nodes(
+                forecast_df, history, nodes, month_of_year, node_var=var_df
             )
-        with open(model_path, "rb") as f:
-            results = pickle.load(f)
-        steps = len(forecast_index)
-        fc = results.get_forecast(steps=steps, exog=exog_future)
-        yhat = fc.predicted_mean
-        residual_bias = getattr(results, "residual_bias", 0.0)
-        yhat_corrected = yhat + residual_bias
-        yhat_corrected.index = forecast_index
-        forecast_df[gid] = yhat_corrected
+        else:
+            forecast_df = forecast_groups_from_nodes(forecast_df, history, nodes, month_of_year)
+    if return_variance:
+        return forecast_df, var_df
     return forecast_df
 
+def forecast_12m_quantiles(
+    quantiles=QUANTILES,
+    **forecast_kwargs,
+) -> Tuple[pd.DataFrame, Dict[float, pd.DataFrame]]:
+    """
+    Point forecasts and analytic quantile forecasts (P10/P50/P90 by default)
+    from the state space forecast variance; forecast_kwargs as for
+    forecast_12m.
+    """
+    forecast_df, var_df = forecast_12m(return_variance=True, **forecast_kwargs)
+    return forecast_df, forecast_quantiles(forecast_df, var_df, quantiles)
+
 """
 if __name__ == "__main__":
     fc_12m = forecast_12m(verbose=True, max_groups=3)
@@ -1,75 +1,196 @@
 from __future__ import annotations
-import pickle
+from dataclasses import replace
 from pathlib import Path
-from typing import Optional
+from typing import Dict, Optional, Tuple
+import numpy as np
 import pandas as pd
-from loadData import load_training_consumption
-from dataProcessing import get_48h_forecast_index, build_future_exog_48h
 from dataProcessing import build_weekly_baseline_48h
+from forecastEngine import (
+    QUANTILES,
+    ScenarioForecast,
+    apply_exog_scenarios,
+    assemble_forecast_frame,
+    assemble_moment_frames,
+    exog_coefficients,
+    forecast_groups,
+    forecast_quantiles,
+    scenario_matrix,
+)
+from hierarchy import (
+    SHARE_DAYS_48H,
+    forecast_groups_from_nodes,
+    group_nodes,
+    hierarchical_models_dir,
+    hour_of_week,
+    node_ids,
+)
+from pipelineData import PipelineData
 
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
 DATA_DIR = PROJECT_ROOT / "Data"
 MODEL_DIR_48H = DATA_DIR / "models" / "sarimax_48h"
+MODEL_DIR_48H_RESIDUAL = DATA_DIR / "models" / "sarimax_48h_residual"
+PRICE_COLUMN = "price"
+
+def default_models_dir_48h(variant: str = "sarimax", hierarchical: bool = False) -> Path:
+    models_dir = MODEL_DIR_48H_RESIDUAL if variant == "residual" else MODEL_DIR_48H
+    return hierarchical_models_dir(models_dir) if hierarchical else models_dir
 
 def forecast_48h(
     models_dir: Path | None = None,
     verbose: bool = True,
     max_groups: Optional[int] = None,
+    data: PipelineData | None = None,
+    mode: str = "serial",
+    workers: Optional[int] = None,
+    model_format: str = "compact",
+    variant: str = "sarimax",
+    backend: str = "statsmodels",
+    hierarchical: bool = False,
+    return_variance: bool = False,
 ) -> pd.DataFrame:
     if models_dir is None:
-        models_dir = MODEL_DIR_48H
+        models_dir = default_models_dir_48h(variant, hierarchical)
+    if data is None:
+        data = PipelineData.load()
     if verbose:
         print(f"Using models from: {models_dir}")
-    cons_hourly = load_training_consumption()
+    cons_hourly = data.consumption
     group_ids = list(cons_hourly.columns)
     if max_groups is not None:
         original_n = len(group_ids)
         group_ids = group_ids[:max_groups]
         if verbose:
             print(f"Restricting to first {len(group_ids)} of {original_n} groups")
-    forecast_index = get_48h_forecast_index(consumption_df=cons_hourly)
-    exog_future = build_future_exog_48h(
-        forecast_index=forecast_index,
-        consumption_df=cons_hourly,
-    )
+    forecast_index = data.forecast_index_48h
+    exog_future = data.exog_future_48h
     if verbose:
         print(f"Forecast horizon length: {len(forecast_index)} hours")
         print(f"First forecast timestamp: {forecast_index[0]}")
         print(f"Last  forecast timestamp: {forecast_index[-1]}")
         print(f"Number of groups to forecast: {len(group_ids)}")
-    forecast_df = pd.DataFrame(index=forecast_index, columns=group_ids, dtype=float)
-    total_groups = len(group_ids)
-    for idx, gid in enumerate(group_ids, start=1):
-        model_path = models_dir / f"group_{gid}.pkl"
-        if not model_path.exists():
-            if verbose:
-                print(f"[{idx}/{total_groups}] No model file for group {gid}, "
-                      f"leaving forecast as NaN")
-            continue
-
-        # --- Baseline: same hour one week earlier
-        baseline = build_weekly_baseline_48h(consumption_df=cons_hourly,
-                                         forecast_index=forecast_index)
-
-
+    model_ids = group_ids
+    if hierarchical:
+        nodes = group_nodes(data.group_metadata, group_ids)
+        model_ids = node_ids(nodes)
         if verbose:
-            print(f"[{idx}/{total_groups}] Forecasting group {gid} using {model_path.name}...")
-        with open(model_path, "rb") as f:
-            results = pickle.load(f)
-        steps = len(forecast_index)
-        fc = results.get_forecast(steps=steps, exog=exog_future)
-        yhat = fc.predicted_mean
-        residual_bias = getattr(results, "residual_bias", 0.0)
-        yhat_corrected = yhat + residual_bias
-        yhat_corrected.index = forecast_index
+            print(f"Forecasting {len(model_ids)} hierarchy nodes")
+    forecasts = forecast_groups(
+        models_dir,
+        model_ids,
+        exog_future,
+        steps=len(forecast_index),
+        mode=mode,
+        workers=workers,
+        verbose=verbose,
+        model_format=model_format,
+        backend=backend,
+        with_variance=return_variance,
+    )
+    var_df = None
+    if return_variance:
+        forecast_df, var_df = assemble_moment_frames(forecasts, forecast_index, model_ids)
+    else:
+        forecast_df = assemble_forecast_frame(forecasts, forecast_index, model_ids)
+    if hierarchical:
+        history = cons_hourly[group_ids].iloc[-SHARE_DAYS_48H * 24:]
+        if return_variance:
+            forecast_df, var_df = forecast_groups_from_nodes(
+                forecast_df, history, nodes, hour_of_week, node_var=var_df
+            )
+        else:
+            forecast_df = forecast_groups_from_nodes(forecast_df, history, nodes, hour_of_week)
+    if variant == "residual":
+        # Final forecast: baseline (same hour one week earlier) + predicted residual
+        baseline = build_weekly_baseline_48h(
+            consumption_df=data.consumption_store,
+            forecast_index=forecast_index,
+        )[group_ids]
+        forecast_df = baseline + forecast_df
+    if return_variance:
+        return forecast_df, var_df
+    return forecast_df
 
-        # Final forecast: baseline + predicted residual
-        y_baseline = baseline[gid]
-        yhat = y_baseline + yhat_corrected
-        yhat.index = forecast_index
+def forecast_48h_quantiles(
+    quantiles=QUANTILES,
+    **forecast_kwargs,
+) -> Tuple[pd.DataFrame, Dict[float, pd.DataFrame]]:
+    """
+    Point forecasts and analytic quantile forecasts (P10/P50/P90 by default)
+    from the state space forecast variance; forecast_kwargs as for
+    forecast_48h. The weekly baseline of the residual variant is treated as
+    known, so it shifts the quantiles without widening them.
+    """
+    forecast_df, var_df = forecast_48h(return_variance=True, **forecast_kwargs)
+    return forecast_df, forecast_quantiles(forecast_df, var_df, quantiles)
 
-        forecast_df[gid] = yhat_corrected
-    return forecast_df
+def forecast_48h_price_scenarios(
+    price_scenarios,
+    models_dir: Path | None = None,
+    verbose: bool = True,
+    max_groups: Optional[int] = None,
+    data: PipelineData | None = None,
+    model_format: str = "compact",
+    variant: str = "sarimax",
+    hierarchical: bool = False,
+    mode: str = "serial",
+    workers: Optional[int] = None,
+    backend: str = "statsmodels",
+    return_variance: bool = False,
+) -> ScenarioForecast:
+    """
+    48h forecasts under price scenarios, an (n_scenarios x 48) array of
+    hourly prices on data.forecast_index_48h. Every model is forecast once
+    at the default future prices (build_future_exog_48h); since the models
+    are linear in the exog, a scenario only adds its price deviation times
+    each group's price coefficient. Returns (scenarios x hours x groups)
+    values, plus the forecast variance with return_variance. The other
+    arguments are those of forecast_48h.
+    """
+    if models_dir is None:
+        models_dir = default_models_dir_48h(variant, hierarchical)
+    if data is None:
+        data = PipelineData.load()
+    reference = data.exog_future_48h[PRICE_COLUMN].to_numpy(dtype=float)
+    scenarios = scenario_matrix(price_scenarios, len(reference))
+    forecast_df = forecast_48h(
+        models_dir=models_dir,
+        verbose=verbose,
+        max_groups=max_groups,
+        data=data,
+        mode=mode,
+        workers=workers,
+        model_format=model_format,
+        variant=variant,
+        backend=backend,
+        hierarchical=hierarchical,
+        return_variance=return_variance,
+    )
+    variance = None
+    if return_variance:
+        forecast_df, variance = forecast_df
+    group_ids = list(forecast_df.columns)
+    model_ids = group_ids
+    if hierarchical:
+        nodes = group_nodes(data.group_metadata, group_ids)
+        model_ids = node_ids(nodes)
+    coefficients = exog_coefficients(models_dir, model_ids, PRICE_COLUMN, model_format)
+    # forecast change per unit of price, per hour and group (NaN without a model)
+    response = assemble_forecast_frame(
+        {gid: np.full(len(reference), coef) for gid, coef in coefficients.items()},
+        forecast_df.index,
+        model_ids,
+    )
+    if hierarchical:
+        # reconciliation and the share split are linear too
+        history = data.consumption[group_ids].iloc[-SHARE_DAYS_48H * 24:]
+        response = forecast_groups_from_nodes(response, history, nodes, hour_of_week)
+    if verbose:
+        print(f"Applying {len(scenarios)} price scenarios to {len(group_ids)} groups")
+    return replace(
+        apply_exog_scenarios(forecast_df, response.to_numpy(), reference, scenarios),
+        variance=variance,
+    )
 
 """
 if __name__ == "__main__":
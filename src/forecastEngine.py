@@ -0,0 +1,309 @@
+from __future__ import annotations
+import os
+import pickle
+import time
+from dataclasses import dataclass
+from statistics import NormalDist
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+from batchedSARIMAX import forecast_batch
+from modelStore import CompactSARIMAX, load_model_store, model_store_path
+from pipelineOptions import FORECAST_MODES
+from profiling import PROFILER
+
+QUANTILES = (0.1, 0.5, 0.9)
+
+
+def _forecast_results(results, steps: int, exog_future: pd.DataFrame | None, with_variance: bool = False):
+    fc = results.get_forecast(steps=steps, exog=exog_future)
+    yhat = np.asarray(fc.predicted_mean, dtype=float)
+    yhat = yhat + getattr(results, "residual_bias", 0.0)
+    if with_variance:
+        return yhat, np.asarray(fc.var_pred_mean, dtype=float)
+    return yhat
+
+
+def _forecast_path(model_path: Path, steps: int, exog_future, with_variance: bool = False):
+    start = time.perf_counter()
+    with open(model_path, "rb") as f:
+        results = pickle.load(f)
+    return _forecast_results(results, steps, exog_future, with_variance), time.perf_counter() - start
+
+
+def _forecast_payload(payload: bytes, steps: int, exog_future, with_variance: bool = False):
+    start = time.perf_counter()
+    values = _forecast_results(pickle.loads(payload), steps, exog_future, with_variance)
+    return values, time.perf_counter() - start
+
+
+def _read_bytes(model_path: Path) -> bytes:
+    with open(model_path, "rb") as f:
+        return f.read()
+
+
+def _forecast_compact(
+    store_path: Path,
+    group_ids: List,
+    exog_future: pd.DataFrame | None,
+    steps: int,
+    verbose: bool,
+    with_variance: bool = False,
+) -> Dict[object, np.ndarray]:
+    models = load_model_store(store_path, group_ids)
+    if verbose:
+        print(f"Loaded {len(models)} compact models from {store_path.name}")
+        missing = [str(gid) for gid in group_ids if gid not in models]
+        if missing:
+            print(f"No model for groups {', '.join(missing)}, leaving forecasts as NaN")
+    forecasts = {}
+    for gid, model in models.items():
+        start = time.perf_counter()
+        if with_variance:
+            forecasts[gid] = model.forecast_moments(exog_future, steps)
+        else:
+            forecasts[gid] = model.forecast(exog_future, steps)
+        PROFILER.record(f"forecast:{store_path.stem}", time.perf_counter() - start)
+    return forecasts
+
+
+def _forecast_batched(
+    store_path: Path,
+    group_ids: List,
+    exog_future: pd.DataFrame | None,
+    steps: int,
+    verbose: bool,
+    with_variance: bool = False,
+) -> Dict[object, np.ndarray]:
+    models = load_model_store(store_path, group_ids)
+    if verbose:
+        print(f"Loaded {len(models)} compact models from {store_path.name}, forecasting them as one batch")
+    start = time.perf_counter()
+    forecasts = forecast_batch(models, exog_future, steps)
+    if not with_variance:
+        forecasts = {gid: mean for gid, (mean, _) in forecasts.items()}
+    PROFILER.record(f"forecast:{store_path.stem}:batched", time.perf_counter() - start)
+    return forecasts
+
+
+def forecast_groups(
+    models_dir: Path,
+    group_ids: List,
+    exog_future: pd.DataFrame | None,
+    steps: int,
+    mode: str = "serial",
+    workers: Optional[int] = None,
+    verbose: bool = True,
+    model_format: str = "compact",
+    backend: str = "statsmodels",
+    with_variance: bool = False,
+) -> Dict[object, np.ndarray]:
+    """
+    Forecast every group that has a model for models_dir.
+
+    With backend="batched" all compact models are stacked and forecast in
+    one vectorized recursion (batchedSARIMAX.forecast_batch).
+
+    With model_format="compact" the models come from the compact store next
+    to models_dir (see modelStore) and are forecast in-process, which is cheap
+    enough that mode does not apply. If there is no store yet, or with
+    model_format="pickle", get_forecast is run on the group_{gid}.pkl files:
+
+    serial  - load and forecast one group after the other.
+    thread  - a thread pool loads, unpickles and forecasts.
+    process - a thread pool reads the pickle files, the raw bytes are handed
+              to a process pool that unpickles them and runs get_forecast.
+
+    Returns {gid: forecast values}; groups without a model file are missing.
+    With with_variance=True the values are (mean, variance) pairs.
+    """
+    if mode not in FORECAST_MODES:
+        raise ValueError(f"Unknown forecast mode {mode!r}, expected one of {FORECAST_MODES}")
+    models_dir = Path(models_dir)
+    total = len(group_ids)
+    store_path = model_store_path(models_dir)
+    if model_format == "compact" or backend == "batched":
+        if store_path.exists():
+            run = _forecast_batched if backend == "batched" else _forecast_compact
+            return run(store_path, group_ids, exog_future, steps, verbose, with_variance)
+        if verbose:
+            print(f"No compact model store at {store_path}, falling back to pickled models")
+    paths = {}
+    for idx, gid in enumerate(group_ids, start=1):
+        model_path = models_dir / f"group_{gid}.pkl"
+        if model_path.exists():
+            paths[gid] = model_path
+        elif verbose:
+            print(f"[{idx}/{total}] No model file for group {gid}, leaving forecast as NaN")
+
+    forecasts: Dict[object, np.ndarray] = {}
+    if mode == "serial":
+        for idx, (gid, model_path) in enumerate(paths.items(), start=1):
+            if verbose:
+                print(f"[{idx}/{len(paths)}] Forecasting group {gid} using {model_path.name}...")
+            forecasts[gid], seconds = _forecast_path(model_path, steps, exog_future, with_variance)
+            PROFILER.record(f"forecast:{models_dir.name}", seconds)
+        return forecasts
+
+    workers = workers or os.cpu_count() or 1
+    if mode == "thread":
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                pool.submit(_forecast_path, path, steps, exog_future, with_variance): gid
+                for gid, path in paths.items()
+            }
+            for idx, future in enumerate(as_completed(futures), start=1):
+                gid = futures[future]
+                forecasts[gid], seconds = future.result()
+                PROFILER.record(f"forecast:{models_dir.name}", seconds)
+                if verbose:
+                    print(f"[{idx}/{len(paths)}] Forecasted group {gid}")
+        return forecasts
+
+    with ThreadPoolExecutor(max_workers=workers) as io_pool, \
+            ProcessPoolExecutor(max_workers=workers) as cpu_pool:
+        reads = {io_pool.submit(_read_bytes, path): gid for gid, path in paths.items()}
+        futures = {}
+        for read in as_completed(reads):
+            futures[cpu_pool.submit(
+                _forecast_payload, read.result(), steps, exog_future, with_variance
+            )] = reads[read]
+        for idx, future in enumerate(as_completed(futures), start=1):
+            gid = futures[future]
+            forecasts[gid], seconds = future.result()
+            PROFILER.record(f"forecast:{models_dir.name}", seconds)
+            if verbose:
+                print(f"[{idx}/{len(paths)}] Forecasted group {gid}")
+    return forecasts
+
+
+def assemble_forecast_frame(
+    forecasts: Dict[object, np.ndarray],
+    forecast_index: pd.DatetimeIndex,
+    group_ids: List,
+) -> pd.DataFrame:
+    """
+    Build the wide forecast frame in one block; groups without a forecast
+    stay NaN.
+    """
+    values = np.full((len(forecast_index), len(group_ids)), np.nan)
+    for col, gid in enumerate(group_ids):
+        if gid in forecasts:
+            values[:, col] = forecasts[gid]
+    return pd.DataFrame(values, index=forecast_index, columns=group_ids)
+
+
+def assemble_moment_frames(
+    forecasts: Dict[object, Tuple[np.ndarray, np.ndarray]],
+    forecast_index: pd.DatetimeIndex,
+    group_ids: List,
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Mean and variance frames from forecast_groups(..., with_variance=True)."""
+    means = {gid: mean for gid, (mean, _) in forecasts.items()}
+    variances = {gid: var for gid, (_, var) in forecasts.items()}
+    return (
+        assemble_forecast_frame(means, forecast_index, group_ids),
+        assemble_forecast_frame(variances, forecast_index, group_ids),
+    )
+
+
+def forecast_quantiles(
+    mean_df: pd.DataFrame,
+    var_df: pd.DataFrame,
+    quantiles=QUANTILES,
+) -> Dict[float, pd.DataFrame]:
+    """
+    Gaussian quantile frames mean + z_q * sd from the state space forecast
+    variance, for all groups and steps at once.
+    """
+    mean = mean_df.to_numpy()
+    sd = np.sqrt(np.clip(var_df.to_numpy(), 0.0, None))
+    return {
+        q: pd.DataFrame(mean + NormalDist().inv_cdf(q) * sd, index=mean_df.index, columns=mean_df.columns)
+        for q in quantiles
+    }
+
+
+def exog_coefficient(model, name: str) -> float:
+    """
+    Regression coefficient of exog column name in a compact model or
+    statsmodels results; 0.0 if the model was fitted without that column.
+    """
+    if isinstance(model, CompactSARIMAX):
+        names, params, param_names = model.exog_names, model.params, model.param_names
+    else:
+        names, params, param_names = model.model.exog_names or [], model.params, model.model.param_names
+    if name not in names:
+        return 0.0
+    return float(np.asarray(params)[list(param_names).index(name)])
+
+
+def exog_coefficients(
+    models_dir: Path,
+    group_ids: List,
+    name: str,
+    model_format: str = "compact",
+) -> Dict[object, float]:
+    """
+    Coefficient of exog column name for every group that has a model, read
+    from the compact store next to models_dir or, without one, the pickles.
+    """
+    models_dir = Path(models_dir)
+    store_path = model_store_path(models_dir)
+    if model_format == "compact" and store_path.exists():
+        models = load_model_store(store_path, group_ids)
+        return {gid: exog_coefficient(model, name) for gid, model in models.items()}
+    coefficients = {}
+    for gid in group_ids:
+        model_path = models_dir / f"group_{gid}.pkl"
+        if model_path.exists():
+            with open(model_path, "rb") as f:
+                coefficients[gid] = exog_coefficient(pickle.load(f), name)
+    return coefficients
+
+
+@dataclass
+class ScenarioForecast:
+    """
+    Forecasts under exog scenarios: values[s, t, g] is the forecast of group
+    group_ids[g] at forecast_index[t] under scenario s. The forecast variance
+    does not depend on the exog, so variance (hours x groups), when
+    requested, holds for every scenario.
+    """
+    values: np.ndarray
+    forecast_index: pd.DatetimeIndex
+    group_ids: List
+    variance: Optional[pd.DataFrame] = None
+
+    def frame(self, scenario: int) -> pd.DataFrame:
+        """The wide forecast frame of one scenario."""
+        return pd.DataFrame(self.values[scenario], index=self.forecast_index, columns=self.group_ids)
+
+
+def scenario_matrix(scenarios, steps: int) -> np.ndarray:
+    """(n_scenarios, steps) float array; a single path may be passed as 1-D."""
+    scenarios = np.atleast_2d(np.asarray(scenarios, dtype=float))
+    if scenarios.ndim != 2 or scenarios.shape[1] != steps:
+        raise ValueError(
+            f"Expected scenarios of shape (n_scenarios, {steps}), got {scenarios.shape}"
+        )
+    return scenarios
+
+
+def apply_exog_scenarios(
+    forecast_df: pd.DataFrame,
+    response: np.ndarray,
+    reference: np.ndarray,
+    scenarios: np.ndarray,
+) -> ScenarioForecast:
+    """
+    The forecast is linear in the exog, so under a scenario it is the
+    forecast at the reference path plus the scenario's deviation from that
+    path times the response (forecast change per unit of the exog, steps x
+    groups). All scenarios are computed in one broadcast.
+    """
+    deviation = scenarios - reference
+    values = forecast_df.to_numpy()[None, :, :] + deviation[:, :, None] * response[None, :, :]
+    return ScenarioForecast(values, forecast_df.index, list(forecast_df.columns))
@@ -0,0 +1,540 @@
+"""
+Resident forecast server. The training data and the 48h and 12m models are
+loaded once and kept in memory, and forecasts for any subset of groups are
+answered over local HTTP, so fresh numbers no longer pay interpreter start-up,
+the workbook parse and a model load per group.
+
+    python src/forecastServer.py --port 8765 --workers 8
+    curl "http://127.0.0.1:8765/forecast/48h?groups=28,29&quantiles=1"
+    curl "http://127.0.0.1:8765/health"
+    curl -X POST "http://127.0.0.1:8765/reload"
+    curl -X POST "http://127.0.0.1:8765/scenarios/48h?groups=28" -d '{"prices": [[...48 prices...], ...]}'
+
+Models come from the compact store of a horizon or, without one (or with
+--model-format pickle), from its group_*.pkl files. Model files are checked
+for changes at most every poll_seconds and reloaded when their mtime moved;
+of the pickles, only the changed ones are read again. A model's forecast
+(mean and variance) is computed on its first request and kept until the
+model changes. The training workbook is checked as well: when its content
+changes, the forecast index, future exog and residual baseline are rebuilt
+from it. Models that do not end at the last training period of the current
+data (e.g. not yet retrained after the workbook moved on) are not served;
+they are listed as "stale" in the response. Price scenarios reuse those forecasts: the scenario's
+deviation from the default future prices times each model's price
+coefficient is added to them. Requests are served by a fixed pool of threads.
+"""
+from __future__ import annotations
+import argparse
+import json
+import pickle
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, replace
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+from urllib.parse import parse_qs, urlparse
+import numpy as np
+import pandas as pd
+from dataProcessing import VARIANTS_48H, build_weekly_baseline_48h
+from forecast12Months import default_models_dir_12m
+from forecast48Hours import PRICE_COLUMN, default_models_dir_48h
+from forecastEngine import (
+    QUANTILES,
+    _forecast_results,
+    apply_exog_scenarios,
+    exog_coefficient,
+    forecast_quantiles,
+    scenario_matrix,
+)
+from loadData import load_all_training_data, workbook_digest
+from modelStore import MODEL_FORMATS, CompactSARIMAX, load_model_store, model_store_path
+from pipelineData import PipelineData
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+POLL_SECONDS = 1.0
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S.000Z"
+
+
+def _group_id(name: str):
+    return int(name) if name.isdigit() else name
+
+
+def _last_timestamp(model) -> Optional[int]:
+    """ns timestamp of a model's last observation, where it is known."""
+    if isinstance(model, CompactSARIMAX):
+        return model.last_timestamp
+    index = getattr(getattr(model, "model", None), "_index", None)
+    return int(index.asi8[-1]) if hasattr(index, "asi8") and len(index) else None
+
+
+@dataclass
+class _Inputs:
+    """The data side of a horizon, swapped as a whole when the data changes."""
+    forecast_index: pd.DatetimeIndex
+    exog_future: pd.DataFrame | None
+    baseline: pd.DataFrame | None
+    # last training period (ns) the models have to end at; None: unchecked
+    last_timestamp: Optional[int]
+
+    @property
+    def timestamps(self) -> List[str]:
+        return list(self.forecast_index.strftime(TIMESTAMP_FORMAT))
+
+
+class ResidentHorizon:
+    """
+    The models of one horizon with the mtime of the file each came from,
+    their cached forecasts, and the horizon's forecast index and future exog.
+    last_timestamp is the last training period the forecast index follows;
+    models ending elsewhere are refused as stale.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        models_dir: Path | str,
+        forecast_index: pd.DatetimeIndex,
+        exog_future: pd.DataFrame | None,
+        baseline: pd.DataFrame | None = None,
+        model_format: str = "compact",
+        poll_seconds: float = POLL_SECONDS,
+        scenario_column: Optional[str] = None,
+        last_timestamp: Optional[int] = None,
+    ):
+        self.name = name
+        self.models_dir = Path(models_dir)
+        self.store_path = model_store_path(self.models_dir)
+        self.inputs = _Inputs(forecast_index, exog_future, baseline, last_timestamp)
+        self.model_format = model_format
+        self.poll_seconds = poll_seconds
+        self.scenario_column = scenario_column
+        self.source: Optional[str] = None
+        self.models: Dict[object, object] = {}
+        self.forecasts: Dict[object, Tuple[np.ndarray, np.ndarray]] = {}
+        self._mtimes: Dict[object, int] = {}
+        self._checked = 0.0
+        self._lock = threading.Lock()
+        self.refresh(force=True)
+
+    def set_inputs(
+        self,
+        forecast_index: pd.DatetimeIndex,
+        exog_future: pd.DataFrame | None,
+        baseline: pd.DataFrame | None = None,
+        last_timestamp: Optional[int] = None,
+    ) -> None:
+        """Swap in new data-side inputs; the cached forecasts are dropped."""
+        with self._lock:
+            self.inputs = _Inputs(forecast_index, exog_future, baseline, last_timestamp)
+            self.forecasts = {}
+
+    def _snapshot(self) -> Tuple[_Inputs, Dict[object, object], Dict[object, Tuple[np.ndarray, np.ndarray]]]:
+        with self._lock:
+            return self.inputs, self.models, self.forecasts
+
+    def stale(self, group_ids: Optional[Sequence] = None) -> List:
+        """Groups whose model does not end at the inputs' last training period."""
+        inputs, models, _ = self._snapshot()
+        if inputs.last_timestamp is None:
+            return []
+        group_ids = list(models) if group_ids is None else group_ids
+        return [
+            gid for gid in group_ids
+            if gid in models and _last_timestamp(models[gid]) not in (None, inputs.last_timestamp)
+        ]
+
+    def refresh(self, force: bool = False) -> List:
+        """Reload the models whose file changed; returns their group ids."""
+        if not force and time.monotonic() - self._checked < self.poll_seconds:
+            return []
+        with self._lock:
+            self._checked = time.monotonic()
+            if self.model_format == "compact" and self.store_path.exists():
+                return self._refresh_store()
+            return self._refresh_pickles()
+
+    def _refresh_store(self) -> List:
+        mtime = self.store_path.stat().st_mtime_ns
+        if self.source == "compact" and self._mtimes.get(self.store_path) == mtime:
+            return []
+        models = load_model_store(self.store_path)
+        # swap whole dicts, so requests in flight keep a consistent snapshot
+        self.models, self.forecasts = models, {}
+        self._mtimes = {self.store_path: mtime}
+        self.source = "compact"
+        return list(models)
+
+    def _refresh_pickles(self) -> List:
+        if self.source != "pickle":
+            self.models, self.forecasts, self._mtimes = {}, {}, {}
+            self.source = "pickle"
+        paths = {_group_id(p.stem[len("group_"):]): p for p in self.models_dir.glob("group_*.pkl")}
+        models = {gid: model for gid, model in self.models.items() if gid in paths}
+        forecasts = {gid: fc for gid, fc in self.forecasts.items() if gid in paths}
+        changed = []
+        for gid, path in paths.items():
+            try:
+                mtime = path.stat().st_mtime_ns
+                if self._mtimes.get(gid) == mtime:
+                    continue
+                with open(path, "rb") as f:
+                    models[gid] = pickle.load(f)
+            except (OSError, EOFError, pickle.UnpicklingError):
+                continue  # removed or still being written; retried on the next check
+            self._mtimes[gid] = mtime
+            forecasts.pop(gid, None)
+            changed.append(gid)
+        self.models, self.forecasts = models, forecasts
+        return changed
+
+    def moments(
+        self,
+        group_ids: Sequence,
+        inputs: Optional[_Inputs] = None,
+    ) -> Dict[object, Tuple[np.ndarray, np.ndarray]]:
+        """
+        (mean, variance) per group that has a model in sync with the inputs,
+        computed once per model.
+        """
+        self.refresh()
+        current, models, forecasts = self._snapshot()
+        if inputs is not None and inputs is not current:
+            forecasts = {}  # computed for other inputs: do not cache
+        inputs = inputs or current
+        steps = len(inputs.forecast_index)
+        stale = set(self.stale(group_ids))
+        moments = {}
+        for gid in group_ids:
+            if gid not in models or gid in stale:
+                continue
+            if gid not in forecasts:
+                model = models[gid]
+                if isinstance(model, CompactSARIMAX):
+                    forecasts[gid] = model.forecast_moments(inputs.exog_future, steps)
+                else:
+                    forecasts[gid] = _forecast_results(model, steps, inputs.exog_future, with_variance=True)
+            moments[gid] = forecasts[gid]
+        return moments
+
+    def _mean_frame(self, moments: Dict[object, Tuple[np.ndarray, np.ndarray]], inputs: _Inputs) -> pd.DataFrame:
+        found = list(moments)
+        mean = pd.DataFrame(
+            np.column_stack([moments[gid][0] for gid in found]) if found else np.empty((len(inputs.forecast_index), 0)),
+            index=inputs.forecast_index, columns=found,
+        )
+        if inputs.baseline is not None:
+            # residual variant: the weekly baseline plus the predicted residual
+            mean = mean + inputs.baseline.reindex(columns=found).to_numpy(dtype=float)
+        return mean
+
+    def forecast(self, group_ids: Optional[Sequence] = None, quantiles: Sequence[float] = ()) -> dict:
+        """JSON-ready forecasts of group_ids (all groups with a model if None)."""
+        self.refresh()
+        inputs, models, _ = self._snapshot()
+        if group_ids is None:
+            group_ids = list(models)
+        moments = self.moments(group_ids, inputs)
+        found = list(moments)
+        mean = self._mean_frame(moments, inputs)
+        stale = self.stale(group_ids)
+        payload = {
+            "horizon": self.name,
+            "measured_at": inputs.timestamps,
+            "forecasts": {str(gid): mean[gid].tolist() for gid in found},
+            "missing": [gid for gid in group_ids if gid not in moments and gid not in stale],
+            "stale": stale,
+        }
+        if quantiles:
+            var = pd.DataFrame(
+                np.column_stack([moments[gid][1] for gid in found]) if found else np.empty((len(inputs.forecast_index), 0)),
+                index=inputs.forecast_index, columns=found,
+            )
+            payload["quantiles"] = {
+                f"p{round(q * 100):02d}": {str(gid): frame[gid].tolist() for gid in found}
+                for q, frame in forecast_quantiles(mean, var, quantiles).items()
+            }
+        return payload
+
+    def scenarios(self, values, group_ids: Optional[Sequence] = None) -> dict:
+        """
+        JSON-ready forecasts of group_ids under scenarios of the scenario
+        column, an (n_scenarios x steps) array: forecasts[gid][s][t].
+        """
+        if self.scenario_column is None:
+            raise ValueError(f"The {self.name} models have no scenario column")
+        self.refresh()
+        inputs, models, _ = self._snapshot()
+        reference = inputs.exog_future[self.scenario_column].to_numpy(dtype=float)
+        scenarios = scenario_matrix(values, len(reference))
+        if group_ids is None:
+            group_ids = list(models)
+        moments = self.moments(group_ids, inputs)
+        found = [gid for gid in moments if gid in models]
+        moments = {gid: moments[gid] for gid in found}
+        stale = self.stale(group_ids)
+        response = np.array([exog_coefficient(models[gid], self.scenario_column) for gid in found])
+        result = apply_exog_scenarios(
+            self._mean_frame(moments, inputs),
+            np.broadcast_to(response, (len(reference), len(found))),
+            reference,
+            scenarios,
+        )
+        return {
+            "horizon": self.name,
+            "measured_at": inputs.timestamps,
+            "scenarios": len(scenarios),
+            "forecasts": {str(gid): result.values[:, :, col].tolist() for col, gid in enumerate(found)},
+            "missing": [gid for gid in group_ids if gid not in moments and gid not in stale],
+            "stale": stale,
+        }
+
+    def status(self) -> dict:
+        return {
+            "models": len(self.models),
+            "stale": len(self.stale()),
+            "source": self.source,
+            "models_dir": str(self.models_dir),
+        }
+
+
+def _horizon_inputs(data: PipelineData, variant_48h: str) -> Dict[str, dict]:
+    """set_inputs() arguments of both horizons, from data."""
+    baseline = None
+    if variant_48h == "residual":
+        baseline = build_weekly_baseline_48h(data.consumption_store, data.forecast_index_48h)
+    exog_12m = data.exog_future_12m
+    return {
+        "48h": dict(
+            forecast_index=data.forecast_index_48h,
+            exog_future=data.exog_future_48h,
+            baseline=baseline,
+            last_timestamp=(data.forecast_index_48h[0] - pd.Timedelta(hours=1)).value,
+        ),
+        "12m": dict(
+            forecast_index=exog_12m.index,
+            exog_future=exog_12m,
+            last_timestamp=data.monthly_training[0].index[-1].value,
+        ),
+    }
+
+
+class ForecastService:
+    """
+    Both horizons over data loaded once; what the HTTP handler calls. When
+    the data came from a workbook, its digest is checked at most every
+    poll_seconds and the horizons' inputs are rebuilt when it changed.
+    """
+
+    def __init__(
+        self,
+        data: PipelineData | None = None,
+        variant_48h: str = "sarimax",
+        model_format: str = "compact",
+        poll_seconds: float = POLL_SECONDS,
+        models_dir_48h: Path | None = None,
+        models_dir_12m: Path | None = None,
+    ):
+        if data is None:
+            data = PipelineData.load()
+        if models_dir_48h is None:
+            models_dir_48h = default_models_dir_48h(variant_48h)
+        self.data = data
+        self.variant_48h = variant_48h
+        self.poll_seconds = poll_seconds
+        self.digest = self._digest()
+        self._checked = time.monotonic()
+        self._lock = threading.Lock()
+        inputs = _horizon_inputs(data, variant_48h)
+        common = dict(model_format=model_format, poll_seconds=poll_seconds)
+        self.horizons = {
+            "48h": ResidentHorizon(
+                "48h", models_dir_48h, **inputs["48h"], scenario_column=PRICE_COLUMN, **common
+            ),
+            "12m": ResidentHorizon("12m", models_dir_12m or default_models_dir_12m(), **inputs["12m"], **common),
+        }
+
+    def _digest(self) -> Optional[str]:
+        path = self.data.source_path
+        if path is None or path.suffix.lower() != ".xlsx" or not path.exists():
+            return None
+        return workbook_digest(path)
+
+    def refresh_data(self, force: bool = False) -> bool:
+        """Reload the workbook and rebuild the horizons' inputs if it changed."""
+        if self.digest is None or (not force and time.monotonic() - self._checked < self.poll_seconds):
+            return False
+        with self._lock:
+            self._checked = time.monotonic()
+            digest = self._digest()
+            if digest is None or digest == self.digest:
+                return False
+            groups, consumption, prices = load_all_training_data(self.data.source_path)
+            data = replace(self.data, groups=groups, consumption=consumption, prices=prices)
+            for name, kwargs in _horizon_inputs(data, self.variant_48h).items():
+                self.horizons[name].set_inputs(**kwargs)
+            self.data, self.digest = data, digest
+            return True
+
+    def forecast(self, horizon: str, group_ids: Optional[Sequence] = None, quantiles: Sequence[float] = ()) -> dict:
+        self.refresh_data()
+        return self.horizons[horizon].forecast(group_ids, quantiles)
+
+    def scenarios(self, horizon: str, values, group_ids: Optional[Sequence] = None) -> dict:
+        self.refresh_data()
+        return self.horizons[horizon].scenarios(values, group_ids)
+
+    def reload(self) -> dict:
+        reloaded = {"data": self.refresh_data(force=True)}
+        reloaded.update({name: len(h.refresh(force=True)) for name, h in self.horizons.items()})
+        return reloaded
+
+    def status(self) -> dict:
+        return {name: h.status() for name, h in self.horizons.items()}
+
+
+def _query_groups(query: dict) -> Optional[List]:
+    if "groups" not in query:
+        return None
+    return [_group_id(g) for g in ",".join(query["groups"]).split(",") if g]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def _send(self, code: int, payload: dict) -> None:
+        body = json.dumps(payload).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        url = urlparse(self.path)
+        parts = url.path.strip("/").split("/")
+        service = self.server.service
+        if parts == ["health"]:
+            return self._send(200, service.status())
+        if len(parts) != 2 or parts[0] != "forecast" or parts[1] not in service.horizons:
+            return self._send(404, {"error": f"unknown path {url.path}; use /forecast/48h or /forecast/12m"})
+        query = parse_qs(url.query)
+        group_ids = _query_groups(query)
+        quantiles: Sequence[float] = ()
+        raw = query.get("quantiles", [""])[0]
+        if raw in ("1", "true"):
+            quantiles = QUANTILES
+        elif raw not in ("", "0", "false"):
+            try:
+                quantiles = [float(q) for q in raw.split(",")]
+            except ValueError:
+                return self._send(400, {"error": "quantiles must be 1 or a list like 0.1,0.5,0.9"})
+            if not all(0 < q < 1 for q in quantiles):
+                return self._send(400, {"error": "quantiles must lie strictly between 0 and 1"})
+        self._send(200, service.forecast(parts[1], group_ids, quantiles))
+
+    def do_POST(self) -> None:
+        url = urlparse(self.path)
+        parts = url.path.strip("/").split("/")
+        service = self.server.service
+        if parts == ["reload"]:
+            return self._send(200, {"reloaded": service.reload()})
+        if len(parts) != 2 or parts[0] != "scenarios" or parts[1] not in service.horizons:
+            return self._send(404, {"error": f"unknown path {url.path}; use /reload or /scenarios/48h"})
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            prices = body["prices"]
+        except (ValueError, KeyError, TypeError):
+            return self._send(400, {"error": 'expected a JSON body {"prices": [[...], ...]}'})
+        try:
+            payload = service.scenarios(parts[1], prices, _query_groups(parse_qs(url.query)))
+        except ValueError as exc:
+            return self._send(400, {"error": str(exc)})
+        self._send(200, payload)
+
+    def log_message(self, format, *args) -> None:
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class ForecastServer(HTTPServer):
+    """HTTPServer whose requests run on a shared, fixed-size thread pool."""
+
+    def __init__(self, address, service: ForecastService, workers: int = 4, verbose: bool = True):
+        super().__init__(address, _Handler)
+        self.service = service
+        self.verbose = verbose
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+
+    def process_request(self, request, client_address) -> None:
+        self.pool.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address) -> None:
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self) -> None:
+        super().server_close()
+        self.pool.shutdown(wait=True)
+
+
+def serve(
+    host: str = DEFAULT_HOST,
+    port: int = DEFAULT_PORT,
+    workers: int = 4,
+    variant_48h: str = "sarimax",
+    model_format: str = "compact",
+    poll_seconds: float = POLL_SECONDS,
+    verbose: bool = True,
+) -> None:
+    start = time.perf_counter()
+    service = ForecastService(variant_48h=variant_48h, model_format=model_format, poll_seconds=poll_seconds)
+    if verbose:
+        for name, status in service.status().items():
+            print(f"{name}: {status['models']} {status['source']} models from {status['models_dir']}"
+                  + (f" ({status['stale']} stale, not served)" if status["stale"] else ""))
+        print(f"Loaded in {time.perf_counter() - start:.1f}s; serving on http://{host}:{port} "
+              f"with {workers} workers")
+    server = ForecastServer((host, port), service, workers=workers, verbose=verbose)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Serve 48h and 12m forecasts from models kept in memory."
+    )
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument(
+        "--workers", type=int, default=4,
+        help="Threads serving requests (default: 4).",
+    )
+    parser.add_argument("--variant-48h", choices=VARIANTS_48H, default="sarimax")
+    parser.add_argument("--model-format", choices=MODEL_FORMATS, default="compact")
+    parser.add_argument(
+        "--poll-seconds", type=float, default=POLL_SECONDS,
+        help="Minimum time between checks of the model files for changes.",
+    )
+    parser.add_argument("--quiet", action="store_true", help="Do not log requests.")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = _parse_args()
+    serve(
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        variant_48h=args.variant_48h,
+        model_format=args.model_format,
+        poll_seconds=args.poll_seconds,
+        verbose=not args.quiet,
+    )
@@ -0,0 +1,420 @@
+"""
+Pooled global regression models: one ridge regression per horizon, fitted
+once across all groups on the long (group, time) feature table that
+dataProcessing.build_hourly_feature_table describes (group metadata, price,
+hour_of_week and weekend flags), plus lags of each group's own consumption.
+A group's consumption and lags are divided by its mean consumption over the
+training window, so groups of any size share one set of coefficients and
+groups without a fit of their own are forecast too.
+
+Features of a (group, time) row:
+- hour_of_week (48h) or month (12m), one-hot
+- the group's segment x hour of day (48h) or x month (12m), one-hot
+- 48h: weekend x segment, and the standardized price x product_type
+- the group's segment, product_type, consumption_bucket and macro_region
+- lags that are known over the whole horizon (48h: 48, 168 and 336 hours;
+  12m: 12 months) and the mean of the day (48h) or year (12m) before the
+  shortest of them
+
+The design matrix is never held whole: the normal equations are summed
+over chunks of rows. Forecasting every group is one batched matrix product
+(in chunks of rows as well). The forecast variance is the group's residual
+variance in training, constant over the horizon.
+"""
+from __future__ import annotations
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+from pipelineData import PipelineData
+from pipelineOptions import MODEL_FAMILIES
+from stageCache import content_hash
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+MODELS_DIR = PROJECT_ROOT / "Data" / "models"
+GLOBAL_MODEL_PATH_48H = MODELS_DIR / "global_48h.npz"
+GLOBAL_MODEL_PATH_12M = MODELS_DIR / "global_12m.npz"
+META_LEVELS = ("segment", "product_type", "consumption_bucket", "macro_region")
+RIDGE_ALPHA = 1.0
+CHUNK_ROWS = 50_000
+
+
+@dataclass(frozen=True)
+class _Spec:
+    freq: str
+    lags: Tuple[int, ...]
+    level_window: int
+    hourly: bool
+
+    @property
+    def lookback(self) -> int:
+        """Rows of history the features of a row reach back over."""
+        return max(self.lags) + self.level_window
+
+
+SPECS = {
+    "48h": _Spec("h", (48, 168, 336), 24, True),
+    "12m": _Spec("MS", (12,), 12, False),
+}
+
+
+@dataclass
+class GlobalModel:
+    horizon: str
+    feature_names: List[str]
+    beta: np.ndarray
+    categories: Dict[str, List[str]]
+    window: int
+    price_mean: float
+    price_std: float
+    sigma2: float
+    group_ids: List
+    group_sigma2: np.ndarray
+    fingerprint: str = ""
+
+    @property
+    def spec(self) -> _Spec:
+        return SPECS[self.horizon]
+
+    def save(self, path: Path | str) -> Path:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        arrays = {
+            "horizon": np.array(self.horizon),
+            "feature_names": np.array(self.feature_names),
+            "beta": self.beta,
+            "window": np.array(self.window),
+            "price": np.array([self.price_mean, self.price_std]),
+            "sigma2": np.array(self.sigma2),
+            "group_ids": np.asarray(self.group_ids),
+            "group_sigma2": self.group_sigma2,
+            "fingerprint": np.array(self.fingerprint),
+        }
+        for level, values in self.categories.items():
+            arrays[f"categories.{level}"] = np.array(values, dtype=str)
+        tmp_path = path.with_name(path.stem + ".tmp.npz")
+        np.savez(tmp_path, **arrays)
+        tmp_path.replace(path)
+        return path
+
+    @classmethod
+    def load(cls, path: Path | str) -> "GlobalModel":
+        with np.load(path, allow_pickle=False) as arrays:
+            return cls(
+                horizon=str(arrays["horizon"]),
+                feature_names=arrays["feature_names"].tolist(),
+                beta=arrays["beta"],
+                categories={level: arrays[f"categories.{level}"].tolist() for level in META_LEVELS},
+                window=int(arrays["window"]),
+                price_mean=float(arrays["price"][0]),
+                price_std=float(arrays["price"][1]),
+                sigma2=float(arrays["sigma2"]),
+                group_ids=arrays["group_ids"].tolist(),
+                group_sigma2=arrays["group_sigma2"],
+                fingerprint=str(arrays["fingerprint"]),
+            )
+
+
+def _feature_names(spec: _Spec, categories: Dict[str, List[str]]) -> List[str]:
+    segments = categories["segment"]
+    if spec.hourly:
+        names = [f"hour_of_week={h}" for h in range(168)]
+        names += [f"segment={s}:hour={h}" for s in segments for h in range(24)]
+        names += [f"segment={s}:is_weekend" for s in segments]
+        names += [f"product_type={p}:price" for p in categories["product_type"]]
+    else:
+        names = [f"month={m}" for m in range(1, 13)]
+        names += [f"segment={s}:month={m}" for s in segments for m in range(1, 13)]
+    for level in META_LEVELS:
+        names += [f"{level}={value}" for value in categories[level]]
+    names += [f"lag_{lag}" for lag in spec.lags]
+    names.append(f"level_{spec.level_window}")
+    return names
+
+
+class _FeatureFrame:
+    """
+    The consumption of a set of groups on a regular time grid (history and,
+    for forecasting, the horizon after it), scaled per group, with the
+    calendar, price and metadata arrays the design rows are built from.
+    """
+
+    def __init__(
+        self,
+        spec: _Spec,
+        history: pd.DataFrame,
+        metadata: pd.DataFrame,
+        categories: Dict[str, List[str]],
+        window: int,
+        price: pd.Series | None = None,
+        forecast_index: pd.DatetimeIndex | None = None,
+    ):
+        self.spec = spec
+        end = history.index[-1] if forecast_index is None else max(history.index[-1], forecast_index[-1])
+        self.grid = pd.date_range(history.index[0], end, freq=spec.freq)
+        self.history_end = int(self.grid.get_indexer([history.index[-1]])[0])
+        values = history.reindex(self.grid).to_numpy(dtype=float)
+        values[self.history_end + 1:] = np.nan
+        recent = values[max(self.history_end + 1 - window, 0):self.history_end + 1]
+        with np.errstate(invalid="ignore"):
+            scale = np.nanmean(recent, axis=0) if len(recent) else np.full(values.shape[1], np.nan)
+        scale[~(scale > 0)] = 1.0
+        self.scale = scale
+        self.z = values / scale
+        level = pd.DataFrame(self.z).rolling(spec.level_window, min_periods=spec.level_window).mean()
+        self.level = level.to_numpy()
+        n_groups = values.shape[1]
+        self.n_groups = n_groups
+        meta = metadata.set_index("group_id").reindex(list(history.columns))
+        self.codes = {}
+        for level_name in META_LEVELS:
+            lookup = {value: i for i, value in enumerate(categories[level_name])}
+            self.codes[level_name] = np.array(
+                [lookup.get(value, -1) for value in meta[level_name].astype(str)], dtype=int
+            )
+        self.n_features = len(_feature_names(spec, categories))
+        self.n_segments = len(categories["segment"])
+        self.n_categories = {level_name: len(categories[level_name]) for level_name in META_LEVELS}
+        if spec.hourly:
+            self.calendar = np.asarray(self.grid.dayofweek * 24 + self.grid.hour)
+            self.profile = np.asarray(self.grid.hour)
+            self.weekend = np.asarray(self.grid.dayofweek >= 5, dtype=float)
+            self.price = price.reindex(self.grid).interpolate().ffill().bfill().to_numpy(dtype=float)
+        else:
+            self.calendar = np.asarray(self.grid.month - 1)
+            self.profile = self.calendar
+
+    def training_rows(self, window: int) -> np.ndarray:
+        return np.arange(max(self.history_end + 1 - window, 0), self.history_end + 1)
+
+    def design(self, rows: np.ndarray, price_mean: float = 0.0, price_std: float = 1.0) -> np.ndarray:
+        """Design matrix of rows x groups, time-major ((t0, g0), (t0, g1), ...)."""
+        spec, n_groups = self.spec, self.n_groups
+        n = len(rows) * n_groups
+        X = np.zeros((n, self.n_features))
+        index = np.arange(n)
+        time_rows = np.repeat(rows, n_groups)
+
+        def _one_hot(offset: int, codes: np.ndarray, values=1.0) -> None:
+            known = codes >= 0
+            X[index[known], offset + codes[known]] = values if np.isscalar(values) else values[known]
+
+        segment = np.tile(self.codes["segment"], len(rows))
+        offset = 0
+        n_profile = 24 if spec.hourly else 12
+        n_calendar = 168 if spec.hourly else 12
+        _one_hot(offset, self.calendar[time_rows])
+        offset += n_calendar
+        _one_hot(offset, np.where(segment >= 0, segment * n_profile + self.profile[time_rows], -1))
+        offset += self.n_segments * n_profile
+        if spec.hourly:
+            _one_hot(offset, segment, self.weekend[time_rows])
+            offset += self.n_segments
+            price = (self.price[time_rows] - price_mean) / price_std
+            _one_hot(offset, np.tile(self.codes["product_type"], len(rows)), price)
+            offset += self.n_categories["product_type"]
+        for level_name in META_LEVELS:
+            _one_hot(offset, np.tile(self.codes[level_name], len(rows)))
+            offset += self.n_categories[level_name]
+        for lag in spec.lags:
+            X[:, offset] = self._at(self.z, rows - lag).ravel()
+            offset += 1
+        X[:, offset] = self._at(self.level, rows - spec.lags[0]).ravel()
+        return X
+
+    def _at(self, values: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        out = np.full((len(rows), self.n_groups), np.nan)
+        inside = rows >= 0
+        out[inside] = values[rows[inside]]
+        return out
+
+    def chunks(self, rows: np.ndarray):
+        step = max(1, CHUNK_ROWS // max(self.n_groups, 1))
+        for start in range(0, len(rows), step):
+            yield rows[start:start + step]
+
+
+def _categories(metadata: pd.DataFrame, group_ids: List) -> Dict[str, List[str]]:
+    meta = metadata.set_index("group_id").reindex(group_ids)
+    return {level: sorted(meta[level].dropna().astype(str).unique()) for level in META_LEVELS}
+
+
+def _horizon_inputs(horizon: str, data: PipelineData, max_groups: Optional[int], window: Optional[int]):
+    """
+    History frame of the first max_groups groups, cut to the window and the
+    lookback before it, and the price series (48h) of a horizon.
+    """
+    if horizon == "48h":
+        cons, exog = data.hourly_training
+        price = exog["price"]
+    else:
+        cons, _ = data.monthly_training
+        price = None
+    cons = cons[list(cons.columns)[:max_groups]]
+    if window is not None:
+        cons = cons.iloc[-(window + SPECS[horizon].lookback):]
+    return cons, price
+
+
+def train_global(
+    horizon: str,
+    window: Optional[int] = None,
+    max_groups: Optional[int] = None,
+    model_path: Path | None = None,
+    data: PipelineData | None = None,
+    alpha: float = RIDGE_ALPHA,
+    verbose: bool = True,
+    skip_unchanged: bool = False,
+) -> GlobalModel:
+    """
+    Fit the pooled ridge regression of horizon ("48h" or "12m") on the last
+    window rows (hours or months; all history if None) of every group, and
+    save it to model_path. With skip_unchanged the stored model is kept when
+    it was fitted on the same inputs.
+    """
+    spec = SPECS[horizon]
+    if model_path is None:
+        model_path = GLOBAL_MODEL_PATH_48H if horizon == "48h" else GLOBAL_MODEL_PATH_12M
+    model_path = Path(model_path)
+    if data is None:
+        data = PipelineData.load()
+    cons, price = _horizon_inputs(horizon, data, max_groups, window)
+    group_ids = list(cons.columns)
+    if window is None:
+        window = len(cons)
+    fingerprint = content_hash(
+        horizon, window, alpha, cons,
+        price.reindex(cons.index).to_numpy(dtype=float) if price is not None else [],
+        data.group_metadata[["group_id", *META_LEVELS]].astype(str).to_numpy().tolist(),
+    )
+    if skip_unchanged and model_path.exists():
+        stored = GlobalModel.load(model_path)
+        if stored.fingerprint == fingerprint:
+            if verbose:
+                print(f"Global {horizon} model inputs unchanged, keeping {model_path.name}")
+            return stored
+    categories = _categories(data.group_metadata, group_ids)
+    features = _FeatureFrame(spec, cons, data.group_metadata, categories, window, price)
+    rows = features.training_rows(window)
+    price_mean, price_std = 0.0, 1.0
+    if spec.hourly:
+        window_price = features.price[rows]
+        price_mean, price_std = float(window_price.mean()), float(window_price.std() or 1.0)
+    if verbose:
+        print(f"Fitting global {horizon} ridge model on {len(group_ids)} groups x {len(rows)} "
+              f"{'hours' if spec.hourly else 'months'} ({features.n_features} features)")
+
+    xtx = np.zeros((features.n_features, features.n_features))
+    xty = np.zeros(features.n_features)
+    n_rows = 0
+    for chunk in features.chunks(rows):
+        X = features.design(chunk, price_mean, price_std)
+        y = features.z[chunk].ravel()
+        usable = np.isfinite(y) & np.isfinite(X).all(axis=1)
+        X, y = X[usable], y[usable]
+        xtx += X.T @ X
+        xty += X.T @ y
+        n_rows += len(y)
+    if not n_rows:
+        raise ValueError(
+            f"Not enough history for the global {horizon} model: every row lacks a lag "
+            f"(needs {max(spec.lags) + 1} {'hours' if spec.hourly else 'months'} before the window)"
+        )
+    beta = np.linalg.solve(xtx + alpha * np.eye(len(xty)), xty)
+
+    sse = np.zeros(len(group_ids))
+    counts = np.zeros(len(group_ids))
+    for chunk in features.chunks(rows):
+        X = features.design(chunk, price_mean, price_std)
+        resid = (features.z[chunk].ravel() - X @ beta).reshape(len(chunk), len(group_ids))
+        usable = np.isfinite(resid)
+        sse += np.square(np.where(usable, resid, 0.0)).sum(axis=0)
+        counts += usable.sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        group_sigma2 = sse / counts
+    model = GlobalModel(
+        horizon=horizon,
+        feature_names=_feature_names(spec, categories),
+        beta=beta,
+        categories=categories,
+        window=window,
+        price_mean=price_mean,
+        price_std=price_std,
+        sigma2=float(sse.sum() / counts.sum()),
+        group_ids=group_ids,
+        group_sigma2=group_sigma2,
+        fingerprint=fingerprint,
+    )
+    model.save(model_path)
+    if verbose:
+        print(f"Fitted on {n_rows} rows, residual sd {np.sqrt(model.sigma2):.4f} (relative to the "
+              f"group mean); saved to {model_path}")
+    return model
+
+
+def train_global_48h(train_days: int = 365, **kwargs) -> GlobalModel:
+    return train_global("48h", window=train_days * 24, **kwargs)
+
+
+def train_global_12m(train_months: Optional[int] = None, **kwargs) -> GlobalModel:
+    return train_global("12m", window=train_months, **kwargs)
+
+
+def forecast_global(
+    horizon: str,
+    model_path: Path | None = None,
+    max_groups: Optional[int] = None,
+    data: PipelineData | None = None,
+    verbose: bool = True,
+    return_variance: bool = False,
+):
+    """
+    Forecast every group (or the first max_groups) with the pooled model in
+    one batched predict, on data.forecast_index_48h or the 12m template's
+    months. Groups the model was not fitted on use its pooled residual
+    variance. Lags with no observation are taken at the group mean.
+    """
+    if model_path is None:
+        model_path = GLOBAL_MODEL_PATH_48H if horizon == "48h" else GLOBAL_MODEL_PATH_12M
+    if data is None:
+        data = PipelineData.load()
+    model = GlobalModel.load(model_path)
+    cons, price = _horizon_inputs(horizon, data, max_groups, model.window)
+    group_ids = list(cons.columns)
+    if horizon == "48h":
+        forecast_index = data.forecast_index_48h
+        price = pd.concat([price, data.exog_future_48h["price"]])
+        price = price[~price.index.duplicated(keep="first")]
+    else:
+        forecast_index = data.exog_future_12m.index
+    if verbose:
+        print(f"Forecasting {len(group_ids)} groups x {len(forecast_index)} steps with the global "
+              f"{horizon} model from {Path(model_path).name}")
+    features = _FeatureFrame(
+        model.spec, cons, data.group_metadata, model.categories, model.window, price, forecast_index
+    )
+    rows = features.grid.get_indexer(forecast_index)
+    values = np.empty((len(rows), len(group_ids)))
+    done = 0
+    for chunk in features.chunks(rows):
+        X = features.design(chunk, model.price_mean, model.price_std)
+        X[~np.isfinite(X)] = 1.0  # missing lags: the group mean
+        values[done:done + len(chunk)] = (X @ model.beta).reshape(len(chunk), len(group_ids))
+        done += len(chunk)
+    forecast_df = pd.DataFrame(values * features.scale, index=forecast_index, columns=group_ids)
+    if not return_variance:
+        return forecast_df
+    fitted = dict(zip(model.group_ids, model.group_sigma2))
+    sigma2 = np.array([fitted.get(gid, np.nan) for gid in group_ids])
+    sigma2[~np.isfinite(sigma2)] = model.sigma2
+    var = np.broadcast_to(sigma2 * features.scale ** 2, values.shape)
+    return forecast_df, pd.DataFrame(var.copy(), index=forecast_index, columns=group_ids)
+
+
+def forecast_global_48h(**kwargs):
+    return forecast_global("48h", **kwargs)
+
+
+def forecast_global_12m(**kwargs):
+    return forecast_global("12m", **kwargs)
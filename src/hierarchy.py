@@ -0,0 +1,135 @@
+"""
+Hierarchical forecasting over the group_label hierarchy. Instead of one
+model per group, models are fitted on the aggregate series of every
+segment x product_type node (plus the grand total). The node forecasts are
+reconciled so that the nodes sum to the total, then split over the groups
+of each node with the shares the groups had of their node's consumption in
+recent history (per hour of week for 48h, per month of year for 12m).
+The group forecasts of a node therefore always sum to the node forecast.
+"""
+from __future__ import annotations
+from pathlib import Path
+from typing import Callable, List, Sequence
+import numpy as np
+import pandas as pd
+
+HIERARCHY_LEVELS = ("segment", "product_type")
+TOTAL_NODE = "total"
+SHARE_DAYS_48H = 56
+SHARE_MONTHS_12M = 24
+
+def hierarchical_models_dir(models_dir: Path | str) -> Path:
+    models_dir = Path(models_dir)
+    return models_dir.with_name(f"{models_dir.name}_hierarchical")
+
+def hour_of_week(index: pd.DatetimeIndex) -> np.ndarray:
+    return np.asarray(index.dayofweek * 24 + index.hour)
+
+def month_of_year(index: pd.DatetimeIndex) -> np.ndarray:
+    return np.asarray(index.month)
+
+def group_nodes(
+    metadata: pd.DataFrame,
+    group_ids: Sequence,
+    levels: Sequence[str] = HIERARCHY_LEVELS,
+) -> pd.Series:
+    """Node id (e.g. "Private_Spot") of every group, indexed by group id."""
+    meta = metadata.set_index("group_id").reindex(list(group_ids))
+    labels = meta[list(levels)]
+    missing = labels.isna().any(axis=1)
+    if missing.any():
+        raise ValueError(
+            f"No {'/'.join(levels)} metadata for groups: "
+            f"{', '.join(str(g) for g in labels.index[missing])}"
+        )
+    return labels.astype(str).agg("_".join, axis=1).rename("node")
+
+def node_ids(nodes: pd.Series) -> List[str]:
+    """Series to model: the total first, then the nodes in sorted order."""
+    return [TOTAL_NODE] + sorted(nodes.unique())
+
+def aggregate_to_nodes(cons: pd.DataFrame, nodes: pd.Series) -> pd.DataFrame:
+    """
+    Wide frame of the total and node sums of cons (columns as node_ids).
+    A missing value in a group makes its node and the total missing at that
+    timestamp, so the training windows stay free of partial sums.
+    """
+    values = cons[nodes.index].to_numpy(dtype=float)
+    sums = {TOTAL_NODE: values.sum(axis=1)}
+    node_array = nodes.to_numpy()
+    for node in node_ids(nodes)[1:]:
+        sums[node] = values[:, node_array == node].sum(axis=1)
+    return pd.DataFrame(sums, index=cons.index)
+
+def learn_shares(
+    history: pd.DataFrame,
+    nodes: pd.Series,
+    key: Callable[[pd.DatetimeIndex], np.ndarray],
+) -> pd.DataFrame:
+    """
+    Share of every group in its node's consumption over history, per key
+    value (rows) and group (columns). Shares within a node sum to one; a key
+    value where a node consumed nothing falls back to equal shares.
+    """
+    history = history[nodes.index]
+    sums = history.groupby(key(history.index)).sum()
+    node_array = nodes.to_numpy()
+    values = sums.to_numpy()
+    node_sums = np.empty_like(values)
+    equal = np.empty(len(node_array))
+    for node in np.unique(node_array):
+        members = node_array == node
+        node_sums[:, members] = values[:, members].sum(axis=1, keepdims=True)
+        equal[members] = 1.0 / members.sum()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        shares = values / node_sums
+    unusable = ~(np.isfinite(shares) & (node_sums > 0))
+    shares[unusable] = np.broadcast_to(equal, shares.shape)[unusable]
+    return pd.DataFrame(shares, index=sums.index, columns=sums.columns)
+
+def reconcile(node_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    OLS reconciliation of the total and node forecasts: the gap between the
+    total and the sum of the nodes is spread evenly over all K + 1 series,
+    and the total is replaced by the sum of the reconciled nodes. Rows where
+    any forecast is missing are left as they are.
+    """
+    nodes = node_df.drop(columns=TOTAL_NODE)
+    gap = node_df[TOTAL_NODE] - nodes.sum(axis=1, skipna=False)
+    nodes = nodes.add(gap.fillna(0.0) / (nodes.shape[1] + 1), axis=0)
+    reconciled = nodes.copy()
+    reconciled.insert(0, TOTAL_NODE, nodes.sum(axis=1, skipna=False).where(gap.notna(), node_df[TOTAL_NODE]))
+    return reconciled
+
+def disaggregate(
+    node_df: pd.DataFrame,
+    nodes: pd.Series,
+    shares: pd.DataFrame,
+    key: Callable[[pd.DatetimeIndex], np.ndarray],
+) -> pd.DataFrame:
+    """
+    Split node forecasts over the groups with the learned shares. Key values
+    not seen in the share history use the group's share over all of it.
+    """
+    share = shares.reindex(key(node_df.index))
+    share = share.fillna(shares.mean())
+    values = node_df[nodes.to_numpy()].to_numpy() * share.to_numpy()
+    return pd.DataFrame(values, index=node_df.index, columns=nodes.index)
+
+def forecast_groups_from_nodes(
+    node_df: pd.DataFrame,
+    history: pd.DataFrame,
+    nodes: pd.Series,
+    key: Callable[[pd.DatetimeIndex], np.ndarray],
+    node_var: pd.DataFrame | None = None,
+):
+    """
+    Reconcile the node forecasts and split them over the groups of history.
+    With node_var, returns (group forecasts, group variances), a group's
+    variance being its node's forecast variance times its squared share.
+    """
+    shares = learn_shares(history, nodes, key)
+    group_df = disaggregate(reconcile(node_df), nodes, shares, key)
+    if node_var is None:
+        return group_df
+    return group_df, disaggregate(node_var, nodes, shares ** 2, key)
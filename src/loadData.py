@@ -1,3 +1,5 @@
+import hashlib
+import json
 from pathlib import Path
 from typing import Tuple
 import pandas as pd
@@ -7,21 +9,76 @@ DATA_DIR = PROJECT_ROOT / "Data"
 TRAINING_EXCEL = DATA_DIR / "20251111_JUNCTION_training.xlsx"
 EXAMPLE_HOURLY_CSV = DATA_DIR / "20251111_JUNCTION_example_hourly.csv"
 EXAMPLE_MONTHLY_CSV = DATA_DIR / "20251111_JUNCTION_example_monthly.csv"
+CACHE_DIR = DATA_DIR / "cache"
+
+def workbook_cache_key(path: Path | str) -> str:
+    """
+    Prefix of the cache entries of a workbook: its file name plus a hash of
+    its resolved location, so same-named workbooks in different directories
+    keep separate entries.
+    """
+    path = Path(path)
+    location = hashlib.sha1(str(path.resolve()).encode()).hexdigest()[:8]
+    return f"{path.stem}.{location}"
+
+def workbook_digest(path: Path | str) -> str:
+    """
+    Content hash of the workbook. The hash is remembered next to the cache
+    together with the file's mtime and size, so it is only recomputed when
+    the workbook has actually been touched.
+    """
+    path = Path(path)
+    stat = path.stat()
+    manifest_path = CACHE_DIR / f"{workbook_cache_key(path)}.json"
+    if manifest_path.exists():
+        manifest = json.loads(manifest_path.read_text())
+        if manifest.get("mtime_ns") == stat.st_mtime_ns and manifest.get("size") == stat.st_size:
+            return manifest["sha1"]
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha1.update(chunk)
+    digest = sha1.hexdigest()
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    manifest_path.write_text(json.dumps(
+        {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "sha1": digest}
+    ))
+    return digest
+
+def _read_sheet(path: Path | str, sheet_name: str, use_cache: bool = True) -> pd.DataFrame:
+    """
+    pd.read_excel with an on-disk cache: each sheet is parsed once and stored
+    as a pickled frame keyed by the workbook's content hash. Stale entries for
+    the same sheet are dropped as soon as the workbook changes.
+    """
+    path = Path(path)
+    if not use_cache:
+        return pd.read_excel(path, sheet_name=sheet_name)
+    digest = workbook_digest(path)
+    key = workbook_cache_key(path)
+    cache_path = CACHE_DIR / f"{key}.{sheet_name}.{digest[:16]}.pkl"
+    if cache_path.exists():
+        return pd.read_pickle(cache_path)
+    df = pd.read_excel(path, sheet_name=sheet_name)
+    for stale in CACHE_DIR.glob(f"{key}.{sheet_name}.*.pkl"):
+        stale.unlink()
+    df.to_pickle(cache_path)
+    return df
 
 def load_groups(path: Path | str = TRAINING_EXCEL) -> pd.DataFrame:
-    df = pd.read_excel(path, sheet_name="groups")
+    df = _read_sheet(path, sheet_name="groups")
     df["group_id"] = df["group_id"].astype(int)
     return df
 
 def load_training_consumption(path: Path | str = TRAINING_EXCEL) -> pd.DataFrame:
-    df = pd.read_excel(path, sheet_name="training_consumption")
+    df = _read_sheet(path, sheet_name="training_consumption")
     df["measured_at"] = pd.to_datetime(df["measured_at"], utc=True)
     df = df.set_index("measured_at").sort_index()
     return df
 
 
 def load_training_prices(path: Path | str = TRAINING_EXCEL) -> pd.DataFrame:
-    df = pd.read_excel(path, sheet_name="training_prices")
+    df = _read_sheet(path, sheet_name="training_prices")
     df["measured_at"] = pd.to_datetime(df["measured_at"], utc=True)
     df = df.set_index("measured_at").sort_index()
     return df
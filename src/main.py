@@ -1,47 +1,335 @@
 from __future__ import annotations
 import argparse
 from pathlib import Path
-from train48Hours import train_sarimax_48h
-from train12Months import train_sarimax_12m
-from forecast48Hours import forecast_48h
-from forecast12Months import forecast_12m
-from converter import (
-    build_submission_48h,
-    build_submission_12m,
-    save_submission_csv,
-)
+from pipelineOptions import BACKENDS, FORECAST_MODES, MODEL_FAMILIES, MODEL_FORMATS, VARIANTS_48H
 
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
 DATA_DIR = PROJECT_ROOT / "Data"
 OUTPUT_DIR = DATA_DIR / "forecasts"
 
+def _save_quantiles(
+    forecast_df, var_df, template, output_path: Path, stage: str, parquet: bool = False
+) -> None:
+    from converter import build_quantile_submission, save_submission_csv
+    from forecastEngine import forecast_quantiles
+    from profiling import PROFILER
+
+    with PROFILER.stage(stage):
+        submission = build_quantile_submission(forecast_quantiles(forecast_df, var_df), template)
+        save_submission_csv(submission, output_path, parquet=parquet)
+    print(f"Quantile forecasts saved to: {output_path}")
+
 def run_pipeline(
     do_train: bool = True,
     train_days_48h: int = 365,
     train_months_12m: int | None = None,
     max_groups: int | None = None,
+    workers: int = 1,
+    forecast_mode: str = "serial",
+    model_format: str = "compact",
+    update: bool = False,
+    warm_start: bool = False,
+    variant_48h: str = "sarimax",
+    backend: str = "statsmodels",
+    hierarchical: bool = False,
+    auto_order: bool = False,
+    batch_groups: int | None = None,
+    consumption_path: Path | None = None,
+    quantiles: bool = False,
+    stage_cache: bool = True,
+    parquet: bool = False,
+    model: str = "sarimax",
 ) -> None:
+    """
+    With stage_cache, every stage is skipped when its inputs are unchanged
+    since the last run (see stageCache): training refits only the groups
+    whose window or spec changed, forecasts and submissions are reused.
+    model="global" trains and forecasts the pooled ridge regressions of
+    globalModel instead of the per-group SARIMAX models.
+    """
+    if batch_groups is not None:
+        return run_streaming_pipeline(
+            batch_groups,
+            consumption_path=consumption_path,
+            do_train=do_train,
+            train_days_48h=train_days_48h,
+            train_months_12m=train_months_12m,
+            max_groups=max_groups,
+            workers=workers,
+            forecast_mode=forecast_mode,
+            model_format=model_format,
+            warm_start=warm_start,
+            variant_48h=variant_48h,
+            backend=backend,
+            auto_order=auto_order,
+            quantiles=quantiles,
+            parquet=parquet,
+        )
+    # the pipeline modules pull in pandas and numpy, so they are imported
+    # here rather than at module level and main.py --help starts without them
+    from converter import build_submission_48h, build_submission_12m, save_submission_csv
+    from forecast12Months import MODEL_DIR_12M, forecast_12m
+    from forecast48Hours import MODEL_DIR_48H, forecast_48h
+    from globalModel import (
+        GLOBAL_MODEL_PATH_12M,
+        GLOBAL_MODEL_PATH_48H,
+        forecast_global_12m,
+        forecast_global_48h,
+    )
+    from loadData import workbook_digest
+    from modelStore import MODELS_DIR
+    from pipelineData import PipelineData
+    from profiling import PROFILER
+    from stageCache import StageCache, content_hash, models_fingerprint
+
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
-    if do_train:
+    print("=== Loading training data and templates ===")
+    with PROFILER.stage("load"):
+        data = PipelineData.load()
+    stages = StageCache(enabled=stage_cache)
+    data_key = content_hash(workbook_digest(data.source_path), data.example_hourly, data.example_monthly)
+    # training, updating and streaming are imported only when used, so
+    # forecast-only runs start without them
+    if model == "global":
+        if do_train:
+            from globalModel import train_global_48h, train_global_12m
+
+            print("=== Training the global 48-hour model ===")
+            with PROFILER.stage("train_48h"):
+                train_global_48h(
+                    train_days=train_days_48h, max_groups=max_groups, data=data,
+                    skip_unchanged=stage_cache,
+                )
+            print("\n=== Training the global 12-month model ===")
+            with PROFILER.stage("train_12m"):
+                train_global_12m(
+                    train_months=train_months_12m, max_groups=max_groups, data=data,
+                    skip_unchanged=stage_cache,
+                )
+        else:
+            print("Skipping training; using the global models on disk.")
+    elif do_train:
+        from train48Hours import train_sarimax_48h
+        from train12Months import train_sarimax_12m
+
         print("=== Training 48-hour SARIMAX models ===")
-        train_sarimax_48h(train_days=train_days_48h, max_groups=max_groups)
+        with PROFILER.stage("train_48h"):
+            train_sarimax_48h(
+                train_days=train_days_48h,
+                max_groups=max_groups,
+                data=data,
+                workers=workers,
+                model_format=model_format,
+                warm_start=warm_start,
+                variant=variant_48h,
+                backend=backend,
+                hierarchical=hierarchical,
+                auto_order=auto_order,
+                skip_unchanged=stage_cache,
+            )
 
         print("\n=== Training 12-month SARIMAX models ===")
-        train_sarimax_12m(train_months=train_months_12m, max_groups=max_groups)
+        with PROFILER.stage("train_12m"):
+            train_sarimax_12m(
+                train_months=train_months_12m,
+                max_groups=max_groups,
+                data=data,
+                workers=workers,
+                model_format=model_format,
+                warm_start=warm_start,
+                backend=backend,
+                hierarchical=hierarchical,
+                auto_order=auto_order,
+                skip_unchanged=stage_cache,
+            )
+    elif update:
+        from updateModels import update_sarimax_48h, update_sarimax_12m
+
+        print("=== Updating 48-hour models with new observations ===")
+        with PROFILER.stage("update_48h"):
+            update_sarimax_48h(
+                max_groups=max_groups,
+                data=data,
+                variant=variant_48h,
+                hierarchical=hierarchical,
+            )
+
+        print("\n=== Updating 12-month models with new observations ===")
+        with PROFILER.stage("update_12m"):
+            update_sarimax_12m(max_groups=max_groups, data=data, hierarchical=hierarchical)
     else:
         print("Skipping training; using existing models on disk.")
+    # forecasts depend on the data, the model files and these settings only
+    forecast_params = dict(
+        max_groups=max_groups, model_format=model_format, backend=backend,
+        hierarchical=hierarchical, quantiles=quantiles, model=model,
+    )
+    models_48h, models_12m = MODEL_DIR_48H.name, MODEL_DIR_12M.name
+    if model == "global":
+        models_48h, models_12m = GLOBAL_MODEL_PATH_48H.name, GLOBAL_MODEL_PATH_12M.name
     print("\n=== Forecasting 48 hours ===")
-    fc_48 = forecast_48h(verbose=True, max_groups=max_groups)
-    sub_48 = build_submission_48h(fc_48)
+    key_48 = content_hash(
+        data_key, models_fingerprint(MODELS_DIR, f"{models_48h}*"),
+        forecast_params, variant_48h,
+    )
+    with PROFILER.stage("forecast_48h"):
+        if model == "global":
+            fc_48 = stages.run("forecast_48h", key_48, lambda: forecast_global_48h(
+                max_groups=max_groups, data=data, return_variance=quantiles,
+            ))
+        else:
+            fc_48 = stages.run("forecast_48h", key_48, lambda: forecast_48h(
+                verbose=True,
+                max_groups=max_groups,
+                data=data,
+                mode=forecast_mode,
+                workers=workers,
+                model_format=model_format,
+                variant=variant_48h,
+                backend=backend,
+                hierarchical=hierarchical,
+                return_variance=quantiles,
+            ))
+    if quantiles:
+        fc_48, var_48 = fc_48
     out_48 = OUTPUT_DIR / "forecast_48h_submission.csv"
-    save_submission_csv(sub_48, out_48)
+    submission_key = content_hash(fc_48, data.example_hourly, parquet)
+    with PROFILER.stage("submission_48h"):
+        stages.write("submission_48h", submission_key, out_48, lambda: save_submission_csv(
+            build_submission_48h(fc_48, template=data.example_hourly), out_48, parquet=parquet,
+        ))
     print(f"48-hour submission saved to: {out_48}")
+    if quantiles:
+        out_q48 = OUTPUT_DIR / "forecast_48h_quantiles.csv"
+        stages.write("quantiles_48h", content_hash(fc_48, var_48, data.example_hourly, parquet), out_q48,
+                     lambda: _save_quantiles(fc_48, var_48, data.example_hourly, out_q48,
+                                             "quantiles_48h", parquet))
     print("\n=== Forecasting 12 months ===")
-    fc_12 = forecast_12m(verbose=True, max_groups=max_groups)
-    sub_12 = build_submission_12m(fc_12)
+    key_12 = content_hash(data_key, models_fingerprint(MODELS_DIR, f"{models_12m}*"), forecast_params)
+    with PROFILER.stage("forecast_12m"):
+        if model == "global":
+            fc_12 = stages.run("forecast_12m", key_12, lambda: forecast_global_12m(
+                max_groups=max_groups, data=data, return_variance=quantiles,
+            ))
+        else:
+            fc_12 = stages.run("forecast_12m", key_12, lambda: forecast_12m(
+                verbose=True,
+                max_groups=max_groups,
+                data=data,
+                mode=forecast_mode,
+                workers=workers,
+                model_format=model_format,
+                backend=backend,
+                hierarchical=hierarchical,
+                return_variance=quantiles,
+            ))
+    if quantiles:
+        fc_12, var_12 = fc_12
     out_12 = OUTPUT_DIR / "forecast_12m_submission.csv"
-    save_submission_csv(sub_12, out_12)
+    submission_key = content_hash(fc_12, data.example_monthly, parquet)
+    with PROFILER.stage("submission_12m"):
+        stages.write("submission_12m", submission_key, out_12, lambda: save_submission_csv(
+            build_submission_12m(fc_12, template=data.example_monthly), out_12, parquet=parquet,
+        ))
     print(f"12-month submission saved to: {out_12}")
+    if quantiles:
+        out_q12 = OUTPUT_DIR / "forecast_12m_quantiles.csv"
+        stages.write("quantiles_12m", content_hash(fc_12, var_12, data.example_monthly, parquet), out_q12,
+                     lambda: _save_quantiles(fc_12, var_12, data.example_monthly, out_q12,
+                                             "quantiles_12m", parquet))
+    print("\nPipeline completed.")
+
+def run_streaming_pipeline(
+    batch_groups: int,
+    consumption_path: Path | None = None,
+    do_train: bool = True,
+    train_days_48h: int = 365,
+    train_months_12m: int | None = None,
+    max_groups: int | None = None,
+    workers: int = 1,
+    forecast_mode: str = "serial",
+    model_format: str = "compact",
+    warm_start: bool = False,
+    variant_48h: str = "sarimax",
+    backend: str = "statsmodels",
+    auto_order: bool = False,
+    quantiles: bool = False,
+    parquet: bool = False,
+) -> None:
+    """
+    run_pipeline on streamed consumption: the 48h stages run over batches of
+    batch_groups groups, the 12m stages on monthly totals accumulated over
+    time chunks, so the full hourly history is never loaded at once.
+    """
+    from converter import build_submission_48h, build_submission_12m, save_submission_csv
+    from pipelineData import PipelineData
+    from profiling import PROFILER
+    from streamData import ConsumptionSource
+    from streamPipeline import (
+        forecast_streaming_12m,
+        forecast_streaming_48h,
+        train_streaming_12m,
+        train_streaming_48h,
+    )
+
+    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    print("=== Loading prices, groups and templates ===")
+    with PROFILER.stage("load"):
+        context = PipelineData.load_context()
+        source = ConsumptionSource(consumption_path or context.source_path)
+    print(f"Streaming consumption from: {source.path} ({batch_groups} groups per batch)")
+    common = dict(max_groups=max_groups, model_format=model_format, backend=backend)
+    if do_train:
+        print("=== Training 48-hour SARIMAX models ===")
+        with PROFILER.stage("train_48h"):
+            train_streaming_48h(
+                source, context, batch_groups,
+                train_days=train_days_48h, workers=workers,
+                warm_start=warm_start, variant=variant_48h,
+                auto_order=auto_order, **common,
+            )
+        print("\n=== Training 12-month SARIMAX models ===")
+        with PROFILER.stage("train_12m"):
+            train_streaming_12m(
+                source, context,
+                train_months=train_months_12m, workers=workers,
+                warm_start=warm_start, auto_order=auto_order, **common,
+            )
+    else:
+        print("Skipping training; using existing models on disk.")
+    print("\n=== Forecasting 48 hours ===")
+    with PROFILER.stage("forecast_48h"):
+        fc_48 = forecast_streaming_48h(
+            source, context, batch_groups,
+            mode=forecast_mode, workers=workers, variant=variant_48h,
+            return_variance=quantiles, **common,
+        )
+    if quantiles:
+        fc_48, var_48 = fc_48
+    out_48 = OUTPUT_DIR / "forecast_48h_submission.csv"
+    with PROFILER.stage("submission_48h"):
+        sub_48 = build_submission_48h(fc_48, template=context.example_hourly)
+        save_submission_csv(sub_48, out_48, parquet=parquet)
+    print(f"48-hour submission saved to: {out_48}")
+    if quantiles:
+        _save_quantiles(fc_48, var_48, context.example_hourly,
+                        OUTPUT_DIR / "forecast_48h_quantiles.csv", "quantiles_48h", parquet)
+    print("\n=== Forecasting 12 months ===")
+    with PROFILER.stage("forecast_12m"):
+        fc_12 = forecast_streaming_12m(
+            source, context, mode=forecast_mode, workers=workers,
+            return_variance=quantiles, **common,
+        )
+    if quantiles:
+        fc_12, var_12 = fc_12
+    out_12 = OUTPUT_DIR / "forecast_12m_submission.csv"
+    with PROFILER.stage("submission_12m"):
+        sub_12 = build_submission_12m(fc_12, template=context.example_monthly)
+        save_submission_csv(sub_12, out_12, parquet=parquet)
+    print(f"12-month submission saved to: {out_12}")
+    if quantiles:
+        _save_quantiles(fc_12, var_12, context.example_monthly,
+                        OUTPUT_DIR / "forecast_12m_quantiles.csv", "quantiles_12m", parquet)
     print("\nPipeline completed.")
 
 def _parse_args() -> argparse.Namespace:
@@ -72,13 +360,162 @@ def _parse_args() -> argparse.Namespace:
         default=None,
         help="If set, train/forecast only the first N groups (for quick tests).",
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of worker processes for fitting group models "
+             "(default: 1, fit serially). Also sizes the forecast pools.",
+    )
+    parser.add_argument(
+        "--forecast-mode",
+        choices=FORECAST_MODES,
+        default="serial",
+        help="How group forecasts are run: one after the other, on a thread "
+             "pool, or on a process pool fed by a thread pool reading the "
+             "model files (default: serial).",
+    )
+    parser.add_argument(
+        "--model-format",
+        choices=MODEL_FORMATS,
+        default="compact",
+        help="Store fitted models in one compact .npz per horizon, or as one "
+             "pickled SARIMAXResults per group (default: compact).",
+    )
+    parser.add_argument(
+        "--update",
+        action="store_true",
+        help="Instead of training, filter the compact models forward over "
+             "observations newer than the ones they were fitted on.",
+    )
+    parser.add_argument(
+        "--warm-start",
+        action="store_true",
+        help="When training, start each fit from the parameters of the "
+             "group's stored compact model.",
+    )
+    parser.add_argument(
+        "--model",
+        choices=MODEL_FAMILIES,
+        default="sarimax",
+        help="sarimax fits one SARIMAX per group; global fits one pooled "
+             "ridge regression per horizon across all groups (calendar, "
+             "price, group metadata and lag features) and forecasts every "
+             "group in one batched predict (default: sarimax).",
+    )
+    parser.add_argument(
+        "--variant-48h",
+        choices=VARIANTS_48H,
+        default="sarimax",
+        help="48h model: SARIMAX on consumption, or the weekly baseline plus "
+             "a cheaper SARIMAX on the residual over it (default: sarimax).",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=BACKENDS,
+        default="statsmodels",
+        help="statsmodels fits one SARIMAX per group; batched fits and "
+             "forecasts all groups at once with vectorized Kalman recursions "
+             "(compact models only, default: statsmodels).",
+    )
+    parser.add_argument(
+        "--hierarchical",
+        action="store_true",
+        help="Fit one model per segment x product_type node (plus the total) "
+             "instead of per group, and split the reconciled node forecasts "
+             "over the groups by their recent consumption shares.",
+    )
+    parser.add_argument(
+        "--auto-order",
+        action="store_true",
+        help="When training, pick each group's SARIMAX order from a candidate "
+             "grid by AIC (short pruning fits, then full fits of the best few; "
+             "fits are cached in Data/cache/order_search).",
+    )
+    parser.add_argument(
+        "--batch-groups",
+        type=int,
+        default=None,
+        help="Stream the consumption in batches of this many groups instead "
+             "of loading it whole, bounding memory by the batch size "
+             "(not combined with --update or --hierarchical).",
+    )
+    parser.add_argument(
+        "--consumption-path",
+        type=Path,
+        default=None,
+        help="Consumption export to stream with --batch-groups: .xlsx, .csv "
+             "or .parquet, wide (one column per group) or long (measured_at, "
+             "group_id, fwh) (default: the training workbook).",
+    )
+    parser.add_argument(
+        "--quantiles",
+        action="store_true",
+        help="Also write P10/P50/P90 forecasts of every group (Gaussian "
+             "intervals from the models' forecast variance) to "
+             "forecast_48h_quantiles.csv and forecast_12m_quantiles.csv.",
+    )
+    parser.add_argument(
+        "--parquet",
+        action="store_true",
+        help="Also write every submission as Parquet next to its CSV.",
+    )
+    parser.add_argument(
+        "--no-stage-cache",
+        action="store_true",
+        help="Rerun every stage and refit every group even when their inputs "
+             "are unchanged since the last run (cached in Data/cache/stages "
+             "and Data/models/*.fingerprints.json).",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Time every pipeline function and stage, record RSS, and "
+             "write a JSON report to Data/profiles plus a summary table.",
+    )
+    parser.add_argument(
+        "--profile-memory",
+        action="store_true",
+        help="With --profile, also trace the peak memory of every call "
+             "(tracemalloc). Much slower, so the timings are not comparable "
+             "with a plain --profile run.",
+    )
     return parser.parse_args()
 
 if __name__ == "__main__":
     args = _parse_args()
+    if args.batch_groups is not None and (args.update or args.hierarchical):
+        raise SystemExit("--batch-groups cannot be combined with --update or --hierarchical")
+    if args.model == "global" and (args.batch_groups is not None or args.update or args.hierarchical):
+        raise SystemExit("--model global cannot be combined with --batch-groups, --update or --hierarchical")
+    if args.profile_memory and not args.profile:
+        raise SystemExit("--profile-memory requires --profile")
+    if args.profile:
+        from profiling import enable_profiling
+
+        enable_profiling(trace_memory=args.profile_memory)
     run_pipeline(
         do_train= args.skip_training,
         train_days_48h=30, #args.train_days_48h,
         train_months_12m=24, #args.train_months_12m,
         max_groups=args.max_groups,
+        workers=args.workers,
+        forecast_mode=args.forecast_mode,
+        model_format=args.model_format,
+        update=args.update,
+        warm_start=args.warm_start,
+        variant_48h=args.variant_48h,
+        backend=args.backend,
+        hierarchical=args.hierarchical,
+        auto_order=args.auto_order,
+        batch_groups=args.batch_groups,
+        consumption_path=args.consumption_path,
+        quantiles=args.quantiles,
+        stage_cache=not args.no_stage_cache,
+        parquet=args.parquet,
+        model=args.model,
     )
+    if args.profile:
+        from profiling import write_report
+
+        write_report()
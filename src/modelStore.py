@@ -0,0 +1,342 @@
+"""
+Compact model store. Instead of one pickled SARIMAXResults per group
+(training data, filter output and all), a horizon keeps a single .npz file
+next to its model directory, e.g. Data/models/sarimax_48h.npz, holding for
+every group only what forecasting needs: the parameters, the model spec,
+the state space system matrices and the predicted state after the last
+observation. Forecasting from it runs the recursions in stateSpace and
+needs NumPy only.
+
+Convert existing pickles with:
+    python src/modelStore.py --models-dir Data/models/sarimax_48h
+"""
+from __future__ import annotations
+import argparse
+import io
+import json
+import os
+import pickle
+import zipfile
+from dataclasses import dataclass, replace
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from pipelineOptions import MODEL_FORMATS
+from stateSpace import filter_forward, forecast_moments
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+MODELS_DIR = PROJECT_ROOT / "Data" / "models"
+
+_ARRAY_FIELDS = (
+    "params",
+    "design",
+    "transition",
+    "state_intercept",
+    "selection",
+    "state_cov",
+    "predicted_state",
+    "predicted_state_cov",
+)
+
+
+@dataclass
+class CompactSARIMAX:
+    order: Tuple[int, int, int]
+    seasonal_order: Tuple[int, int, int, int]
+    param_names: List[str]
+    exog_names: List[str]
+    params: np.ndarray
+    design: np.ndarray
+    obs_cov: float
+    transition: np.ndarray
+    state_intercept: np.ndarray
+    selection: np.ndarray
+    state_cov: np.ndarray
+    predicted_state: np.ndarray
+    predicted_state_cov: np.ndarray
+    residual_bias: float = 0.0
+    nobs: int = 0
+    last_timestamp: Optional[int] = None  # ns since epoch (UTC) of the last observation
+    # state as of the last complete period, when the last observations
+    # cover an unfinished one (e.g. the current month of a monthly model)
+    checkpoint_state: Optional[np.ndarray] = None
+    checkpoint_state_cov: Optional[np.ndarray] = None
+    checkpoint_nobs: Optional[int] = None
+    checkpoint_timestamp: Optional[int] = None
+
+    @classmethod
+    def from_results(cls, results, last_timestamp: Optional[int] = None) -> "CompactSARIMAX":
+        model = results.model
+        ssm = model.ssm
+
+        def _matrix(name: str, ndim: int) -> np.ndarray:
+            arr = np.asarray(ssm[name], dtype=float)
+            # time-varying matrices: keep the one for the last period
+            return arr[..., -1] if arr.ndim > ndim else arr
+
+        if last_timestamp is None:
+            index = getattr(model, "_index", None)
+            if index is not None and hasattr(index, "asi8"):
+                last_timestamp = int(index.asi8[-1])
+        return cls(
+            order=tuple(model.order),
+            seasonal_order=tuple(model.seasonal_order),
+            param_names=list(model.param_names),
+            exog_names=list(model.exog_names or []),
+            params=np.asarray(results.params, dtype=float),
+            design=_matrix("design", 2)[0],
+            obs_cov=float(_matrix("obs_cov", 2)[0, 0]),
+            transition=_matrix("transition", 2),
+            state_intercept=_matrix("state_intercept", 1),
+            selection=_matrix("selection", 2),
+            state_cov=_matrix("state_cov", 2),
+            predicted_state=np.asarray(results.predicted_state[:, -1], dtype=float),
+            predicted_state_cov=np.asarray(results.predicted_state_cov[:, :, -1], dtype=float),
+            residual_bias=float(getattr(results, "residual_bias", 0.0)),
+            nobs=int(results.nobs),
+            last_timestamp=last_timestamp,
+        )
+
+    @property
+    def beta(self) -> np.ndarray:
+        """Regression coefficients on the exog columns, in exog_names order."""
+        return self.params[[self.param_names.index(name) for name in self.exog_names]]
+
+    def obs_intercept(self, exog_future, steps: Optional[int] = None) -> np.ndarray:
+        if not self.exog_names:
+            if steps is None:
+                raise ValueError("steps is required for models without exog")
+            return np.zeros(steps)
+        if hasattr(exog_future, "columns"):
+            exog_future = exog_future[self.exog_names]
+        exog = np.asarray(exog_future, dtype=float)
+        if steps is not None:
+            exog = exog[:steps]
+        return exog @ self.beta
+
+    def forecast_moments(self, exog_future=None, steps: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Forecast mean (bias corrected) and variance."""
+        mean, var = forecast_moments(
+            self.design,
+            self.obs_cov,
+            self.transition,
+            self.state_intercept,
+            self.selection,
+            self.state_cov,
+            self.predicted_state,
+            self.predicted_state_cov,
+            self.obs_intercept(exog_future, steps),
+        )
+        return mean + self.residual_bias, var
+
+    def forecast(self, exog_future=None, steps: Optional[int] = None) -> np.ndarray:
+        return self.forecast_moments(exog_future, steps)[0]
+
+    def extend(self, endog, exog=None, last_timestamp: Optional[int] = None) -> "CompactSARIMAX":
+        """
+        Filter the model forward over new observations with fixed parameters
+        (statsmodels' append/extend semantics) and return the updated model.
+        """
+        endog = np.asarray(endog, dtype=float)
+        state, state_cov_t = filter_forward(
+            self.design,
+            self.obs_cov,
+            self.transition,
+            self.state_intercept,
+            self.selection,
+            self.state_cov,
+            self.predicted_state,
+            self.predicted_state_cov,
+            endog,
+            self.obs_intercept(exog, len(endog)),
+        )
+        return replace(
+            self,
+            predicted_state=state,
+            predicted_state_cov=state_cov_t,
+            nobs=self.nobs + len(endog),
+            last_timestamp=self.last_timestamp if last_timestamp is None else last_timestamp,
+        )
+
+    def checkpoint(self) -> "CompactSARIMAX":
+        """Mark the current state as complete; later observations can be rewound."""
+        return replace(
+            self,
+            checkpoint_state=self.predicted_state,
+            checkpoint_state_cov=self.predicted_state_cov,
+            checkpoint_nobs=self.nobs,
+            checkpoint_timestamp=self.last_timestamp,
+        )
+
+    def rewind(self) -> "CompactSARIMAX":
+        """The model as of its last complete period (itself without a checkpoint)."""
+        if self.checkpoint_state is None:
+            return self
+        return replace(
+            self,
+            predicted_state=self.checkpoint_state,
+            predicted_state_cov=self.checkpoint_state_cov,
+            nobs=self.checkpoint_nobs,
+            last_timestamp=self.checkpoint_timestamp,
+            checkpoint_state=None,
+            checkpoint_state_cov=None,
+            checkpoint_nobs=None,
+            checkpoint_timestamp=None,
+        )
+
+    def to_arrays(self, prefix: str) -> Dict[str, np.ndarray]:
+        out = {f"{prefix}{name}": np.asarray(getattr(self, name), dtype=float) for name in _ARRAY_FIELDS}
+        if self.checkpoint_state is not None:
+            out[f"{prefix}checkpoint_state"] = np.asarray(self.checkpoint_state, dtype=float)
+            out[f"{prefix}checkpoint_state_cov"] = np.asarray(self.checkpoint_state_cov, dtype=float)
+        out[f"{prefix}spec"] = np.array(json.dumps({
+            "order": list(self.order),
+            "seasonal_order": list(self.seasonal_order),
+            "param_names": self.param_names,
+            "exog_names": self.exog_names,
+            "obs_cov": self.obs_cov,
+            "residual_bias": self.residual_bias,
+            "nobs": self.nobs,
+            "last_timestamp": self.last_timestamp,
+            "checkpoint_nobs": self.checkpoint_nobs,
+            "checkpoint_timestamp": self.checkpoint_timestamp,
+        }))
+        return out
+
+    @classmethod
+    def from_arrays(cls, arrays, prefix: str) -> "CompactSARIMAX":
+        spec = json.loads(str(arrays[f"{prefix}spec"]))
+        kwargs = {name: arrays[f"{prefix}{name}"] for name in _ARRAY_FIELDS}
+        if f"{prefix}checkpoint_state" in arrays:
+            kwargs["checkpoint_state"] = arrays[f"{prefix}checkpoint_state"]
+            kwargs["checkpoint_state_cov"] = arrays[f"{prefix}checkpoint_state_cov"]
+        kwargs.update(spec)
+        kwargs["order"] = tuple(spec["order"])
+        kwargs["seasonal_order"] = tuple(spec["seasonal_order"])
+        return cls(**kwargs)
+
+
+def model_store_path(models_dir: Path | str) -> Path:
+    """Data/models/sarimax_48h -> Data/models/sarimax_48h.npz"""
+    return Path(models_dir).with_suffix(".npz")
+
+
+def _prefix(gid) -> str:
+    return f"{gid}."
+
+
+class _StoreArrays:
+    """
+    Read-only access to the arrays of a store file. np.load's NpzFile
+    searches its list of members on every lookup, which makes loading
+    every group of a large store quadratic in the number of groups; the
+    zip's own name index is a dict.
+    """
+
+    def __init__(self, path: Path | str):
+        self.zip = zipfile.ZipFile(path)
+
+    def __contains__(self, key: str) -> bool:
+        return f"{key}.npy" in self.zip.NameToInfo
+
+    def __getitem__(self, key: str) -> np.ndarray:
+        try:
+            info = self.zip.getinfo(f"{key}.npy")
+        except KeyError:
+            raise KeyError(f"{key} is not in the model store") from None
+        with self.zip.open(info) as f:
+            return np.lib.format.read_array(f, allow_pickle=False)
+
+    def __enter__(self) -> "_StoreArrays":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.zip.close()
+
+
+def load_model_store(
+    path: Path | str,
+    group_ids: Optional[Iterable] = None,
+) -> Dict[object, CompactSARIMAX]:
+    """
+    Load the compact models for group_ids (all groups if None). Groups that
+    are not in the store are left out of the result.
+    """
+    with _StoreArrays(path) as arrays:
+        stored = arrays["group_ids"].tolist()
+        if group_ids is None:
+            wanted = stored
+        else:
+            available = set(stored)
+            wanted = [gid for gid in group_ids if gid in available]
+        return {gid: CompactSARIMAX.from_arrays(arrays, _prefix(gid)) for gid in wanted}
+
+
+def save_model_store(
+    models: Dict[object, CompactSARIMAX],
+    path: Path | str,
+    merge: bool = True,
+) -> Path:
+    """
+    Write models to path. With merge=True, groups already in the store that
+    are not in models are kept, so training a subset of groups does not drop
+    the others. The file is replaced atomically.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if merge and path.exists():
+        models = {**load_model_store(path), **models}
+    arrays: Dict[str, np.ndarray] = {"group_ids": np.asarray(list(models))}
+    for gid, model in models.items():
+        arrays.update(model.to_arrays(_prefix(gid)))
+    buf = io.BytesIO()
+    np.savez(buf, **arrays)
+    tmp_path = path.with_suffix(".npz.tmp")
+    tmp_path.write_bytes(buf.getvalue())
+    os.replace(tmp_path, path)
+    return path
+
+
+def migrate_pickles(
+    models_dir: Path | str,
+    store_path: Path | str | None = None,
+    verbose: bool = True,
+) -> Path:
+    """Convert every group_{gid}.pkl in models_dir into the compact store."""
+    models_dir = Path(models_dir)
+    if store_path is None:
+        store_path = model_store_path(models_dir)
+    models: Dict[object, CompactSARIMAX] = {}
+    pickle_paths = sorted(models_dir.glob("group_*.pkl"))
+    for idx, model_path in enumerate(pickle_paths, start=1):
+        gid_str = model_path.stem[len("group_"):]
+        gid = int(gid_str) if gid_str.isdigit() else gid_str
+        if verbose:
+            print(f"[{idx}/{len(pickle_paths)}] Converting {model_path.name}...")
+        with open(model_path, "rb") as f:
+            results = pickle.load(f)
+        models[gid] = CompactSARIMAX.from_results(results)
+    path = save_model_store(models, store_path)
+    if verbose:
+        print(f"Wrote {len(models)} models to: {path}")
+    return path
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Convert pickled SARIMAX results into the compact model store."
+    )
+    parser.add_argument(
+        "--models-dir",
+        type=Path,
+        action="append",
+        default=None,
+        help="Directory with group_*.pkl files (repeatable; default: "
+             "Data/models/sarimax_48h and Data/models/sarimax_12m).",
+    )
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = _parse_args()
+    for models_dir in args.models_dir or [MODELS_DIR / "sarimax_48h", MODELS_DIR / "sarimax_12m"]:
+        migrate_pickles(models_dir)
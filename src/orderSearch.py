@@ -0,0 +1,239 @@
+"""
+Automatic SARIMAX order selection. Every candidate (order, seasonal_order)
+is first fitted on a short recent window with few iterations; only the
+keep best candidates by AIC are then fitted on the full window, and the one
+with the lowest AIC wins. The fits of all groups and candidates run on a
+process pool over shared memory (the same workers as parallel.fit_groups).
+
+Every fit is memoized on disk, keyed on group, a hash of the window's data,
+candidate and fit stage. The window end can be aligned to a fixed grid
+(align_hours), so the window only moves, and the cache only misses, once per
+grid step while new observations arrive; a change in one group's data only
+invalidates that group.
+"""
+from __future__ import annotations
+import hashlib
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+import pandas as pd
+from parallel import init_worker, share_array, worker_state
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+ORDER_CACHE_DIR = PROJECT_ROOT / "Data" / "cache" / "order_search"
+
+Candidate = Tuple[tuple, tuple]
+
+
+def candidate_grid(
+    p: Sequence[int] = (0, 1, 2),
+    d: Sequence[int] = (0,),
+    q: Sequence[int] = (0, 1, 2),
+    P: Sequence[int] = (0, 1),
+    D: Sequence[int] = (0,),
+    Q: Sequence[int] = (0, 1),
+    s: int = 0,
+) -> List[Candidate]:
+    """All ((p, d, q), (P, D, Q, s)) combinations; without s, no seasonal part."""
+    seasonal = [(sp, sd, sq, s) for sp, sd, sq in itertools.product(P, D, Q)] if s else [(0, 0, 0, 0)]
+    return [
+        ((ap, ad, aq), so)
+        for ap, ad, aq in itertools.product(p, d, q)
+        for so in dict.fromkeys(seasonal)
+        if ap + aq + so[0] + so[2] > 0
+    ]
+
+
+ORDER_CANDIDATES_48H = candidate_grid(p=(1, 2), q=(0, 1), P=(0, 1), Q=(0, 1), s=24)
+# the residual variant's weekly baseline already carries the seasonality
+ORDER_CANDIDATES_48H_RESIDUAL = candidate_grid(p=(1, 2, 3), q=(0, 1, 2))
+ORDER_CANDIDATES_12M = candidate_grid(p=(0, 1), q=(0, 1), P=(0, 1), Q=(0,), s=12)
+# short pruning fits: the last two weeks, few optimizer iterations
+PRUNE_HOURS_48H = 14 * 24
+PRUNE_MAXITER = 15
+KEEP_CANDIDATES = 3
+
+
+def _window_hash(y: np.ndarray, exog: np.ndarray | None, index: pd.DatetimeIndex) -> str:
+    sha1 = hashlib.sha1()
+    sha1.update(np.ascontiguousarray(y, dtype=float).tobytes())
+    if exog is not None:
+        sha1.update(np.ascontiguousarray(exog, dtype=float).tobytes())
+    if len(index):
+        sha1.update(f"{index[0].value}:{index[-1].value}".encode())
+    return sha1.hexdigest()[:16]
+
+
+def _cache_key(gid, window_hash: str, candidate: Candidate, stage: str) -> str:
+    order, seasonal_order = candidate
+    return f"{gid}|{window_hash}|{order}|{seasonal_order}|{stage}"
+
+
+def _load_cache(path: Path) -> Dict[str, dict]:
+    return json.loads(path.read_text()) if path.exists() else {}
+
+
+def _save_cache(cache: Dict[str, dict], path: Path) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".json.tmp")
+    tmp_path.write_text(json.dumps(cache))
+    os.replace(tmp_path, path)
+
+
+def _score(fit_fn: Callable, y: pd.Series, exog: pd.DataFrame | None, candidate: Candidate, maxiter: int) -> dict:
+    order, seasonal_order = candidate
+    try:
+        results = fit_fn(y, exog, order=order, seasonal_order=seasonal_order, maxiter=maxiter)
+        aic = float(results.aic)
+        return {
+            "aic": aic if np.isfinite(aic) else None,
+            "params": np.asarray(results.params, dtype=float).tolist(),
+        }
+    except Exception as exc:  # a candidate that does not fit is just not selected
+        return {"aic": None, "error": f"{type(exc).__name__}: {exc}"}
+
+
+def _score_task(fit_fn: Callable, key: str, col: int, rows: slice, candidate: Candidate, maxiter: int):
+    state = worker_state()
+    index = state["index"][rows]
+    y = pd.Series(state["y"][rows, col], index=index)
+    exog = state["exog"]
+    return key, _score(fit_fn, y, None if exog is None else exog.iloc[rows], candidate, maxiter)
+
+
+def _run_stage(
+    fit_fn: Callable,
+    tasks: List[Tuple[str, int, slice, Candidate, int]],
+    cons: pd.DataFrame,
+    exog: pd.DataFrame | None,
+    workers: int,
+) -> Dict[str, dict]:
+    if workers <= 1:
+        results = {}
+        for key, col, rows, candidate, maxiter in tasks:
+            y = cons.iloc[rows, col]
+            results[key] = _score(fit_fn, y, None if exog is None else exog.iloc[rows], candidate, maxiter)
+        return results
+    y_shm, y_spec = share_array(cons.to_numpy(dtype=float))
+    exog_shm, exog_spec = (None, None)
+    if exog is not None:
+        exog_shm, exog_spec = share_array(exog.to_numpy(dtype=float))
+    try:
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=init_worker,
+            initargs=(y_spec, exog_spec, cons.index, None if exog is None else list(exog.columns)),
+        ) as pool:
+            futures = [pool.submit(_score_task, fit_fn, *task) for task in tasks]
+            return dict(future.result() for future in as_completed(futures))
+    finally:
+        for shm in (y_shm, exog_shm):
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+
+
+def select_orders(
+    fit_fn: Callable,
+    cons: pd.DataFrame,
+    exog: pd.DataFrame | None,
+    group_ids: List,
+    candidates: Sequence[Candidate],
+    cache_name: str,
+    prune_rows: Optional[int] = None,
+    keep: int = KEEP_CANDIDATES,
+    prune_maxiter: int = PRUNE_MAXITER,
+    maxiter: int = 50,
+    align_hours: Optional[int] = None,
+    workers: int = 1,
+    verbose: bool = True,
+) -> Dict[object, dict]:
+    """
+    Pick the (order, seasonal_order) with the lowest full-window AIC for
+    every group. fit_fn(y, exog, order=, seasonal_order=, maxiter=) fits one
+    candidate (fit_group_48h/fit_group_12m). prune_rows=None skips the short
+    pruning fits and fits every candidate on the full window.
+
+    Returns {gid: {"order", "seasonal_order", "aic", "start_params"}}; groups
+    where no candidate could be fitted are left out.
+    """
+    if align_hours:
+        # a window of fixed length that ends on the grid, so it only moves
+        # once per align_hours however the training window slides within it
+        hours = cons.index.asi8 // 3_600_000_000_000
+        cutoff = (hours[-1] + 1) // align_hours * align_hours
+        span = hours[-1] - hours[0] + 1 - align_hours
+        keep_rows = (hours >= cutoff - span) & (hours < cutoff)
+        cons = cons.loc[keep_rows]
+        exog = None if exog is None else exog.loc[keep_rows]
+    cache_path = ORDER_CACHE_DIR / f"{cache_name}.json"
+    cache = _load_cache(cache_path)
+    columns = {gid: i for i, gid in enumerate(cons.columns)}
+    exog_values = None if exog is None else exog.to_numpy(dtype=float)
+    full_rows = slice(0, len(cons))
+    short_rows = full_rows if prune_rows is None else slice(max(len(cons) - prune_rows, 0), len(cons))
+    hashes: Dict[object, Dict[str, str]] = {}
+    for gid in group_ids:
+        y = cons[gid].to_numpy(dtype=float)
+        hashes[gid] = {
+            "short": _window_hash(y[short_rows], None if exog_values is None else exog_values[short_rows],
+                                  cons.index[short_rows]),
+            "full": _window_hash(y, exog_values, cons.index),
+        }
+
+    # entries for older windows of these groups can never hit again
+    current = {str(gid): set(h.values()) for gid, h in hashes.items()}
+    cache = {
+        key: value for key, value in cache.items()
+        if key.split("|")[0] not in current or key.split("|")[1] in current[key.split("|")[0]]
+    }
+
+    def _stage(stage: str, rows: slice, stage_maxiter: int, wanted: Dict[object, List[Candidate]]) -> Dict:
+        scores = {}
+        tasks = []
+        for gid, group_candidates in wanted.items():
+            for candidate in group_candidates:
+                key = _cache_key(gid, hashes[gid][stage], candidate, f"{stage}:{stage_maxiter}")
+                scores[(gid, candidate)] = key
+                if key not in cache:
+                    tasks.append((key, columns[gid], rows, candidate, stage_maxiter))
+        if verbose:
+            print(f"Order search ({stage} window): {len(scores)} fits, "
+                  f"{len(scores) - len(tasks)} cached, {len(tasks)} to run")
+        cache.update(_run_stage(fit_fn, tasks, cons, exog, workers))
+        _save_cache(cache, cache_path)
+        return {pair: cache[key] for pair, key in scores.items()}
+
+    def _aic(result: dict) -> float:
+        return np.inf if result.get("aic") is None else result["aic"]
+
+    finalists = {gid: list(candidates) for gid in group_ids}
+    if prune_rows is not None and keep < len(candidates):
+        short = _stage("short", short_rows, prune_maxiter, finalists)
+        finalists = {
+            gid: sorted(candidates, key=lambda c: _aic(short[(gid, c)]))[:keep]
+            for gid in group_ids
+        }
+    full = _stage("full", full_rows, maxiter, finalists)
+    selected: Dict[object, dict] = {}
+    for gid in group_ids:
+        best = min(finalists[gid], key=lambda c: _aic(full[(gid, c)]))
+        result = full[(gid, best)]
+        if result.get("aic") is None:
+            continue
+        selected[gid] = {
+            "order": best[0],
+            "seasonal_order": best[1],
+            "aic": result["aic"],
+            "start_params": np.asarray(result["params"]),
+        }
+    if verbose:
+        counts = pd.Series([f"{s['order']}x{s['seasonal_order']}" for s in selected.values()]).value_counts()
+        print(f"Selected orders for {len(selected)} of {len(group_ids)} groups:")
+        for spec, n in counts.items():
+            print(f"  {spec}: {n}")
+    return selected
@@ -0,0 +1,214 @@
+from __future__ import annotations
+import pickle
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+from profiling import PROFILER
+from modelStore import CompactSARIMAX, load_model_store, model_store_path, save_model_store
+
+# Per-process state set up by init_worker. Each worker attaches to the
+# shared blocks once, so a task only carries (column, group id, path).
+_WORKER_STATE: dict = {}
+
+
+def share_array(values: np.ndarray) -> Tuple[shared_memory.SharedMemory, tuple]:
+    """
+    Copy values into a new shared memory block. Returns the block (the caller
+    owns it and must close/unlink it) and a small picklable spec that
+    attach_array() uses to map the same memory in another process.
+    """
+    values = np.ascontiguousarray(values)
+    shm = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+    view = np.ndarray(values.shape, dtype=values.dtype, buffer=shm.buf)
+    view[...] = values
+    return shm, (shm.name, values.shape, values.dtype.str)
+
+
+def attach_array(spec: tuple) -> Tuple[shared_memory.SharedMemory, np.ndarray]:
+    name, shape, dtype = spec
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+
+
+def init_worker(y_spec: tuple, exog_spec: tuple | None, index, exog_columns) -> None:
+    """
+    Pool initializer: attach the shared consumption (and exog) blocks once
+    per process. Tasks read them back with worker_state().
+    """
+    y_shm, y_values = attach_array(y_spec)
+    _WORKER_STATE["blocks"] = [y_shm]
+    _WORKER_STATE["y"] = y_values
+    _WORKER_STATE["index"] = index
+    _WORKER_STATE["exog"] = None
+    if exog_spec is not None:
+        exog_shm, exog_values = attach_array(exog_spec)
+        _WORKER_STATE["blocks"].append(exog_shm)
+        # Read-only frame over the shared block; statsmodels copies what it needs.
+        _WORKER_STATE["exog"] = pd.DataFrame(
+            exog_values, index=index, columns=exog_columns, copy=False
+        )
+
+
+def worker_state() -> dict:
+    """The arrays init_worker attached: y, index, exog (None without exog)."""
+    return _WORKER_STATE
+
+
+def _fit_and_save(
+    fit_fn: Callable,
+    y: pd.Series,
+    exog: pd.DataFrame | None,
+    model_path: Path,
+    fit_kwargs: dict,
+    model_format: str,
+) -> Tuple[Optional[str], Optional[CompactSARIMAX], float]:
+    """
+    Returns (error, compact model, seconds). Pickled results are written to
+    model_path directly; compact models are handed back so the caller can
+    write the whole store at once.
+    """
+    start = time.perf_counter()
+    model = None
+    try:
+        results = fit_fn(y, exog, **fit_kwargs)
+        if model_format == "compact":
+            model = CompactSARIMAX.from_results(results, last_timestamp=int(y.index.asi8[-1]))
+        else:
+            with open(model_path, "wb") as f:
+                pickle.dump(results, f)
+    except Exception as exc:  # one bad group must not take the others down
+        return f"{type(exc).__name__}: {exc}", None, time.perf_counter() - start
+    return None, model, time.perf_counter() - start
+
+
+def _fit_task(fit_fn: Callable, col: int, gid, model_path: Path, fit_kwargs: dict, model_format: str):
+    y = pd.Series(_WORKER_STATE["y"][:, col], index=_WORKER_STATE["index"], name=gid)
+    return gid, _fit_and_save(fit_fn, y, _WORKER_STATE["exog"], model_path, fit_kwargs, model_format)
+
+
+def fit_groups(
+    fit_fn: Callable,
+    cons: pd.DataFrame,
+    exog: pd.DataFrame | None,
+    group_ids: List,
+    models_dir: Path,
+    workers: int = 1,
+    verbose: bool = True,
+    fit_kwargs: Dict | None = None,
+    model_format: str = "compact",
+    group_fit_kwargs: Dict[object, Dict] | None = None,
+) -> Dict[object, Optional[str]]:
+    """
+    Fit fit_fn(y, exog, **fit_kwargs) for every group and store the results,
+    either in the compact model store next to models_dir or pickled to
+    models_dir/group_{gid}.pkl. With workers > 1 the groups are fanned out
+    over a process pool; consumption and exog are placed in shared memory
+    once instead of being pickled with every task.
+
+    group_fit_kwargs adds per-group keyword arguments on top of fit_kwargs
+    (e.g. start_params for a warm start).
+
+    Returns {gid: None or error message}, in group_ids order. A failing group
+    is reported and skipped, the remaining fits carry on.
+    """
+    models_dir = Path(models_dir)
+    if model_format == "pickle":
+        models_dir.mkdir(parents=True, exist_ok=True)
+    fit_kwargs = fit_kwargs or {}
+    group_fit_kwargs = group_fit_kwargs or {}
+
+    def _kwargs(gid) -> dict:
+        return {**fit_kwargs, **group_fit_kwargs.get(gid, {})}
+    total = len(group_ids)
+    errors: Dict[object, Optional[str]] = {}
+    compact: Dict[object, CompactSARIMAX] = {}
+
+    if workers <= 1:
+        for idx, gid in enumerate(group_ids, start=1):
+            if verbose:
+                print(f"[{idx}/{total}] Fitting group {gid}...")
+            errors[gid], model, seconds = _fit_and_save(
+                fit_fn, cons[gid], exog, models_dir / f"group_{gid}.pkl",
+                _kwargs(gid), model_format,
+            )
+            PROFILER.record(f"fit:{models_dir.name}", seconds)
+            if model is not None:
+                compact[gid] = model
+            if verbose and errors[gid]:
+                print(f"[{idx}/{total}] Group {gid} failed: {errors[gid]}")
+        _save_compact(compact, models_dir, group_ids, verbose)
+        return errors
+
+    columns = {gid: i for i, gid in enumerate(cons.columns)}
+    y_shm, y_spec = share_array(cons.to_numpy(dtype=float))
+    exog_shm, exog_spec = (None, None)
+    if exog is not None:
+        exog_shm, exog_spec = share_array(exog.to_numpy(dtype=float))
+    try:
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=init_worker,
+            initargs=(
+                y_spec,
+                exog_spec,
+                cons.index,
+                None if exog is None else list(exog.columns),
+            ),
+        ) as pool:
+            futures = {
+                pool.submit(
+                    _fit_task, fit_fn, columns[gid], gid,
+                    models_dir / f"group_{gid}.pkl", _kwargs(gid), model_format,
+                ): gid
+                for gid in group_ids
+            }
+            done = 0
+            for future in as_completed(futures):
+                gid = futures[future]
+                done += 1
+                try:
+                    _, (err, model, seconds) = future.result()
+                    PROFILER.record(f"fit:{models_dir.name}", seconds)
+                except Exception as exc:  # worker process died
+                    err, model = f"{type(exc).__name__}: {exc}", None
+                errors[gid] = err
+                if model is not None:
+                    compact[gid] = model
+                if verbose:
+                    status = f"failed: {err}" if err else "done"
+                    print(f"[{done}/{total}] Group {gid} {status}")
+    finally:
+        for shm in (y_shm, exog_shm):
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+    _save_compact(compact, models_dir, group_ids, verbose)
+    return {gid: errors.get(gid) for gid in group_ids}
+
+
+def warm_start_kwargs(models_dir: Path, group_ids: List) -> Dict[object, Dict]:
+    """
+    start_params for every group that already has a compact model, so a full
+    refit starts from the previous optimum instead of the default guess.
+    """
+    store_path = model_store_path(models_dir)
+    if not store_path.exists():
+        return {}
+    return {
+        gid: {"start_params": model.params}
+        for gid, model in load_model_store(store_path, group_ids).items()
+    }
+
+
+def _save_compact(compact: Dict, models_dir: Path, group_ids: List, verbose: bool) -> None:
+    if not compact:
+        return
+    # keep the store in group order regardless of completion order
+    ordered = {gid: compact[gid] for gid in group_ids if gid in compact}
+    path = save_model_store(ordered, model_store_path(models_dir))
+    if verbose:
+        print(f"Saved {len(ordered)} compact models to: {path}")
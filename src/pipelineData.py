@@ -0,0 +1,139 @@
+from __future__ import annotations
+from dataclasses import dataclass, field, replace
+from functools import cached_property
+from pathlib import Path
+from typing import Tuple
+import pandas as pd
+from consumptionStore import ConsumptionStore
+from loadData import (
+    TRAINING_EXCEL,
+    EXAMPLE_HOURLY_CSV,
+    EXAMPLE_MONTHLY_CSV,
+    load_all_training_data,
+    load_all_templates,
+    load_groups,
+    load_training_prices,
+)
+from dataProcessing import (
+    get_48h_forecast_index,
+    last_complete_month,
+    prepare_hourly_training,
+    prepare_monthly_training,
+    build_future_exog_48h,
+    build_future_exog_12m,
+    prepare_groups_with_metadata,
+)
+
+
+@dataclass
+class PipelineData:
+    """
+    All frames one pipeline run works on. The sources are loaded once by
+    PipelineData.load(); derived frames are computed lazily on first access
+    and then shared by every stage that receives this object.
+    """
+    groups: pd.DataFrame
+    consumption: pd.DataFrame
+    prices: pd.DataFrame
+    example_hourly: pd.DataFrame
+    example_monthly: pd.DataFrame
+    source_path: Path | None = field(default=None, repr=False)
+    # precomputed monthly totals (streaming runs); by default from the store
+    monthly_consumption: pd.DataFrame | None = field(default=None, repr=False)
+    # last hour behind monthly_consumption (the consumption frame is empty then)
+    consumption_end: pd.Timestamp | None = field(default=None, repr=False)
+    # "float32" halves the store's memory, at float32 rounding of the model inputs
+    store_dtype: str = field(default="float64", repr=False)
+
+    @classmethod
+    def load(
+        cls,
+        path: Path | str = TRAINING_EXCEL,
+        hourly_template_path: Path | str = EXAMPLE_HOURLY_CSV,
+        monthly_template_path: Path | str = EXAMPLE_MONTHLY_CSV,
+    ) -> "PipelineData":
+        groups_df, consumption_df, prices_df = load_all_training_data(path)
+        hourly_df, monthly_df = load_all_templates(
+            hourly_template_path, monthly_template_path
+        )
+        return cls(
+            groups=groups_df,
+            consumption=consumption_df,
+            prices=prices_df,
+            example_hourly=hourly_df,
+            example_monthly=monthly_df,
+            source_path=Path(path),
+        )
+
+    @classmethod
+    def load_context(
+        cls,
+        path: Path | str = TRAINING_EXCEL,
+        hourly_template_path: Path | str = EXAMPLE_HOURLY_CSV,
+        monthly_template_path: Path | str = EXAMPLE_MONTHLY_CSV,
+    ) -> "PipelineData":
+        """
+        Everything but the consumption, for streaming runs: the consumption
+        is read in batches and attached with with_consumption().
+        """
+        hourly_df, monthly_df = load_all_templates(
+            hourly_template_path, monthly_template_path
+        )
+        return cls(
+            groups=load_groups(path),
+            consumption=pd.DataFrame(index=pd.DatetimeIndex([], tz="UTC", name="measured_at")),
+            prices=load_training_prices(path),
+            example_hourly=hourly_df,
+            example_monthly=monthly_df,
+            source_path=Path(path),
+        )
+
+    def with_consumption(self, consumption: pd.DataFrame) -> "PipelineData":
+        """Same groups, prices and templates, fresh derived frames for consumption."""
+        return replace(self, consumption=consumption, monthly_consumption=None, consumption_end=None)
+
+    @property
+    def group_ids(self) -> list:
+        return list(self.consumption.columns)
+
+    @cached_property
+    def group_metadata(self) -> pd.DataFrame:
+        return prepare_groups_with_metadata(self.groups)
+
+    @cached_property
+    def consumption_store(self) -> ConsumptionStore:
+        return ConsumptionStore.from_frame(self.consumption, dtype=self.store_dtype)
+
+    @cached_property
+    def hourly_training(self) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        return prepare_hourly_training(self.consumption_store, self.prices)
+
+    @cached_property
+    def monthly_training(self) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        if self.monthly_consumption is not None:
+            return prepare_monthly_training(self.monthly_consumption)
+        return prepare_monthly_training(self.consumption_store)
+
+    @cached_property
+    def complete_through_12m(self) -> pd.Timestamp | None:
+        """Start of the last month of monthly_training that is complete."""
+        end = self.consumption_end
+        if self.monthly_consumption is None and len(self.consumption.index):
+            end = self.consumption.index.max()
+        return None if end is None else last_complete_month(end)
+
+    @cached_property
+    def forecast_index_48h(self) -> pd.DatetimeIndex:
+        return get_48h_forecast_index(self.consumption)
+
+    @cached_property
+    def exog_future_48h(self) -> pd.DataFrame:
+        return build_future_exog_48h(
+            forecast_index=self.forecast_index_48h,
+            prices_df=self.prices,
+            consumption_df=self.consumption,
+        )
+
+    @cached_property
+    def exog_future_12m(self) -> pd.DataFrame:
+        return build_future_exog_12m(self.example_monthly)
@@ -0,0 +1,17 @@
+"""
+The choices of main.py's command line. They are kept here, without any
+heavy imports, so that main.py can build its parser without loading pandas
+or numpy; the modules that implement them re-export the same names.
+"""
+
+# "statsmodels": one SARIMAX per group. "batched": all groups at once with
+# the vectorized recursions in batchedSARIMAX.
+BACKENDS = ("statsmodels", "batched")
+FORECAST_MODES = ("serial", "thread", "process")
+MODEL_FORMATS = ("compact", "pickle")
+# "sarimax": SARIMAX on consumption. "residual": weekly baseline plus a
+# cheaper SARIMAX on the residual over that baseline.
+VARIANTS_48H = ("sarimax", "residual")
+# "sarimax": one SARIMAX per group (or node). "global": one pooled ridge
+# regression over all groups per horizon.
+MODEL_FAMILIES = ("sarimax", "global")
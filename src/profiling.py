@@ -0,0 +1,293 @@
+"""
+Optional instrumentation for pipeline runs (main.py --profile).
+
+enable_profiling() wraps the functions of the pipeline modules with a
+timer; with trace_memory=True (main.py --profile-memory) it also tracks
+the peak traced (tracemalloc) memory of each call. Tracing slows the numpy
+kernels several times over, so only untraced timings are comparable between
+runs; stages record the process RSS either way. Calls are aggregated per function (count, total and max time, peak). The
+private helpers of the numerical kernels (PRIVATE_SKIPPED) run inside
+per-step loops and are left unwrapped, as wrapping them would dominate the
+timings. Stages in run_pipeline are timed with
+PROFILER.stage(), and the fit/forecast loops report per-group latencies with
+PROFILER.record(). write_report() stores everything as JSON and prints a
+summary table. When profiling is off nothing is wrapped and record() is a
+no-op.
+"""
+from __future__ import annotations
+import functools
+import importlib
+import inspect
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterable, List
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+PROFILE_DIR = PROJECT_ROOT / "Data" / "profiles"
+
+INSTRUMENTED_MODULES = (
+    "loadData",
+    "dataProcessing",
+    "pipelineData",
+    "parallel",
+    "modelStore",
+    "forecastEngine",
+    "batchedSARIMAX",
+    "stateSpace",
+    "hierarchy",
+    "orderSearch",
+    "stageCache",
+    "globalModel",
+    "train48Hours",
+    "train12Months",
+    "forecast48Hours",
+    "forecast12Months",
+    "updateModels",
+    "backtest",
+    "streamData",
+    "streamPipeline",
+    "converter",
+)
+# modules whose _private functions are inner-loop helpers, not stages
+PRIVATE_SKIPPED = ("stateSpace", "batchedSARIMAX")
+
+
+def _rss_bytes() -> int | None:
+    """Current resident set size, where the platform exposes it cheaply."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _peak_rss_bytes() -> int | None:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _megabytes(n_bytes: int | None) -> float:
+    return n_bytes / (1024 * 1024) if n_bytes else float("nan")
+
+
+class Profiler:
+    def __init__(self) -> None:
+        self.enabled = False
+        self.trace_memory = False
+        # per wrapped function: calls, total/max seconds, peak traced bytes
+        self.functions: Dict[str, dict] = {}
+        self.stages: List[dict] = []
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        # peak traced memory of finished children, per open frame
+        self._child_peaks: List[int] = []
+
+    def enable(self, trace_memory: bool = False) -> None:
+        # tracemalloc slows numpy-heavy code several times over, so the
+        # timings are only comparable between runs without it
+        self.enabled = True
+        self.trace_memory = trace_memory
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def _measure(self, result: dict):
+        """
+        Fills result with depth, seconds and peak_traced_bytes on exit; the
+        peak is None unless memory tracing is on.
+        """
+        # nesting is tracked on one stack, so only the main thread is measured
+        if not self.enabled or threading.current_thread() is not threading.main_thread():
+            yield
+            return
+        tracing = self.trace_memory and tracemalloc.is_tracing()
+        current_before = 0
+        if tracing:
+            current_before, peak_before = tracemalloc.get_traced_memory()
+            if self._child_peaks:
+                # reset_peak() below drops the enclosing call's peak so far; keep
+                # it with that frame (it reaches the outer frames when it exits)
+                self._child_peaks[-1] = max(self._child_peaks[-1], peak_before)
+            tracemalloc.reset_peak()
+        self._child_peaks.append(0)
+        depth = len(self._child_peaks) - 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            peak = self._child_peaks.pop()
+            if tracing:
+                peak = max(tracemalloc.get_traced_memory()[1], peak)
+                if self._child_peaks:
+                    self._child_peaks[-1] = max(self._child_peaks[-1], peak)
+            result.update(
+                depth=depth,
+                seconds=elapsed,
+                peak_traced_bytes=max(peak - current_before, 0) if tracing else None,
+            )
+
+    @contextmanager
+    def stage(self, name: str):
+        result: dict = {}
+        try:
+            with self._measure(result):
+                yield
+        finally:
+            if result:
+                self.stages.append({"name": name, **result, "rss_bytes": _rss_bytes()})
+
+    def record(self, category: str, seconds: float) -> None:
+        if self.enabled:
+            self.latencies[category].append(seconds)
+
+    def wrap(self, func, name: str):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            result: dict = {}
+            try:
+                with self._measure(result):
+                    return func(*args, **kwargs)
+            finally:
+                if result:
+                    self._add_call(name, result)
+        wrapper.__profiled__ = True
+        return wrapper
+
+    def _add_call(self, name: str, result: dict) -> None:
+        entry = self.functions.get(name)
+        if entry is None:
+            entry = self.functions[name] = {
+                "calls": 0, "total_seconds": 0.0, "max_seconds": 0.0, "peak_traced_bytes": None,
+            }
+        entry["calls"] += 1
+        entry["total_seconds"] += result["seconds"]
+        entry["max_seconds"] = max(entry["max_seconds"], result["seconds"])
+        if result["peak_traced_bytes"] is not None:
+            entry["peak_traced_bytes"] = max(entry["peak_traced_bytes"] or 0, result["peak_traced_bytes"])
+
+    def report(self) -> dict:
+        functions = {name: dict(entry) for name, entry in self.functions.items()}
+        latencies = {}
+        for category, values in self.latencies.items():
+            ordered = sorted(values)
+            latencies[category] = {
+                "count": len(ordered),
+                "total_seconds": sum(ordered),
+                "mean_seconds": sum(ordered) / len(ordered),
+                "p50_seconds": ordered[len(ordered) // 2],
+                "p95_seconds": ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)],
+                "max_seconds": ordered[-1],
+            }
+        return {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "argv": sys.argv,
+            "peak_rss_bytes": _peak_rss_bytes(),
+            "stages": self.stages,
+            "functions": functions,
+            "group_latencies": latencies,
+        }
+
+    def summary_table(self, report: dict | None = None) -> str:
+        report = report or self.report()
+        mb = 1024 * 1024
+        lines = [f"{'stage':<48}{'seconds':>10}{'peak MB':>10}{'RSS MB':>10}"]
+        for stage in report["stages"]:
+            rss = stage["rss_bytes"]
+            lines.append(
+                f"{stage['name']:<48}{stage['seconds']:>10.3f}"
+                f"{_megabytes(stage['peak_traced_bytes']):>10.1f}"
+                f"{_megabytes(rss):>10.1f}"
+            )
+        lines.append("")
+        lines.append(f"{'function':<48}{'calls':>7}{'total s':>10}{'max s':>10}{'peak MB':>10}")
+        by_time = sorted(report["functions"].items(), key=lambda kv: -kv[1]["total_seconds"])
+        for name, entry in by_time:
+            lines.append(
+                f"{name:<48}{entry['calls']:>7}{entry['total_seconds']:>10.3f}"
+                f"{entry['max_seconds']:>10.3f}{_megabytes(entry['peak_traced_bytes']):>10.1f}"
+            )
+        if report["group_latencies"]:
+            lines.append("")
+            lines.append(f"{'per-group latency':<48}{'count':>7}{'mean s':>10}{'p95 s':>10}{'max s':>10}")
+            for category, entry in report["group_latencies"].items():
+                lines.append(
+                    f"{category:<48}{entry['count']:>7}{entry['mean_seconds']:>10.4f}"
+                    f"{entry['p95_seconds']:>10.4f}{entry['max_seconds']:>10.4f}"
+                )
+        if report["peak_rss_bytes"]:
+            lines.append("")
+            lines.append(f"Peak RSS: {report['peak_rss_bytes'] / mb:.1f} MB")
+        return "\n".join(lines)
+
+
+PROFILER = Profiler()
+
+
+def instrument_modules(module_names: Iterable[str] = INSTRUMENTED_MODULES) -> int:
+    """
+    Replace every function defined in the given (already imported) modules
+    by a profiled wrapper, including the references other pipeline modules
+    (and the __main__ script) took with 'from module import name'. Returns
+    the number of functions wrapped.
+    """
+    modules = [sys.modules[name] for name in module_names if name in sys.modules]
+    wrapped = {}
+    for module in modules:
+        for attr, obj in list(vars(module).items()):
+            if (
+                inspect.isfunction(obj)
+                and obj.__module__ == module.__name__
+                and not getattr(obj, "__profiled__", False)
+                and not (attr.startswith("_") and module.__name__ in PRIVATE_SKIPPED)
+            ):
+                wrapped[id(obj)] = PROFILER.wrap(obj, f"{module.__name__}.{attr}")
+    main = sys.modules.get("__main__")
+    for module in modules + ([main] if main is not None else []):
+        for attr, obj in list(vars(module).items()):
+            if id(obj) in wrapped:
+                setattr(module, attr, wrapped[id(obj)])
+    return len(wrapped)
+
+
+def enable_profiling(
+    module_names: Iterable[str] = INSTRUMENTED_MODULES, trace_memory: bool = False,
+) -> None:
+    """
+    Start profiling. The modules are imported first: main imports some of
+    them lazily, and those must be instrumented before their functions are
+    looked up.
+    """
+    module_names = list(module_names)
+    for name in module_names:
+        importlib.import_module(name)
+    PROFILER.enable(trace_memory)
+    instrument_modules(module_names)
+
+
+def write_report(output_path: Path | str | None = None, verbose: bool = True) -> Path:
+    if output_path is None:
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        output_path = PROFILE_DIR / f"profile_{stamp}.json"
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    report = PROFILER.report()
+    output_path.write_text(json.dumps(report, indent=2, default=str))
+    if verbose:
+        print(PROFILER.summary_table(report))
+        print(f"\nProfile written to: {output_path}")
+    return output_path
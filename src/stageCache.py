@@ -0,0 +1,169 @@
+"""
+Content-hashed memoization of the pipeline stages. run_pipeline is a chain
+load -> prepare -> train -> forecast -> convert, and each stage is keyed on a
+hash of what it reads:
+- load and prepare: the workbook's content hash (loadData keeps the parsed
+  sheets under it; the prepared frames are derived in memory)
+- train: per group, a fingerprint of its training window, the exog and the
+  model spec, kept next to the models in <models dir>.fingerprints.json;
+  groups whose fingerprint and model are unchanged are not refitted
+- forecast: the model files, the future exog and the forecast parameters;
+  the forecast frames are pickled under Data/cache/stages
+- convert: the forecast frame and the template; the submission CSV is only
+  rewritten when they changed
+"""
+from __future__ import annotations
+import hashlib
+import json
+import os
+import pickle
+from pathlib import Path
+from typing import Callable, Dict, List, TypeVar
+import numpy as np
+import pandas as pd
+from modelStore import model_store_path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+STAGE_CACHE_DIR = PROJECT_ROOT / "Data" / "cache" / "stages"
+
+T = TypeVar("T")
+
+
+def _update(sha1, part) -> None:
+    if isinstance(part, pd.DataFrame):
+        sha1.update(repr(list(part.columns)).encode())
+        _update(sha1, part.index)
+        sha1.update(np.ascontiguousarray(part.to_numpy(dtype=float)).tobytes())
+    elif isinstance(part, pd.DatetimeIndex):
+        sha1.update(f"{part.tz}".encode())
+        sha1.update(np.ascontiguousarray(part.asi8).tobytes())
+    elif isinstance(part, pd.Index):
+        sha1.update(json.dumps(part.tolist(), default=str).encode())
+    elif isinstance(part, np.ndarray):
+        sha1.update(np.ascontiguousarray(part).tobytes())
+    else:
+        sha1.update(json.dumps(part, sort_keys=True, default=str).encode())
+    sha1.update(b"|")
+
+
+def content_hash(*parts) -> str:
+    """Hash of frames, arrays and JSON-able parameters, in order."""
+    sha1 = hashlib.sha1()
+    for part in parts:
+        _update(sha1, part)
+    return sha1.hexdigest()[:16]
+
+
+def models_fingerprint(models_root: Path, pattern: str) -> str:
+    """
+    Hash of the name, size and mtime of every model file matching pattern
+    under models_root (stores and pickles), so it moves whenever any model
+    is rewritten.
+    """
+    files = sorted(p for p in models_root.glob(pattern) if p.is_file())
+    for directory in sorted(p for p in models_root.glob(pattern) if p.is_dir()):
+        files.extend(sorted(directory.glob("group_*.pkl")))
+    stats = [(str(p.relative_to(models_root)), p.stat().st_size, p.stat().st_mtime_ns) for p in files]
+    return content_hash(stats)
+
+
+def fingerprints_path(models_dir: Path) -> Path:
+    """Data/models/sarimax_48h -> Data/models/sarimax_48h.fingerprints.json"""
+    return Path(models_dir).with_suffix(".fingerprints.json")
+
+
+def group_fingerprints(
+    cons: pd.DataFrame,
+    exog: pd.DataFrame | None,
+    group_ids: List,
+    params: dict,
+) -> Dict[object, str]:
+    """Per group: hash of its training window, the exog and the fit parameters."""
+    shared = content_hash(params, exog, cons.index)
+    return {gid: content_hash(shared, cons[gid].to_numpy(dtype=float)) for gid in group_ids}
+
+
+def _stored_groups(models_dir: Path, model_format: str) -> set:
+    store_path = model_store_path(models_dir)
+    if model_format == "compact":
+        if not store_path.exists():
+            return set()
+        with np.load(store_path, allow_pickle=False) as arrays:
+            return set(arrays["group_ids"].tolist())
+    names = (p.stem[len("group_"):] for p in Path(models_dir).glob("group_*.pkl"))
+    return {int(name) if name.isdigit() else name for name in names}
+
+
+def changed_groups(
+    models_dir: Path,
+    model_format: str,
+    fingerprints: Dict[object, str],
+) -> List:
+    """Groups whose fingerprint differs from their last fit, or that have no model."""
+    path = fingerprints_path(models_dir)
+    recorded = json.loads(path.read_text()) if path.exists() else {}
+    stored = _stored_groups(models_dir, model_format)
+    return [
+        gid for gid, fingerprint in fingerprints.items()
+        if gid not in stored or recorded.get(str(gid)) != fingerprint
+    ]
+
+
+def record_fingerprints(models_dir: Path, fingerprints: Dict[object, str]) -> None:
+    path = fingerprints_path(models_dir)
+    recorded = json.loads(path.read_text()) if path.exists() else {}
+    recorded.update({str(gid): fingerprint for gid, fingerprint in fingerprints.items()})
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".json.tmp")
+    tmp_path.write_text(json.dumps(recorded))
+    os.replace(tmp_path, path)
+
+
+class StageCache:
+    """
+    Stage outputs on disk, one entry per stage name; an entry is only used
+    when its key matches. enabled=False recomputes every stage (and still
+    stores the results).
+    """
+
+    def __init__(self, root: Path = STAGE_CACHE_DIR, enabled: bool = True, verbose: bool = True):
+        self.root = Path(root)
+        self.enabled = enabled
+        self.verbose = verbose
+
+    def _entry(self, name: str, key: str, suffix: str) -> Path:
+        return self.root / f"{name}.{key}{suffix}"
+
+    def _replace_entry(self, name: str, path: Path, suffix: str, payload: bytes) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        for stale in self.root.glob(f"{name}.*{suffix}"):
+            stale.unlink()
+        tmp_path = path.with_name(path.name + ".tmp")
+        tmp_path.write_bytes(payload)
+        os.replace(tmp_path, path)
+
+    def run(self, name: str, key: str, compute: Callable[[], T]) -> T:
+        """compute()'s result, from the cache if stage name last ran with key."""
+        path = self._entry(name, key, ".pkl")
+        if self.enabled and path.exists():
+            if self.verbose:
+                print(f"[{name}] inputs unchanged ({key}), using cached result")
+            with open(path, "rb") as f:
+                return pickle.load(f)
+        result = compute()
+        self._replace_entry(name, path, ".pkl", pickle.dumps(result))
+        return result
+
+    def write(self, name: str, key: str, output_path: Path, write: Callable[[], None]) -> bool:
+        """
+        Run write() (which produces output_path) unless stage name last wrote
+        output_path with key and the file is still there. Returns whether it ran.
+        """
+        path = self._entry(name, key, ".done")
+        if self.enabled and path.exists() and Path(output_path).exists():
+            if self.verbose:
+                print(f"[{name}] inputs unchanged ({key}), keeping {Path(output_path).name}")
+            return False
+        write()
+        self._replace_entry(name, path, ".done", str(output_path).encode())
+        return True
@@ -0,0 +1,300 @@
+"""
+NumPy-only linear Gaussian state space recursions for univariate models
+stored in the compact model format (see modelStore).
+
+    y_t     = Z a_t + d_t + e_t,        e_t ~ N(0, H)
+    a_{t+1} = T a_t + c + R n_t,        n_t ~ N(0, Q)
+
+Z is the design vector, d_t the observation intercept (exog @ beta for
+SARIMAX), T the transition, c the state intercept, R the selection and
+Q the state disturbance covariance.
+"""
+from __future__ import annotations
+from typing import Tuple
+import numpy as np
+
+
+def forecast_moments(
+    design: np.ndarray,
+    obs_cov: float,
+    transition: np.ndarray,
+    state_intercept: np.ndarray,
+    selection: np.ndarray,
+    state_cov: np.ndarray,
+    state: np.ndarray,
+    state_cov_t: np.ndarray,
+    obs_intercept: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Mean and variance of y over len(obs_intercept) steps, starting from the
+    one-step-ahead predicted state (state, state_cov_t).
+    """
+    steps = len(obs_intercept)
+    rqr = selection @ state_cov @ selection.T
+    mean = np.empty(steps)
+    var = np.empty(steps)
+    a, P = state, state_cov_t
+    for t in range(steps):
+        mean[t] = design @ a + obs_intercept[t]
+        var[t] = design @ P @ design + obs_cov
+        a = transition @ a + state_intercept
+        P = transition @ P @ transition.T + rqr
+    return mean, var
+
+
+def filter_forward(
+    design: np.ndarray,
+    obs_cov: float,
+    transition: np.ndarray,
+    state_intercept: np.ndarray,
+    selection: np.ndarray,
+    state_cov: np.ndarray,
+    state: np.ndarray,
+    state_cov_t: np.ndarray,
+    endog: np.ndarray,
+    obs_intercept: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Run the Kalman filter over endog starting from the predicted state
+    (state, state_cov_t) and return the predicted state and covariance for
+    the period after the last observation. NaN observations are treated as
+    missing (prediction step only).
+    """
+    rqr = selection @ state_cov @ selection.T
+    a, P = state, state_cov_t
+    for y, d in zip(endog, obs_intercept):
+        if np.isnan(y):
+            a = transition @ a + state_intercept
+            P = transition @ P @ transition.T + rqr
+            continue
+        PZ = P @ design
+        F = design @ PZ + obs_cov
+        v = y - design @ a - d
+        # filtered state, then one step ahead
+        a_filt = a + PZ * (v / F)
+        P_filt = P - np.outer(PZ, PZ) / F
+        a = transition @ a_filt + state_intercept
+        P = transition @ P_filt @ transition.T + rqr
+    return a, P
+
+
+def filter_states_at(
+    design: np.ndarray,
+    obs_cov: float,
+    transition: np.ndarray,
+    state_intercept: np.ndarray,
+    selection: np.ndarray,
+    state_cov: np.ndarray,
+    state: np.ndarray,
+    state_cov_t: np.ndarray,
+    endog: np.ndarray,
+    obs_intercept: np.ndarray,
+    positions: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    One filter pass over endog that records the predicted state and
+    covariance for each period in positions (i.e. before endog[i] is seen).
+    Forecasting from every recorded state gives rolling-origin forecasts
+    without refiltering the history for each origin.
+    """
+    positions = np.asarray(positions)
+    k = len(state)
+    states = np.empty((len(positions), k))
+    covs = np.empty((len(positions), k, k))
+    rqr = selection @ state_cov @ selection.T
+    a, P = state, state_cov_t
+    slot = 0
+    for t in range(int(positions.max()) + 1 if len(positions) else 0):
+        while slot < len(positions) and positions[slot] == t:
+            states[slot], covs[slot] = a, P
+            slot += 1
+        y = endog[t]
+        if np.isnan(y):
+            a = transition @ a + state_intercept
+            P = transition @ P @ transition.T + rqr
+            continue
+        PZ = P @ design
+        F = design @ PZ + obs_cov
+        v = y - design @ a - obs_intercept[t]
+        a = transition @ (a + PZ * (v / F)) + state_intercept
+        P = transition @ (P - np.outer(PZ, PZ) / F) @ transition.T + rqr
+    return states, covs
+
+
+# Batched versions for many groups at once: every argument gets a leading
+# group axis (design (G, k), transition (G, k, k), endog (G, n), ...), with
+# per-group parameters. The time loop stays in Python, the work per step is a
+# handful of stacked matrix products over all groups.
+
+def _matvec(matrix: np.ndarray, vector: np.ndarray) -> np.ndarray:
+    return (matrix @ vector[..., None])[..., 0]
+
+
+def forecast_moments_batch(
+    design: np.ndarray,
+    obs_cov: np.ndarray,
+    transition: np.ndarray,
+    state_intercept: np.ndarray,
+    selection: np.ndarray,
+    state_cov: np.ndarray,
+    state: np.ndarray,
+    state_cov_t: np.ndarray,
+    obs_intercept: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """forecast_moments for G groups; returns (G, steps) mean and variance."""
+    n_groups, steps = obs_intercept.shape
+    rqr = selection @ state_cov @ selection.transpose(0, 2, 1)
+    transition_t = transition.transpose(0, 2, 1)
+    mean = np.empty((n_groups, steps))
+    var = np.empty((n_groups, steps))
+    a, P = state, state_cov_t
+    for t in range(steps):
+        mean[:, t] = np.einsum("gk,gk->g", design, a) + obs_intercept[:, t]
+        var[:, t] = np.einsum("gk,gk->g", design, _matvec(P, design)) + obs_cov
+        a = _matvec(transition, a) + state_intercept
+        P = transition @ P @ transition_t + rqr
+    return mean, var
+
+
+def filter_loglike_batch(
+    design: np.ndarray,
+    obs_cov: np.ndarray,
+    transition: np.ndarray,
+    state_intercept: np.ndarray,
+    selection: np.ndarray,
+    state_cov: np.ndarray,
+    state: np.ndarray,
+    state_cov_t: np.ndarray,
+    endog: np.ndarray,
+    obs_intercept: np.ndarray,
+) -> Tuple[np.ndarray, ...]:
+    """
+    Kalman filter over endog (G, n) for G groups. Returns the predicted state
+    and covariance after the last observation plus, per group, the number of
+    observations, the sum of the one-step-ahead residuals v, of v**2 / F and
+    of log F (F the residual variance), from which the Gaussian loglikelihood
+    follows. NaN observations are treated as missing.
+    """
+    n_groups = endog.shape[0]
+    rqr = selection @ state_cov @ selection.transpose(0, 2, 1)
+    transition_t = transition.transpose(0, 2, 1)
+    observed = ~np.isnan(endog)
+    nobs = observed.sum(axis=1)
+    resid_sum = np.zeros(n_groups)
+    scaled_sq_sum = np.zeros(n_groups)
+    log_var_sum = np.zeros(n_groups)
+    a, P = state, state_cov_t
+    for t in range(endog.shape[1]):
+        seen = observed[:, t]
+        PZ = _matvec(P, design)
+        F = np.einsum("gk,gk->g", design, PZ) + obs_cov
+        v = np.where(seen, endog[:, t] - np.einsum("gk,gk->g", design, a) - obs_intercept[:, t], 0.0)
+        # missing observations get a zero gain, i.e. prediction step only
+        gain = np.where(seen, 1.0 / F, 0.0)
+        resid_sum += v
+        scaled_sq_sum += v * v * gain
+        log_var_sum += np.where(seen, np.log(np.abs(F)), 0.0)
+        a_filt = a + PZ * (v * gain)[:, None]
+        P_filt = P - PZ[:, :, None] * PZ[:, None, :] * gain[:, None, None]
+        a = _matvec(transition, a_filt) + state_intercept
+        P = transition @ P_filt @ transition_t + rqr
+    return a, P, nobs, resid_sum, scaled_sq_sum, log_var_sum
+
+
+def chandrasekhar_batch(
+    design: np.ndarray,
+    obs_cov: np.ndarray,
+    transition: np.ndarray,
+    state_cov_t: np.ndarray,
+    endog: np.ndarray,
+    exog: np.ndarray | None = None,
+) -> Tuple[np.ndarray, ...]:
+    """
+    Kalman filter of endog (G, n) and of every exog column (n, m) through
+    each group's time-invariant system with zero intercepts, started from
+    the stationary covariance state_cov_t and a zero state. The gains do not
+    depend on the data, so all 1 + m series share one recursion; since
+    filtering is linear in the data, the regression on exog can then be
+    profiled out of the likelihood.
+
+    Uses the Chandrasekhar recursions: started from the stationary
+    covariance, P_{t+1} - P_t has rank one, so the covariance is carried as
+    that increment W_t M_t W_t' and a step costs O(k^2) instead of O(k^3).
+    endog must not contain NaN.
+
+    Returns, with s = 1 + m series (endog first), the predicted states after
+    the last observation (G, k, s), the sums of the one-step-ahead residuals
+    (G, s), of their cross products scaled by the residual variance F,
+    sum v v' / F (G, s, s), and of log F (G,).
+    """
+    n_groups, n_obs = endog.shape
+    if exog is None:
+        exog = np.zeros((n_obs, 0))
+    n_series = 1 + exog.shape[1]
+    pz = _matvec(state_cov_t, design)
+    F = np.einsum("gk,gk->g", design, pz) + obs_cov
+    gain = _matvec(transition, pz) / F[:, None]
+    # P_2 - P_1 = -K F K' when P_1 = T P_1 T' + RQR'
+    W = gain.copy()
+    M = -F
+    a = np.zeros((n_groups, design.shape[1], n_series))
+    resid_sum = np.zeros((n_groups, n_series))
+    cross_sum = np.zeros((n_groups, n_series, n_series))
+    log_var_sum = np.zeros(n_groups)
+    for t in range(n_obs):
+        observed = np.concatenate([endog[:, t, None], np.broadcast_to(exog[t], (n_groups, n_series - 1))], axis=1)
+        v = observed - np.einsum("gk,gks->gs", design, a)
+        resid_sum += v
+        cross_sum += v[:, :, None] * (v / F[:, None])[:, None, :]
+        log_var_sum += np.log(np.abs(F))
+        # one product with T for the states of all series and the increment
+        moved = transition @ np.concatenate([a, W[:, :, None]], axis=2)
+        a = moved[:, :, :-1] + gain[:, :, None] * v[:, None, :]
+        tw = moved[:, :, -1]
+        zw = np.einsum("gk,gk->g", design, W)
+        F_next = F + zw * M * zw
+        gain = (gain * F[:, None] + tw * (M * zw)[:, None]) / F_next[:, None]
+        M = M + M * zw * zw * M / F
+        W = tw - gain * zw[:, None]
+        F = F_next
+    return a, resid_sum, cross_sum, log_var_sum
+
+
+def filter_forward_batch(
+    design: np.ndarray,
+    obs_cov: np.ndarray,
+    transition: np.ndarray,
+    state_intercept: np.ndarray,
+    selection: np.ndarray,
+    state_cov: np.ndarray,
+    state: np.ndarray,
+    state_cov_t: np.ndarray,
+    endog: np.ndarray,
+    obs_intercept: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """filter_forward for G groups."""
+    return filter_loglike_batch(
+        design, obs_cov, transition, state_intercept, selection, state_cov,
+        state, state_cov_t, endog, obs_intercept,
+    )[:2]
+
+
+def stationary_state_cov_batch(
+    transition: np.ndarray,
+    rqr: np.ndarray,
+    tol: float = 1e-12,
+    max_iter: int = 40,
+) -> np.ndarray:
+    """
+    Unconditional state covariance P = T P T' + RQR' for G stationary
+    systems, by the doubling algorithm (each pass doubles the number of
+    terms of the series sum_j T^j RQR' T'^j).
+    """
+    P = rqr.copy()
+    A = transition.copy()
+    for _ in range(max_iter):
+        P = P + A @ P @ A.transpose(0, 2, 1)
+        A = A @ A
+        if np.max(np.abs(A)) < tol:
+            break
+    return P
@@ -0,0 +1,221 @@
+"""
+Streaming consumption ingestion. ConsumptionSource reads a consumption
+export in group batches or time chunks, as float32 arrays, so the whole
+hourly history never has to be in memory at once. Supported exports are
+CSV and Parquet, in the wide layout of the training sheet (measured_at plus
+one column per group) or in long layout (measured_at, group_id, fwh; sorted
+by measured_at for time chunks). An Excel workbook is converted once to a
+Parquet file in Data/cache and streamed from there.
+"""
+from __future__ import annotations
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Sequence
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+from loadData import CACHE_DIR, TRAINING_EXCEL, _read_sheet, workbook_cache_key, workbook_digest
+
+STREAM_FORMATS = (".xlsx", ".csv", ".parquet")
+TIMESTAMP_COLUMN = "measured_at"
+LONG_COLUMNS = ("measured_at", "group_id", "fwh")
+DEFAULT_BATCH_GROUPS = 256
+DEFAULT_CHUNK_HOURS = 24 * 28
+CSV_CHUNK_ROWS = 500_000
+
+
+@dataclass
+class ConsumptionBatch:
+    """Consumption of group_ids over index, as a (hours, groups) float32 array."""
+    index: pd.DatetimeIndex
+    group_ids: List
+    values: np.ndarray
+
+    def frame(self) -> pd.DataFrame:
+        return pd.DataFrame(self.values, index=self.index, columns=self.group_ids, copy=False)
+
+
+def _group_id(name):
+    return int(name) if str(name).isdigit() else name
+
+
+def _excel_to_parquet(path: Path) -> Path:
+    """The workbook's consumption sheet as Parquet, cached by workbook content."""
+    digest = workbook_digest(path)
+    key = workbook_cache_key(path)
+    parquet_path = CACHE_DIR / f"{key}.training_consumption.{digest[:16]}.parquet"
+    if not parquet_path.exists():
+        df = _read_sheet(path, sheet_name="training_consumption")
+        df.columns = [str(c) for c in df.columns]
+        for stale in CACHE_DIR.glob(f"{key}.training_consumption.*.parquet"):
+            stale.unlink()
+        df.to_parquet(parquet_path, index=False)
+    return parquet_path
+
+
+def _complete_hours(chunks: Iterable[pd.DataFrame]) -> Iterator[pd.DataFrame]:
+    """
+    Re-cut time-sorted long chunks so that no timestamp is split between two
+    of them: the rows of the last timestamp of a chunk move to the next one.
+    """
+    pending = None
+    for chunk in chunks:
+        if pending is not None:
+            chunk = pd.concat([pending, chunk], ignore_index=True)
+        tail = (chunk[TIMESTAMP_COLUMN] == chunk[TIMESTAMP_COLUMN].iloc[-1]).to_numpy()
+        pending = chunk[tail]
+        if not tail.all():
+            yield chunk[~tail]
+    if pending is not None and len(pending):
+        yield pending
+
+
+class ConsumptionSource:
+    def __init__(
+        self,
+        path: Path | str = TRAINING_EXCEL,
+        sep: str = ";",
+        decimal: str = ",",
+    ):
+        path = Path(path)
+        if path.suffix.lower() not in STREAM_FORMATS:
+            raise ValueError(
+                f"Cannot stream {path.name}; supported formats: {', '.join(STREAM_FORMATS)}"
+            )
+        if path.suffix.lower() == ".xlsx":
+            path = _excel_to_parquet(path)
+        self.path = path
+        self.sep = sep
+        self.decimal = decimal
+        self.parquet = path.suffix.lower() == ".parquet"
+        if self.parquet:
+            columns = pq.ParquetFile(path).schema_arrow.names
+        else:
+            columns = list(pd.read_csv(path, sep=sep, nrows=0).columns)
+        self.long = set(LONG_COLUMNS) <= set(columns)
+        self._columns = [c for c in columns if c != TIMESTAMP_COLUMN]
+
+    def _csv_chunks(self, usecols: Sequence[str], rows: int = CSV_CHUNK_ROWS, dtype=None):
+        return pd.read_csv(
+            self.path, sep=self.sep, decimal=self.decimal,
+            usecols=list(usecols), dtype=dtype, chunksize=rows,
+        )
+
+    def _column_chunks(self, column: str) -> Iterator[pd.Series]:
+        if self.parquet:
+            for record_batch in pq.ParquetFile(self.path).iter_batches(columns=[column]):
+                yield record_batch.column(0).to_pandas()
+        else:
+            for chunk in self._csv_chunks([column]):
+                yield chunk[column]
+
+    def group_ids(self) -> List:
+        if not self.long:
+            return [_group_id(c) for c in self._columns]
+        ids: set = set()
+        for values in self._column_chunks("group_id"):
+            ids.update(values.unique().tolist())
+        return sorted(ids)
+
+    def index(self) -> pd.DatetimeIndex:
+        stamps = pd.concat([s.drop_duplicates() for s in self._column_chunks(TIMESTAMP_COLUMN)])
+        return pd.DatetimeIndex(pd.to_datetime(stamps.unique(), utc=True)).sort_values()
+
+    def _to_batch(self, df: pd.DataFrame, group_ids: List) -> ConsumptionBatch:
+        if self.long:
+            df = df.pivot(index=TIMESTAMP_COLUMN, columns="group_id", values="fwh")
+            df = df.reindex(columns=group_ids)
+        else:
+            df = df.set_index(TIMESTAMP_COLUMN)
+        df.index = pd.to_datetime(df.index, utc=True)
+        df = df.sort_index()
+        return ConsumptionBatch(df.index, list(group_ids), df.to_numpy(dtype=np.float32))
+
+    def _read_groups(self, group_ids: List) -> pd.DataFrame:
+        if self.long:
+            if self.parquet:
+                table = pq.read_table(
+                    self.path, columns=list(LONG_COLUMNS),
+                    filters=[("group_id", "in", list(group_ids))],
+                )
+                return table.to_pandas()
+            wanted = set(group_ids)
+            parts = [c[c["group_id"].isin(wanted)] for c in self._csv_chunks(LONG_COLUMNS)]
+            return pd.concat(parts, ignore_index=True)
+        names = [TIMESTAMP_COLUMN] + [str(gid) for gid in group_ids]
+        if self.parquet:
+            return pq.read_table(self.path, columns=names).to_pandas()
+        return pd.read_csv(
+            self.path, sep=self.sep, decimal=self.decimal, usecols=names,
+            dtype={name: np.float32 for name in names[1:]},
+        )[names]
+
+    def iter_group_batches(
+        self,
+        batch_groups: int = DEFAULT_BATCH_GROUPS,
+        group_ids: Optional[Sequence] = None,
+        start: pd.Timestamp | None = None,
+    ) -> Iterator[ConsumptionBatch]:
+        """
+        Full history (from start, if given) of batch_groups groups at a time.
+        Peak memory is one batch of raw columns plus its float32 copy.
+        """
+        group_ids = self.group_ids() if group_ids is None else list(group_ids)
+        for i in range(0, len(group_ids), batch_groups):
+            batch = self._to_batch(self._read_groups(group_ids[i:i + batch_groups]),
+                                   group_ids[i:i + batch_groups])
+            if start is not None:
+                keep = batch.index >= start
+                batch = ConsumptionBatch(batch.index[keep], batch.group_ids, batch.values[keep])
+            yield batch
+
+    def iter_time_chunks(
+        self,
+        chunk_hours: int = DEFAULT_CHUNK_HOURS,
+        group_ids: Optional[Sequence] = None,
+    ) -> Iterator[ConsumptionBatch]:
+        """All groups (or group_ids), chunk_hours timestamps at a time."""
+        group_ids = self.group_ids() if group_ids is None else list(group_ids)
+        if self.long:
+            rows = chunk_hours * max(len(group_ids), 1)
+            if self.parquet:
+                chunks = (
+                    b.to_pandas()
+                    for b in pq.ParquetFile(self.path).iter_batches(
+                        batch_size=rows, columns=list(LONG_COLUMNS)
+                    )
+                )
+            else:
+                chunks = self._csv_chunks(LONG_COLUMNS, rows=rows)
+            wanted = set(group_ids)
+            for chunk in _complete_hours(chunks):
+                yield self._to_batch(chunk[chunk["group_id"].isin(wanted)], group_ids)
+            return
+        names = [TIMESTAMP_COLUMN] + [str(gid) for gid in group_ids]
+        if self.parquet:
+            chunks = (
+                b.to_pandas()
+                for b in pq.ParquetFile(self.path).iter_batches(batch_size=chunk_hours, columns=names)
+            )
+        else:
+            chunks = self._csv_chunks(
+                names, rows=chunk_hours, dtype={name: np.float32 for name in names[1:]}
+            )
+        for chunk in chunks:
+            yield self._to_batch(chunk[names], group_ids)
+
+
+def monthly_consumption(
+    source: ConsumptionSource,
+    chunk_hours: int = DEFAULT_CHUNK_HOURS,
+    group_ids: Optional[Sequence] = None,
+) -> pd.DataFrame:
+    """
+    Monthly totals per group (as prepare_monthly_training builds them),
+    accumulated over time chunks. Months split between two chunks are summed.
+    """
+    parts = [
+        chunk.frame().astype(float).resample("MS").sum()
+        for chunk in source.iter_time_chunks(chunk_hours, group_ids)
+    ]
+    return pd.concat(parts).groupby(level=0).sum().sort_index()
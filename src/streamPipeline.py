@@ -0,0 +1,118 @@
+"""
+Training and forecasting on streamed consumption. The 48h horizon runs the
+regular train/forecast functions batch by batch over group batches read from
+a ConsumptionSource, so only one batch of hourly history is in memory at a
+time; the compact model store is merged batch by batch. The 12m horizon only
+needs monthly totals, which are accumulated over time chunks.
+"""
+from __future__ import annotations
+from dataclasses import replace
+from typing import Dict, Optional
+import pandas as pd
+from forecast12Months import forecast_12m
+from forecast48Hours import forecast_48h
+from pipelineData import PipelineData
+from streamData import (
+    DEFAULT_BATCH_GROUPS,
+    DEFAULT_CHUNK_HOURS,
+    ConsumptionSource,
+    monthly_consumption,
+)
+from train12Months import train_sarimax_12m
+from train48Hours import train_sarimax_48h
+
+# history kept before a 48h window: the weekly baseline of the residual variant
+BASELINE_DAYS = 7
+
+
+def _group_ids(source: ConsumptionSource, max_groups: Optional[int]) -> list:
+    group_ids = source.group_ids()
+    return group_ids if max_groups is None else group_ids[:max_groups]
+
+
+def train_streaming_48h(
+    source: ConsumptionSource,
+    context: PipelineData,
+    batch_groups: int = DEFAULT_BATCH_GROUPS,
+    train_days: int = 365,
+    max_groups: Optional[int] = None,
+    verbose: bool = True,
+    **train_kwargs,
+) -> Dict[object, Optional[str]]:
+    """train_sarimax_48h over group batches; train_kwargs are passed through."""
+    group_ids = _group_ids(source, max_groups)
+    start = source.index().max() - pd.Timedelta(days=train_days + BASELINE_DAYS)
+    errors: Dict[object, Optional[str]] = {}
+    for n, batch in enumerate(source.iter_group_batches(batch_groups, group_ids, start), start=1):
+        if verbose:
+            print(f"--- Batch {n}: {len(batch.group_ids)} groups, {len(batch.index)} hours ---")
+        errors.update(train_sarimax_48h(
+            train_days=train_days,
+            data=context.with_consumption(batch.frame()),
+            verbose=verbose,
+            **train_kwargs,
+        ))
+    return errors
+
+
+def forecast_streaming_48h(
+    source: ConsumptionSource,
+    context: PipelineData,
+    batch_groups: int = DEFAULT_BATCH_GROUPS,
+    max_groups: Optional[int] = None,
+    verbose: bool = True,
+    **forecast_kwargs,
+) -> pd.DataFrame:
+    """
+    forecast_48h over group batches (with return_variance, concatenated
+    (forecast, variance) frames). The compact models carry their own
+    state, so each batch reads only the last days of history (for the
+    forecast index, the future exog and the residual variant's baseline).
+    """
+    group_ids = _group_ids(source, max_groups)
+    start = source.index().max() - pd.Timedelta(days=BASELINE_DAYS + 1)
+    frames = []
+    for n, batch in enumerate(source.iter_group_batches(batch_groups, group_ids, start), start=1):
+        if verbose:
+            print(f"--- Batch {n}: forecasting {len(batch.group_ids)} groups ---")
+        frames.append(forecast_48h(
+            data=context.with_consumption(batch.frame()),
+            verbose=verbose and n == 1,
+            **forecast_kwargs,
+        ))
+    if forecast_kwargs.get("return_variance"):
+        return tuple(pd.concat(parts, axis=1) for parts in zip(*frames))
+    return pd.concat(frames, axis=1)
+
+
+def monthly_data(
+    source: ConsumptionSource,
+    context: PipelineData,
+    chunk_hours: int = DEFAULT_CHUNK_HOURS,
+    max_groups: Optional[int] = None,
+) -> PipelineData:
+    """context with the monthly totals precomputed, for the 12m stages."""
+    monthly = monthly_consumption(source, chunk_hours, _group_ids(source, max_groups))
+    return replace(context, monthly_consumption=monthly, consumption_end=source.index().max())
+
+
+def train_streaming_12m(
+    source: ConsumptionSource,
+    context: PipelineData,
+    chunk_hours: int = DEFAULT_CHUNK_HOURS,
+    max_groups: Optional[int] = None,
+    **train_kwargs,
+) -> Dict[object, Optional[str]]:
+    data = monthly_data(source, context, chunk_hours, max_groups)
+    return train_sarimax_12m(data=data, **train_kwargs)
+
+
+def forecast_streaming_12m(
+    source: ConsumptionSource,
+    context: PipelineData,
+    chunk_hours: int = DEFAULT_CHUNK_HOURS,
+    max_groups: Optional[int] = None,
+    **forecast_kwargs,
+) -> pd.DataFrame:
+    data = monthly_data(source, context, chunk_hours, max_groups)
+    return forecast_12m(data=data, **forecast_kwargs)
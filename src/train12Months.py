@@ -0,0 +1,155 @@
+from __future__ import annotations
+from pathlib import Path
+from typing import Dict, Optional
+import numpy as np
+import pandas as pd
+from batchedSARIMAX import fit_groups_batched
+from forecast12Months import default_models_dir_12m
+from hierarchy import aggregate_to_nodes, group_nodes
+from orderSearch import ORDER_CANDIDATES_12M, select_orders
+from parallel import fit_groups, warm_start_kwargs
+from pipelineData import PipelineData
+from stageCache import changed_groups, group_fingerprints, record_fingerprints
+from updateModels import update_model_store
+
+ORDER_12M = (1, 0, 0)
+SEASONAL_ORDER_12M = (1, 0, 0, 12)
+
+def fit_group_12m(
+    y: pd.Series,
+    exog: pd.DataFrame | None,
+    order: tuple = ORDER_12M,
+    seasonal_order: tuple = SEASONAL_ORDER_12M,
+    start_params=None,
+    maxiter: int = 50,
+):
+    # statsmodels (and scipy) take seconds to import; only fits need them
+    from statsmodels.tsa.statespace.sarimax import SARIMAX
+
+    model = SARIMAX(
+        y,
+        exog=exog,
+        order=order,
+        seasonal_order=seasonal_order,
+    )
+    if start_params is not None and len(start_params) != len(model.param_names):
+        start_params = None  # stored model has a different spec
+    results = model.fit(start_params=start_params, disp=False, maxiter=maxiter)
+    results.residual_bias = float(np.nanmean(results.resid))
+    return results
+
+def train_sarimax_12m(
+    train_months: Optional[int] = None,
+    max_groups: Optional[int] = None,
+    models_dir: Path | None = None,
+    verbose: bool = True,
+    data: PipelineData | None = None,
+    workers: int = 1,
+    model_format: str = "compact",
+    warm_start: bool = False,
+    backend: str = "statsmodels",
+    hierarchical: bool = False,
+    auto_order: bool = False,
+    skip_unchanged: bool = False,
+) -> Dict[object, Optional[str]]:
+    if models_dir is None:
+        models_dir = default_models_dir_12m(hierarchical)
+    models_dir = Path(models_dir)
+    if data is None:
+        data = PipelineData.load()
+    cons_monthly, exog_monthly = data.monthly_training
+    if hierarchical:
+        nodes = group_nodes(data.group_metadata, list(cons_monthly.columns)[:max_groups])
+        cons_monthly = aggregate_to_nodes(cons_monthly, nodes)
+        max_groups = None
+    complete_through = data.complete_through_12m
+    partial = None
+    if (model_format == "compact" and complete_through is not None
+            and cons_monthly.index[-1] > complete_through):
+        # the running month's total is partial: fit on the complete months and
+        # filter it in afterwards, keeping a checkpoint that updates rewind to
+        partial = (cons_monthly, exog_monthly)
+        keep = cons_monthly.index <= complete_through
+        cons_monthly, exog_monthly = cons_monthly[keep], exog_monthly[keep]
+    if train_months is not None:
+        cons_monthly = cons_monthly.iloc[-train_months:]
+        exog_monthly = exog_monthly.iloc[-train_months:]
+    group_ids = list(cons_monthly.columns)
+    if max_groups is not None:
+        group_ids = group_ids[:max_groups]
+    if verbose:
+        print(f"Saving monthly models to: {models_dir}")
+        print(f"Training window: {cons_monthly.index[0]} -> {cons_monthly.index[-1]} "
+              f"({len(cons_monthly)} months)")
+        print(f"Number of {'nodes' if hierarchical else 'groups'} to train: {len(group_ids)} "
+              f"(backend: {backend}, workers: {workers})")
+    fingerprints = group_fingerprints(
+        cons_monthly, exog_monthly, group_ids,
+        {"order": ORDER_12M, "seasonal_order": SEASONAL_ORDER_12M,
+         "backend": backend, "auto_order": auto_order},
+    )
+    if skip_unchanged:
+        group_ids = changed_groups(models_dir, model_format, fingerprints)
+        if verbose:
+            print(f"Skipping {len(fingerprints) - len(group_ids)} unchanged since their last fit; "
+                  f"{len(group_ids)} to train")
+        if not group_ids:
+            return {}
+    group_fit_kwargs = warm_start_kwargs(models_dir, group_ids) if warm_start else {}
+    if auto_order:
+        # a few dozen months: every candidate gets a full fit, no pruning
+        selected = select_orders(
+            fit_group_12m,
+            cons_monthly,
+            exog_monthly,
+            group_ids,
+            ORDER_CANDIDATES_12M,
+            cache_name=models_dir.name,
+            workers=workers,
+            verbose=verbose,
+        )
+        group_fit_kwargs.update(selected)
+    if backend == "batched":
+        errors = fit_groups_batched(
+            cons_monthly,
+            exog_monthly,
+            group_ids,
+            models_dir,
+            ORDER_12M,
+            SEASONAL_ORDER_12M,
+            verbose=verbose,
+            model_format=model_format,
+            start_params={gid: kw["start_params"] for gid, kw in group_fit_kwargs.items()},
+            group_orders={
+                gid: (kw["order"], kw["seasonal_order"])
+                for gid, kw in group_fit_kwargs.items() if "order" in kw
+            },
+        )
+    else:
+        errors = fit_groups(
+            fit_group_12m,
+            cons_monthly,
+            exog_monthly,
+            group_ids,
+            models_dir,
+            workers=workers,
+            verbose=verbose,
+            model_format=model_format,
+            group_fit_kwargs={
+                gid: {k: kw[k] for k in ("order", "seasonal_order", "start_params") if k in kw}
+                for gid, kw in group_fit_kwargs.items()
+            },
+        )
+    trained = [gid for gid, err in errors.items() if not err]
+    if partial is not None and trained:
+        cons_all, exog_all = partial
+        update_model_store(
+            models_dir, cons_all[trained], exog_all, verbose=False,
+            complete_through=complete_through,
+        )
+    record_fingerprints(models_dir, {gid: fingerprints[gid] for gid in trained})
+    failed = [gid for gid, err in errors.items() if err]
+    if verbose and failed:
+        print(f"WARNING: training failed for {len(failed)} groups: "
+              f"{', '.join(str(g) for g in failed)}")
+    return errors
@@ -0,0 +1,164 @@
+from __future__ import annotations
+from pathlib import Path
+from typing import Dict, Optional
+import numpy as np
+import pandas as pd
+from batchedSARIMAX import fit_groups_batched
+from dataProcessing import build_weekly_residuals_48h
+from forecast48Hours import default_models_dir_48h
+from hierarchy import aggregate_to_nodes, group_nodes
+from orderSearch import (
+    ORDER_CANDIDATES_48H,
+    ORDER_CANDIDATES_48H_RESIDUAL,
+    PRUNE_HOURS_48H,
+    select_orders,
+)
+from parallel import fit_groups, warm_start_kwargs
+from pipelineData import PipelineData
+from stageCache import changed_groups, group_fingerprints, record_fingerprints
+
+ORDER_48H = (1, 0, 1)
+SEASONAL_ORDER_48H = (1, 0, 1, 24)
+# the weekly baseline already carries the daily/weekly profile
+RESIDUAL_ORDER_48H = (1, 0, 1)
+RESIDUAL_SEASONAL_ORDER_48H = (0, 0, 0, 0)
+
+def fit_group_48h(
+    y: pd.Series,
+    exog: pd.DataFrame | None,
+    order: tuple = ORDER_48H,
+    seasonal_order: tuple = SEASONAL_ORDER_48H,
+    start_params=None,
+    maxiter: int = 50,
+):
+    # statsmodels (and scipy) take seconds to import; only fits need them
+    from statsmodels.tsa.statespace.sarimax import SARIMAX
+
+    model = SARIMAX(
+        y,
+        exog=exog,
+        order=order,
+        seasonal_order=seasonal_order,
+        enforce_stationarity=False,
+        enforce_invertibility=False,
+    )
+    if start_params is not None and len(start_params) != len(model.param_names):
+        start_params = None  # stored model has a different spec
+    results = model.fit(start_params=start_params, disp=False, maxiter=maxiter)
+    results.residual_bias = float(np.nanmean(results.resid))
+    return results
+
+def train_sarimax_48h(
+    train_days: int = 365,
+    max_groups: Optional[int] = None,
+    models_dir: Path | None = None,
+    verbose: bool = True,
+    data: PipelineData | None = None,
+    workers: int = 1,
+    model_format: str = "compact",
+    warm_start: bool = False,
+    variant: str = "sarimax",
+    backend: str = "statsmodels",
+    hierarchical: bool = False,
+    auto_order: bool = False,
+    skip_unchanged: bool = False,
+) -> Dict[object, Optional[str]]:
+    if models_dir is None:
+        models_dir = default_models_dir_48h(variant, hierarchical)
+    models_dir = Path(models_dir)
+    if data is None:
+        data = PipelineData.load()
+    cons_aligned, exog = data.hourly_training
+    if hierarchical:
+        # one model per segment x product_type node (and the total) instead of per group
+        nodes = group_nodes(data.group_metadata, list(cons_aligned.columns)[:max_groups])
+        cons_aligned = aggregate_to_nodes(cons_aligned, nodes)
+        max_groups = None
+    fit_kwargs = {"order": ORDER_48H, "seasonal_order": SEASONAL_ORDER_48H}
+    if variant == "residual":
+        cons_aligned = build_weekly_residuals_48h(cons_aligned)
+        fit_kwargs = {
+            "order": RESIDUAL_ORDER_48H,
+            "seasonal_order": RESIDUAL_SEASONAL_ORDER_48H,
+        }
+    group_ids = list(cons_aligned.columns)
+    if max_groups is not None:
+        group_ids = group_ids[:max_groups]
+    # missing hours stay in as NaN (the Kalman filter skips them), so every
+    # group's series keeps its hourly spacing; only leading hours where no
+    # group has a value (e.g. the residual variant's first week) are cut
+    train_start = cons_aligned.index.max() - pd.Timedelta(days=train_days)
+    window = cons_aligned.index > train_start
+    observed = cons_aligned.loc[window, group_ids].notna().any(axis=1).to_numpy()
+    first = int(np.argmax(observed)) if observed.any() else len(observed)
+    cons_train = cons_aligned.loc[window].iloc[first:]
+    exog_train = exog.loc[window].iloc[first:]
+    if verbose:
+        print(f"Saving models to: {models_dir}")
+        print(f"Training window: {cons_train.index[0]} -> {cons_train.index[-1]} "
+              f"({len(cons_train)} hours)")
+        print(f"Number of {'nodes' if hierarchical else 'groups'} to train: {len(group_ids)} "
+              f"(variant: {variant}, backend: {backend}, workers: {workers})")
+    fingerprints = group_fingerprints(
+        cons_train, exog_train, group_ids,
+        {**fit_kwargs, "variant": variant, "backend": backend, "auto_order": auto_order},
+    )
+    if skip_unchanged:
+        group_ids = changed_groups(models_dir, model_format, fingerprints)
+        if verbose:
+            print(f"Skipping {len(fingerprints) - len(group_ids)} unchanged since their last fit; "
+                  f"{len(group_ids)} to train")
+        if not group_ids:
+            return {}
+    group_fit_kwargs = warm_start_kwargs(models_dir, group_ids) if warm_start else {}
+    if auto_order:
+        selected = select_orders(
+            fit_group_48h,
+            cons_train,
+            exog_train,
+            group_ids,
+            ORDER_CANDIDATES_48H_RESIDUAL if variant == "residual" else ORDER_CANDIDATES_48H,
+            cache_name=models_dir.name,
+            prune_rows=PRUNE_HOURS_48H,
+            align_hours=7 * 24,
+            workers=workers,
+            verbose=verbose,
+        )
+        group_fit_kwargs.update(selected)
+    if backend == "batched":
+        errors = fit_groups_batched(
+            cons_train,
+            exog_train,
+            group_ids,
+            models_dir,
+            verbose=verbose,
+            model_format=model_format,
+            start_params={gid: kw["start_params"] for gid, kw in group_fit_kwargs.items()},
+            group_orders={
+                gid: (kw["order"], kw["seasonal_order"])
+                for gid, kw in group_fit_kwargs.items() if "order" in kw
+            },
+            **fit_kwargs,
+        )
+    else:
+        errors = fit_groups(
+            fit_group_48h,
+            cons_train,
+            exog_train,
+            group_ids,
+            models_dir,
+            workers=workers,
+            verbose=verbose,
+            fit_kwargs=fit_kwargs,
+            model_format=model_format,
+            group_fit_kwargs={
+                gid: {k: kw[k] for k in ("order", "seasonal_order", "start_params") if k in kw}
+                for gid, kw in group_fit_kwargs.items()
+            },
+        )
+    record_fingerprints(models_dir, {gid: fingerprints[gid] for gid, err in errors.items() if not err})
+    failed = [gid for gid, err in errors.items() if err]
+    if verbose and failed:
+        print(f"WARNING: training failed for {len(failed)} groups: "
+              f"{', '.join(str(g) for g in failed)}")
+    return errors
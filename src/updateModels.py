@@ -0,0 +1,126 @@
+"""
+Incremental model updates. Instead of refitting, the compact models are
+filtered forward over the observations that arrived after their
+last_timestamp, with the parameters kept fixed. A periodic full refit can
+be warm-started from the stored parameters (train_sarimax_48h/12m with
+warm_start=True).
+
+A monthly model updated in the middle of a month has filtered that month's
+partial total. It keeps a checkpoint of its state as of the last complete
+month, and the next update rewinds to it and filters that month again with
+the hours that have arrived since.
+"""
+from __future__ import annotations
+from pathlib import Path
+from typing import Dict, Optional
+import numpy as np
+import pandas as pd
+from modelStore import load_model_store, model_store_path, save_model_store
+from pipelineData import PipelineData
+from dataProcessing import build_weekly_residuals_48h
+from hierarchy import aggregate_to_nodes, group_nodes
+from forecast48Hours import default_models_dir_48h
+from forecast12Months import default_models_dir_12m
+
+
+def update_model_store(
+    models_dir: Path | str,
+    cons: pd.DataFrame,
+    exog: pd.DataFrame | None,
+    max_groups: Optional[int] = None,
+    verbose: bool = True,
+    complete_through: pd.Timestamp | None = None,
+) -> Dict[object, int]:
+    """
+    Filter every stored model forward over the rows of cons (and exog) after
+    the model's last_timestamp and write the store back. Rows after
+    complete_through are partial periods: they are filtered too, but the
+    state before them is kept as a checkpoint that the next update rewinds
+    to. Returns the number of new observations used per group.
+    """
+    store_path = model_store_path(models_dir)
+    if not store_path.exists():
+        raise FileNotFoundError(
+            f"No compact model store at {store_path}; train the models first"
+        )
+    group_ids = list(cons.columns)
+    if max_groups is not None:
+        group_ids = group_ids[:max_groups]
+    models = load_model_store(store_path, group_ids)
+    stamps = cons.index.asi8
+    partial = (
+        np.zeros(len(stamps), dtype=bool) if complete_through is None
+        else stamps > pd.Timestamp(complete_through).value
+    )
+    n_new: Dict[object, int] = {}
+    updated = {}
+    for idx, (gid, model) in enumerate(models.items(), start=1):
+        if model.last_timestamp is None:
+            if verbose:
+                print(f"[{idx}/{len(models)}] Group {gid} has no last timestamp, skipping")
+            continue
+        rewound = model.rewind()
+        new_rows = stamps > rewound.last_timestamp
+        n_new[gid] = int(new_rows.sum())
+        if not n_new[gid]:
+            continue
+        model = rewound
+        for rows, open_period in ((new_rows & ~partial, False), (new_rows & partial, True)):
+            if not rows.any():
+                continue
+            if open_period:
+                model = model.checkpoint()
+            model = model.extend(
+                cons.loc[rows, gid].to_numpy(),
+                None if exog is None else exog.loc[rows],
+                last_timestamp=int(stamps[rows][-1]),
+            )
+        updated[gid] = model
+    if updated:
+        save_model_store(updated, store_path)
+    if verbose:
+        print(f"Updated {len(updated)} of {len(models)} models in {store_path.name} "
+              f"({max(n_new.values(), default=0)} new observations at most)")
+    return n_new
+
+
+def update_sarimax_48h(
+    max_groups: Optional[int] = None,
+    models_dir: Path | None = None,
+    verbose: bool = True,
+    data: PipelineData | None = None,
+    variant: str = "sarimax",
+    hierarchical: bool = False,
+) -> Dict[object, int]:
+    if models_dir is None:
+        models_dir = default_models_dir_48h(variant, hierarchical)
+    if data is None:
+        data = PipelineData.load()
+    cons_aligned, exog = data.hourly_training
+    if variant == "residual":
+        cons_aligned = build_weekly_residuals_48h(cons_aligned)
+    if hierarchical:
+        nodes = group_nodes(data.group_metadata, list(cons_aligned.columns)[:max_groups])
+        cons_aligned, max_groups = aggregate_to_nodes(cons_aligned, nodes), None
+    return update_model_store(models_dir, cons_aligned, exog, max_groups, verbose)
+
+
+def update_sarimax_12m(
+    max_groups: Optional[int] = None,
+    models_dir: Path | None = None,
+    verbose: bool = True,
+    data: PipelineData | None = None,
+    hierarchical: bool = False,
+) -> Dict[object, int]:
+    if models_dir is None:
+        models_dir = default_models_dir_12m(hierarchical)
+    if data is None:
+        data = PipelineData.load()
+    cons_monthly, exog_monthly = data.monthly_training
+    if hierarchical:
+        nodes = group_nodes(data.group_metadata, list(cons_monthly.columns)[:max_groups])
+        cons_monthly, max_groups = aggregate_to_nodes(cons_monthly, nodes), None
+    return update_model_store(
+        models_dir, cons_monthly, exog_monthly, max_groups, verbose,
+        complete_through=data.complete_through_12m,
+    )